@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Measure the cost of validating durations and constructing tasks.
+
+Usage: python benchmarks/construction.py [--number N]
+"""
+from __future__ import absolute_import, division, print_function
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+import sys
+from timeit import Timer
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+SETUP = """
+from failover import Hysteresis, TCPCheck, count, minute, second
+from failover.validation import validate_after, validate_duration
+timeout = second(10)
+fail_after = minute(2)
+ok_after = count(5)
+tcp = TCPCheck("192.0.2.1", 25, timeout)
+hysteresis = Hysteresis(lambda: False, fail_after=fail_after,
+                        ok_after=ok_after)
+"""
+
+SCENARIOS = [
+    ("second(10)", "second(10)"),
+    ("validate_duration(second)", "validate_duration(timeout)"),
+    ("validate_after(minute)", "validate_after(fail_after)"),
+    ("validate_after(count)", "validate_after(ok_after)"),
+    ("TCPCheck()", "TCPCheck('192.0.2.1', 25, timeout)"),
+    ("Hysteresis(TCPCheck())",
+     "Hysteresis(TCPCheck('192.0.2.1', 25, timeout), "
+     "fail_after=fail_after, ok_after=ok_after)"),
+    ("Hysteresis.__call__", "hysteresis()"),
+]
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--number", type=int, default=20000,
+                        help="Iterations per measurement")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Measurements per scenario; the best is reported")
+    args = parser.parse_args(args)
+
+    # Keep the Hysteresis logging from dominating the measurement.
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    print("%-28s %12s" % ("Scenario", "usec/op"))
+    for label, statement in SCENARIOS:
+        timer = Timer(statement, SETUP)
+        best = min(timer.repeat(args.repeat, args.number))
+        print("%-28s %12.2f" % (label, best / args.number * 1e6))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
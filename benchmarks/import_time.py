@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Measure the startup cost of importing the failover package.
+
+Each scenario is run in a fresh interpreter.  Where the interpreter supports
+it (Python 3.7+), the cumulative import time of the failover package and its
+submodules is taken from "python -X importtime"; otherwise the wall-clock
+time of the whole process, less that of an empty interpreter, is reported.
+
+Usage: python benchmarks/import_time.py [--python PATH] [--runs N]
+"""
+from __future__ import absolute_import, division, print_function
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+import re
+import subprocess
+import sys
+from time import time
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+SCENARIOS = [
+    ("import failover", "import failover"),
+    ("TCPCheck", "import failover; failover.TCPCheck"),
+    ("Hysteresis(TCPCheck)",
+     "import failover; failover.Hysteresis; failover.TCPCheck"),
+    ("HealthCheckServer", "import failover; failover.HealthCheckServer"),
+    ("ApachePasswdFileCheck",
+     "import failover; failover.ApachePasswdFileCheck('/dev/null')"),
+    ("from failover import *", "from failover import *"),
+]
+
+IMPORTTIME_REGEX = re.compile(
+    r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+def supports_importtime(python):
+    """
+    Return True if the given interpreter supports -X importtime.
+    """
+    result = subprocess.call(
+        [python, "-c",
+         "import sys; sys.exit(sys.version_info < (3, 7))"])
+    return result == 0
+
+def importtime(python, code):
+    """
+    Return the cumulative import time, in seconds, of the failover package
+    (and any of its submodules imported at top level) for the given code.
+    """
+    process = subprocess.Popen(
+        [python, "-X", "importtime", "-c", code], cwd=ROOT,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr)
+
+    total = 0
+    for line in stderr.splitlines():
+        match = IMPORTTIME_REGEX.match(line)
+        if match is None:
+            continue
+
+        # Count outermost failover imports only; their cumulative time
+        # already includes everything they import.
+        indent = len(match.group(3))
+        name = match.group(4)
+        if name.split(".")[0] == "failover" and indent == 1:
+            total += int(match.group(2))
+
+    return total / 1e6
+
+def walltime(python, code):
+    """
+    Return the wall-clock time, in seconds, to run code in a new interpreter.
+    """
+    start = time()
+    subprocess.check_call([python, "-c", code], cwd=ROOT)
+    return time() - start
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter to measure (default: this one)")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="Runs per scenario; the best is reported")
+    args = parser.parse_args(args)
+
+    if supports_importtime(args.python):
+        method = "import time (-X importtime)"
+        measure = importtime
+        baseline = 0.0
+    else:
+        method = "process wall time less empty interpreter"
+        measure = walltime
+        baseline = min(walltime(args.python, "pass")
+                       for i in range(args.runs))
+
+    print("Interpreter: %s" % args.python)
+    print("Method:      %s (best of %d)" % (method, args.runs))
+    print()
+    print("%-28s %10s" % ("Scenario", "ms"))
+    for label, code in SCENARIOS:
+        best = min(measure(args.python, code) for i in range(args.runs))
+        print("%-28s %10.1f" % (label, max(best - baseline, 0.0) * 1000))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
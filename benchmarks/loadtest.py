@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Load-test a HealthCheckServer with synthetic components.
+
+Starts a HealthCheckServer with N components backed by stub backends that
+inject latency and failures, drives it with concurrent clients (keep-alive or
+a new connection per request) and reports latency percentiles, throughput,
+and the server's thread count and memory use.
+
+Usage: python benchmarks/loadtest.py [--components N] [--backend KIND]
+           [--latency MS] [--failure-rate P] [--wrap KIND] [--threaded]
+           [--processes N] [--clients N] [--duration SECONDS] [--keep-alive]
+"""
+from __future__ import absolute_import, division, print_function
+from argparse import ArgumentParser
+import logging
+from math import ceil
+from multiprocessing import Process, Queue
+from os.path import abspath, dirname
+import resource
+import sys
+from threading import active_count, Event, Thread
+from time import time
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from stubs import LOOPBACK, StubHTTPBackend, SyntheticTask
+
+def build_task(args, backend):
+    """
+    Return a component task according to the command line arguments.
+    """
+    from failover import Background, Hysteresis, HTTPCheck, second
+
+    if backend is None:
+        task = SyntheticTask(args.latency / 1000, args.failure_rate)
+    else:
+        task = HTTPCheck(LOOPBACK, backend.port, timeout=second(5),
+                         read_timeout=second(5))
+
+    if args.wrap == "hysteresis":
+        task = Hysteresis(task)
+    elif args.wrap == "background":
+        task = Background(task, delay=second(1))
+    return task
+
+def release_all(task):
+    """
+    Stop or close task and every task it wraps.
+    """
+    from failover.config import release
+    from failover.snapshot import SUBTASK_ATTRIBUTES
+
+    release(task)
+    for attr in SUBTASK_ATTRIBUTES:
+        subtask = getattr(task, attr, None)
+        if subtask is not None:
+            release_all(subtask)
+    return
+
+def client_thread(port, names, offset, deadline, keep_alive, results):
+    """
+    Request components round-robin until deadline, appending each request's
+    latency (or None for an error) to results["latencies"].
+    """
+    from six.moves.http_client import HTTPConnection
+
+    headers = {"Connection": "keep-alive" if keep_alive else "close"}
+    latencies = results["latencies"]
+    statuses = results["statuses"]
+    connection = None
+    i = offset
+    while time() < deadline:
+        path = "/" + names[i % len(names)]
+        i += 1
+        start = time()
+        try:
+            if connection is None:
+                connection = HTTPConnection(LOOPBACK, port, timeout=30)
+                results["connections"] += 1
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except Exception:
+            latencies.append(None)
+            if connection is not None:
+                connection.close()
+            connection = None
+            continue
+
+        latencies.append(time() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if not keep_alive or response.will_close:
+            connection.close()
+            connection = None
+
+    if connection is not None:
+        connection.close()
+    return
+
+def client_process(port, names, n_threads, offset, deadline, keep_alive,
+                   queue):
+    """
+    Run n_threads client threads and put their combined results on queue.
+    """
+    # Each thread has its own results, merged once they have finished.
+    thread_results = [{"latencies": [], "statuses": {}, "connections": 0}
+                      for i in range(n_threads)]
+    threads = [Thread(target=client_thread,
+                      args=(port, names, offset + i, deadline, keep_alive,
+                            thread_results[i]))
+               for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {"latencies": [], "statuses": {}, "connections": 0}
+    for result in thread_results:
+        results["latencies"].extend(result["latencies"])
+        results["connections"] += result["connections"]
+        for status, n in result["statuses"].items():
+            results["statuses"][status] = (
+                results["statuses"].get(status, 0) + n)
+    queue.put(results)
+    return
+
+def percentile(values, fraction):
+    """
+    Return the value at the given fraction (0-1) of sorted values.
+    """
+    index = int(ceil(fraction * len(values))) - 1
+    index = min(len(values) - 1, max(0, index))
+    return values[index]
+
+def rss_kb():
+    """
+    Return the current resident set size of this process in KiB, or None if
+    it cannot be determined.
+    """
+    try:
+        with open("/proc/self/status") as fd:
+            for line in fd:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--components", type=int, default=100,
+                        help="Number of components")
+    parser.add_argument("--backend", choices=("synthetic", "http"),
+                        default="synthetic",
+                        help="synthetic: an in-process task; http: an "
+                        "HTTPCheck against a stub HTTP server")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Backend latency in milliseconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Fraction of backend checks that fail")
+    parser.add_argument("--wrap", choices=("none", "hysteresis", "background"),
+                        default="none", help="Wrapper around each check")
+    parser.add_argument("--threaded", action="store_true",
+                        help="Handle each request in its own thread")
+    parser.add_argument("--processes", type=int, default=2,
+                        help="Client processes")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="Concurrent clients in total")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="Seconds to run")
+    parser.add_argument("--keep-alive", action="store_true",
+                        help="Reuse connections when the server allows it")
+    args = parser.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    from failover import HealthCheckServer
+    from failover.handler import FailoverRequestHandler
+
+    # Don't measure the cost of writing access logs to the terminal.
+    FailoverRequestHandler.log_message = lambda *args: None
+
+    backend = None
+    if args.backend == "http":
+        backend = StubHTTPBackend(args.latency / 1000, args.failure_rate)
+
+    server = HealthCheckServer(0, LOOPBACK, threaded=args.threaded)
+    port = server.server_address[1]
+    names = ["c%d" % i for i in range(args.components)]
+    for name in names:
+        server.add_component(name, build_task(args, backend))
+
+    server_thread = Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    # Sample the server process's thread count while the clients run.
+    threads = [active_count()]
+    sampling = Event()
+    def sample():
+        while not sampling.wait(0.05):
+            threads.append(active_count())
+    sampler = Thread(target=sample)
+    sampler.daemon = True
+    sampler.start()
+
+    rss_before = rss_kb()
+    queue = Queue()
+    deadline = time() + args.duration
+    processes = []
+    per_process = max(1, args.clients // args.processes)
+    for i in range(args.processes):
+        process = Process(target=client_process, args=(
+            port, names, per_process, i * per_process, deadline,
+            args.keep_alive, queue))
+        process.start()
+        processes.append(process)
+
+    start = time()
+    results = [queue.get() for process in processes]
+    elapsed = time() - start
+    for process in processes:
+        process.join()
+
+    sampling.set()
+    sampler.join()
+    rss_after = rss_kb()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    server.shutdown()
+    server_thread.join()
+    server.server_close()
+    for task in server.get_handlers.values():
+        release_all(task)
+    if backend is not None:
+        backend.stop()
+
+    latencies = sorted(latency for result in results
+                       for latency in result["latencies"]
+                       if latency is not None)
+    errors = sum(1 for result in results for latency in result["latencies"]
+                 if latency is None)
+    statuses = {}
+    for result in results:
+        for status, n in result["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + n
+    connections = sum(result["connections"] for result in results)
+
+    print("Components: %d (%s backend, %gms latency, %g failure rate, "
+          "wrap %s)" % (args.components, args.backend, args.latency,
+                        args.failure_rate, args.wrap))
+    print("Server: %s; clients: %d in %d processes, %s" %
+          ("threaded" if args.threaded else "single-threaded",
+           per_process * args.processes, args.processes,
+           "keep-alive" if args.keep_alive else "close per request"))
+    print()
+    print("Requests:      %d (%d errors; statuses %s)" %
+          (len(latencies), errors,
+           ", ".join("%d: %d" % item for item in sorted(statuses.items()))))
+    print("Connections:   %d" % (connections,))
+    print("Requests/s:    %.1f" % (len(latencies) / elapsed,))
+    if latencies:
+        for label, fraction in (("p50", 0.5), ("p99", 0.99),
+                                ("p999", 0.999)):
+            print("Latency %-5s  %.2f ms" %
+                  (label + ":", percentile(latencies, fraction) * 1000))
+        print("Latency max:   %.2f ms" % (latencies[-1] * 1000,))
+    print("Threads:       %d max (%d at start)" % (max(threads), threads[0]))
+    if rss_before is not None:
+        print("RSS:           %d KiB -> %d KiB (peak %d KiB)" %
+              (rss_before, rss_after, max_rss))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Measure the memory used per component by standard and compact tasks.
+
+Each scenario runs in a fresh interpreter, which adds N components (each
+checking a different TCP backend) to a HealthCheckServer and reports the
+memory allocated for them, excluding their names and host names.  Memory is
+measured with tracemalloc where available, and from the resident set size
+otherwise.
+
+Usage: python benchmarks/memory.py [--components N]
+"""
+from __future__ import absolute_import, division, print_function
+from argparse import ArgumentParser, SUPPRESS
+import gc
+from os.path import abspath, dirname
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def standard_tcp(names, hosts):
+    from failover import Hysteresis, TCPCheck, count, second
+    timeout = second(1)
+    return [Hysteresis(TCPCheck(host, 80, timeout), fail_after=count(3))
+            for host in hosts]
+
+def compact_tcp(names, hosts):
+    from failover import count, second
+    from failover.compact import CompactHysteresis, CompactTCPCheck
+    timeout = second(1)
+    return [CompactHysteresis(CompactTCPCheck(host, 80, timeout),
+                              fail_after=count(3))
+            for host in hosts]
+
+def standard_toggle(names, hosts):
+    from failover import Hysteresis, Oneshot, TCPCheck, Toggle, count, second
+    timeout = second(1)
+    return [Toggle(to_fail=Hysteresis(TCPCheck(host, 80, timeout),
+                                      fail_after=count(3)),
+                   to_ok=Oneshot())
+            for host in hosts]
+
+def compact_toggle(names, hosts):
+    from failover import count, second
+    from failover.compact import (
+        CompactHysteresis, CompactOneshot, CompactTCPCheck, CompactToggle)
+    timeout = second(1)
+    return [CompactToggle(to_fail=CompactHysteresis(
+                CompactTCPCheck(host, 80, timeout), fail_after=count(3)),
+                          to_ok=CompactOneshot())
+            for host in hosts]
+
+def table(names, hosts):
+    from failover import count, second
+    from failover.compact import TCPCheckTable
+    checks = TCPCheckTable(second(1), fail_after=count(3))
+    return [checks.add(name, host, 80) for name, host in zip(names, hosts)]
+
+SCENARIOS = [
+    ("Hysteresis(TCPCheck)", standard_tcp),
+    ("CompactHysteresis(...)", compact_tcp),
+    ("Toggle(Hysteresis, Oneshot)", standard_toggle),
+    ("CompactToggle(...)", compact_toggle),
+    ("TCPCheckTable row", table),
+]
+
+def rss_bytes():
+    """
+    Return the current resident set size of this process in bytes, or None
+    if it cannot be determined.
+    """
+    try:
+        with open("/proc/self/status") as fd:
+            for line in fd:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+def measure(scenario, components):
+    """
+    Add components built by the named scenario to a server, printing the
+    bytes allocated per component.
+    """
+    from failover import HealthCheckServer
+    # Import the modules up front, so their code isn't counted.
+    import failover.compact
+    import failover.hysteresis
+    import failover.oneshot
+    import failover.tcp
+    import failover.toggle
+
+    build = dict(SCENARIOS)[scenario]
+    server = HealthCheckServer(0, host="127.0.0.1")
+    names = ["backend-%06d" % (i,) for i in range(components)]
+    hosts = ["10.%d.%d.%d" % (i >> 16, (i >> 8) & 255, i & 255)
+             for i in range(components)]
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    else:
+        before = rss_bytes()
+
+    for name, task in zip(names, build(names, hosts)):
+        server.add_component(name, task)
+
+    gc.collect()
+    if tracemalloc is not None:
+        used = tracemalloc.get_traced_memory()[0]
+    else:
+        used = rss_bytes() - before
+    server.server_close()
+    print(used / components)
+    return 0
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--components", type=int, default=50000,
+                        help="Number of components to create")
+    parser.add_argument("--scenario", help=SUPPRESS)
+    args = parser.parse_args(args)
+
+    if args.scenario is not None:
+        return measure(args.scenario, args.components)
+
+    print("%-30s %16s" % ("Scenario", "bytes/component"))
+    for label, build in SCENARIOS:
+        output = subprocess.check_output(
+            [sys.executable, abspath(__file__), "--scenario", label,
+             "--components", str(args.components)], cwd=ROOT)
+        print("%-30s %16.0f" % (label, float(output.split()[-1])))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Measure HealthCheckServer throughput as prefork workers are added.
+
+Each component does a configurable amount of CPU work per request (standing
+in for e.g. password hashing), so throughput should scale with the number of
+workers up to the number of cores available.
+
+Usage: python benchmarks/prefork_throughput.py [--workers 1,2,4]
+           [--clients N] [--duration SECONDS] [--work N] [--path /cpu]
+"""
+from __future__ import absolute_import, division, print_function
+from argparse import ArgumentParser
+from hashlib import sha256
+import logging
+from multiprocessing import Pool, cpu_count
+from os.path import abspath, dirname
+import sys
+from threading import Thread
+from time import sleep, time
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+LOOPBACK = "127.0.0.1"
+
+def cpu_task(work):
+    """
+    Return a task that hashes a buffer work times before succeeding.
+    """
+    def task():
+        digest = b"failover"
+        for i in range(work):
+            digest = sha256(digest).digest()
+        return True
+    return task
+
+def client(args):
+    """
+    Issue requests for path against port until duration has elapsed,
+    returning the number of successful requests.
+    """
+    from six.moves.http_client import HTTPConnection
+    port, path, duration = args
+    end = time() + duration
+    n = 0
+    while time() < end:
+        con = HTTPConnection(LOOPBACK, port)
+        con.request("GET", path)
+        response = con.getresponse()
+        response.read()
+        con.close()
+        if response.status == 200:
+            n += 1
+    return n
+
+def measure(workers, clients, duration, work, path):
+    """
+    Start a prefork server with the given number of workers and return the
+    requests per second achieved by the given number of client processes.
+    """
+    from failover import HealthCheckServer, Hysteresis
+    from failover.prefork import PreforkServer
+
+    server = HealthCheckServer(0, LOOPBACK, reuse_port=True)
+    port = server.server_address[1]
+    server.add_component("cpu", cpu_task(work))
+    server.add_component("shared", Hysteresis(cpu_task(work)))
+
+    prefork = PreforkServer(server, workers=workers)
+    thread = Thread(target=prefork.serve_forever)
+    thread.start()
+    try:
+        # Let the workers start.
+        for i in range(50):
+            try:
+                client((port, path, 0.01))
+                break
+            except Exception:
+                sleep(0.1)
+
+        pool = Pool(clients)
+        try:
+            counts = pool.map(client, [(port, path, duration)] * clients)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        prefork.shutdown()
+        thread.join()
+
+    return sum(counts) / duration
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--workers", default="1,2,4",
+                        help="Comma-separated worker counts to measure")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="Concurrent client processes")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="Seconds to measure each worker count")
+    parser.add_argument("--work", type=int, default=2000,
+                        help="SHA-256 rounds per request")
+    parser.add_argument("--path", default="/cpu",
+                        help="/cpu (runs in workers) or /shared (runs in the "
+                        "state owner)")
+    args = parser.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    # Don't measure the cost of writing access logs to the terminal.
+    from failover.handler import FailoverRequestHandler
+    FailoverRequestHandler.log_message = lambda *args: None
+
+    print("CPUs: %d; clients: %d; %d SHA-256 rounds per request; path %s" %
+          (cpu_count(), args.clients, args.work, args.path))
+    print()
+    print("%8s %12s %10s" % ("Workers", "Requests/s", "Speedup"))
+    base = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        rps = measure(workers, args.clients, args.duration, args.work,
+                      args.path)
+        if base is None:
+            base = rps
+        print("%8d %12.1f %9.2fx" % (workers, rps, rps / base))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Measure the cost of probing many components with failover-probe.
+
+A HealthCheckServer with N trivial components is started in this process.
+The components are then probed by launching failover-probe once per
+component (as a shell script calling curl in a loop would) and by launching
+it once for all of them, over a single keep-alive connection.
+
+Usage: python benchmarks/probe_batch.py [--components N] [--repeat N]
+"""
+from __future__ import absolute_import, division, print_function
+from argparse import ArgumentParser
+import logging
+from os.path import abspath, dirname
+import subprocess
+import sys
+from threading import Thread
+from time import time
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LOOPBACK = "127.0.0.1"
+
+def run_probe(url, components):
+    """
+    Launch failover-probe for the given components, returning its exit
+    status.
+    """
+    return subprocess.call(
+        [sys.executable, "-m", "failover.probe", "--url", url, "--format",
+         "quiet"] + list(components), cwd=ROOT)
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--components", type=int, default=100,
+                        help="Number of components to probe")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Measurements per scenario; the best is reported")
+    args = parser.parse_args(args)
+
+    from failover import HealthCheckServer, ok
+    from failover.handler import FailoverRequestHandler
+    logging.disable(logging.CRITICAL)
+    FailoverRequestHandler.log_message = lambda *args: None
+
+    server = HealthCheckServer(0, host=LOOPBACK, threaded=True,
+                               keep_alive=True)
+    names = ["component-%d" % (i,) for i in range(args.components)]
+    for name in names:
+        server.add_component(name, lambda: ok)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = "http://%s:%d/" % (LOOPBACK, server.server_address[1])
+
+    def one_per_component():
+        for name in names:
+            assert run_probe(url, [name]) == 0
+
+    def batch():
+        assert run_probe(url, names) == 0
+
+    print("%-28s %12s %12s" % ("Scenario", "seconds", "ms/component"))
+    try:
+        for label, scenario in [
+                ("one process per component", one_per_component),
+                ("one batch process", batch)]:
+            best = None
+            for i in range(args.repeat):
+                start = time()
+                scenario()
+                elapsed = time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print("%-28s %12.3f %12.3f" % (label, best,
+                                          best / args.components * 1e3))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Stub backends for benchmarks, with configurable latency and failure rates.
+
+These are imported by the benchmark scripts; they are not run directly.
+"""
+from __future__ import absolute_import, division, print_function
+from random import random
+import socket
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+import sys
+from threading import Thread
+from time import sleep
+
+LOOPBACK = "127.0.0.1"
+
+class SyntheticTask(object):
+    """
+    SyntheticTask(latency=0.0, failure_rate=0.0)
+
+    A health check task that sleeps for latency seconds and then fails with
+    probability failure_rate, without touching the network.
+    """
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        super(SyntheticTask, self).__init__()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        return
+
+    def __call__(self):
+        if self.latency > 0:
+            sleep(self.latency)
+        return random() >= self.failure_rate
+
+class StubHTTPBackend(ThreadingMixIn, HTTPServer):
+    """
+    StubHTTPBackend(latency=0.0, failure_rate=0.0)
+
+    An HTTP server on the loopback interface, listening on an ephemeral port
+    (see port), that answers every request after latency seconds: with 500
+    Internal Server Error with probability failure_rate, otherwise 200 OK.
+    Connections are kept alive.  The server runs in a daemon thread until
+    stop() is called.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        HTTPServer.__init__(self, (LOOPBACK, 0), StubHTTPHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.port = self.server_address[1]
+        self.thread = Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return
+
+    def handle_error(self, request, client_address):
+        # Health checks hang up on us whenever they like.
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+        return
+
+    def stop(self):
+        self.shutdown()
+        self.thread.join()
+        self.server_close()
+        return
+
+class StubHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.server.latency > 0:
+            sleep(self.server.latency)
+
+        if random() < self.server.failure_rate:
+            code, body = 500, b"FAIL"
+        else:
+            code, body = 200, b"OK"
+
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
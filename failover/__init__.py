@@ -1,28 +1,87 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
-from .auth import ApachePasswdFileCheck
-from .background import Background
-from .hysteresis import Hysteresis
-from .oneshot import Oneshot
-from .server import HealthCheckServer
-from .tcp import TCPCheck
-from .toggle import Toggle
-from .units import second, minute, hour, day, count, ok, fail
+from importlib import import_module
+import sys
+from types import ModuleType
+
+# Submodules are imported on first use rather than when the package is
+# imported; this keeps short-lived processes (sidecars, probes) from paying
+# for HTTP, TLS, ctypes, etc. that they never touch.  This maps each public
+# name to the submodule defining it.
+exports = {
+    "ApachePasswdFileCheck": "auth",
+    "Background": "background",
+    "Budget": "budget",
+    "HTTPCheck": "http",
+    "Hysteresis": "hysteresis",
+    "HealthCheckServer": "server",
+    "Oneshot": "oneshot",
+    "PassiveCheck": "passive",
+    "RemoteHealthCheck": "remote",
+    "SMTPCheck": "smtp",
+    "StateSnapshot": "snapshot",
+    "Toggle": "toggle",
+    "second": "units",
+    "minute": "units",
+    "hour": "units",
+    "day": "units",
+    "count": "units",
+    "ok": "units",
+    "fail": "units",
+    "TCPCheck": "tcp",
+    "TLSCheck": "tls",
+}
 
 __all__ = [
     "ApachePasswdFileCheck",
     "Background",
+    "Budget",
+    "HTTPCheck",
     "Hysteresis",
     "HealthCheckServer",
     "Oneshot",
+    "PassiveCheck",
+    "RemoteHealthCheck",
+    "SMTPCheck",
+    "StateSnapshot",
     "Toggle",
     "second",
     "minute",
-    "hour", 
+    "hour",
     "day",
     "count",
     "ok",
     "fail",
-    "TCPCheck"
+    "TCPCheck",
+    "TLSCheck"
 ]
 
+class LazyModule(ModuleType):
+    """
+    The type of the failover package module, which imports the submodule
+    defining a public name the first time that name is accessed.
+    """
+    def __getattr__(self, name):
+        try:
+            submodule = exports[name]
+        except KeyError:
+            raise AttributeError("module %r has no attribute %r" %
+                                 (self.__name__, name))
+
+        value = getattr(import_module("." + submodule, self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(exports))
+
+# Module objects can't have their class changed on Python 2, so replace this
+# module with an equivalent LazyModule instance.  The original module must be
+# kept alive: Python 2 clears a module's globals when it is deallocated, and
+# LazyModule's methods still refer to them.
+lazy_module = LazyModule(__name__, __doc__)
+lazy_module.__dict__.update(
+    (key, value) for key, value in globals().items()
+    if key not in ("__name__", "__doc__"))
+lazy_module.original_module = sys.modules[__name__]
+sys.modules[__name__] = lazy_module
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, division, print_function
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+from time import time
+
+log = getLogger("failover.admission")
+
+class TokenBucket(object):
+    """
+    TokenBucket(rate, burst)
+
+    A token bucket holding up to burst tokens, refilled at rate tokens per
+    second.  It starts full.
+    """
+    def __init__(self, rate, burst):
+        super(TokenBucket, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time()
+        return
+
+    def take(self, now):
+        """
+        bucket.take(now) -> float
+
+        Take a token at time now, returning 0 if one was available, or else
+        the number of seconds until one will be.  The caller must serialize
+        calls.
+        """
+        if now > self.updated:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        """
+        bucket.refund()
+
+        Give back a token taken by take() for a request that was rejected
+        anyway.  The caller must serialize calls.
+        """
+        self.tokens = min(self.burst, self.tokens + 1)
+        return
+
+class AdmissionControl(object):
+    """
+    AdmissionControl(server, rate=None, burst=None, client_rate=None,
+                     client_burst=None, max_concurrent=None,
+                     max_in_flight=None, max_clients=10000)
+
+    Protect server (a HealthCheckServer) from floods of requests, rejecting
+    excess requests with 503 Service Unavailable and a Retry-After header
+    without running any task.
+
+    rate and client_rate limit the requests per second accepted overall and
+    from each client address; each allows bursts of up to burst (or
+    client_burst) requests, defaulting to the rate (at least 1).  The most
+    recently seen max_clients addresses are tracked.
+
+    max_concurrent limits how many requests may run each component at the
+    same time (see also set_limit()), and max_in_flight how many requests may
+    be handled at once in total.  These are only useful with a threaded
+    server.
+
+    Limits that are None are not enforced.
+    """
+    def __init__(self, server, rate=None, burst=None, client_rate=None,
+                 client_burst=None, max_concurrent=None, max_in_flight=None,
+                 max_clients=10000):
+        super(AdmissionControl, self).__init__()
+        self.rate = validate_rate(rate, "rate")
+        self.client_rate = validate_rate(client_rate, "client_rate")
+        self.burst = validate_burst(burst, self.rate, "burst")
+        self.client_burst = validate_burst(client_burst, self.client_rate,
+                                           "client_burst")
+        self.max_concurrent = validate_limit(max_concurrent, "max_concurrent")
+        self.max_in_flight = validate_limit(max_in_flight, "max_in_flight")
+        self.max_clients = validate_limit(max_clients, "max_clients")
+
+        self.lock = Lock()
+        self.bucket = (None if self.rate is None else
+                       TokenBucket(self.rate, self.burst))
+        self.client_buckets = OrderedDict()
+        self.limits = {}
+        self.running = {}
+        self.in_flight = 0
+        self.rejected = 0
+
+        self.server = server
+        server.admission = self
+        return
+
+    def set_limit(self, name, limit):
+        """
+        admission.set_limit(name, limit)
+
+        Set the maximum number of concurrent executions of the component
+        name, overriding max_concurrent.  A limit of None removes the
+        override.
+        """
+        limit = validate_limit(limit, "limit")
+        with self.lock:
+            if limit is None:
+                self.limits.pop(name, None)
+            else:
+                self.limits[name] = limit
+        return
+
+    def admit(self, client):
+        """
+        admission.admit(client) -> float or None
+
+        Decide whether to accept a request from the client address.  If it is
+        accepted, None is returned and release() must be called once it has
+        been handled.  Otherwise, the number of seconds the client should
+        wait before retrying is returned.
+        """
+        now = time()
+        with self.lock:
+            if (self.max_in_flight is not None and
+                self.in_flight >= self.max_in_flight):
+                return self.reject(1.0)
+
+            # The client's own allowance is checked first, so a client over
+            # it doesn't drain the overall allowance of the others.
+            client_bucket = None
+            if self.client_rate is not None:
+                client_bucket = self.client_buckets.pop(client, None)
+                if client_bucket is None:
+                    client_bucket = TokenBucket(self.client_rate,
+                                                self.client_burst)
+                    if len(self.client_buckets) >= self.max_clients:
+                        self.client_buckets.popitem(last=False)
+                self.client_buckets[client] = client_bucket
+                wait = client_bucket.take(now)
+                if wait:
+                    return self.reject(wait)
+
+            if self.bucket is not None:
+                wait = self.bucket.take(now)
+                if wait:
+                    if client_bucket is not None:
+                        client_bucket.refund()
+                    return self.reject(wait)
+
+            self.in_flight += 1
+        return None
+
+    def release(self):
+        """
+        admission.release()
+
+        Record that a request accepted by admit() has been handled.
+        """
+        with self.lock:
+            self.in_flight -= 1
+        return
+
+    def acquire(self, name):
+        """
+        admission.acquire(name) -> bool
+
+        Start an execution of the component name, returning False if it is
+        already running as many times as allowed.  If True is returned,
+        finish() must be called when the execution completes.
+        """
+        with self.lock:
+            limit = self.limits.get(name, self.max_concurrent)
+            running = self.running.get(name, 0)
+            if limit is not None and running >= limit:
+                self.reject(1.0)
+                return False
+            self.running[name] = running + 1
+        return True
+
+    def finish(self, name):
+        """
+        admission.finish(name)
+
+        Record that an execution started by acquire() has completed.
+        """
+        with self.lock:
+            running = self.running[name] - 1
+            if running:
+                self.running[name] = running
+            else:
+                del self.running[name]
+        return
+
+    def reject(self, wait):
+        """
+        admission.reject(wait) -> float
+
+        Count a rejected request.  The lock must be held.
+        """
+        self.rejected += 1
+        return wait
+
+def validate_rate(rate, parameter_name):
+    """
+    validate_rate(rate, parameter_name) -> float or None
+
+    Verify that rate is None or a positive number of requests per second.
+    """
+    if rate is None:
+        return None
+
+    if (isinstance(rate, bool) or not isinstance(rate, (int, float)) or
+        rate <= 0):
+        raise ValueError("%s must be a positive number or None" %
+                         (parameter_name,))
+    return float(rate)
+
+def validate_burst(burst, rate, parameter_name):
+    """
+    validate_burst(burst, rate, parameter_name) -> float or None
+
+    Verify that burst is None or a number no less than 1.  If it is None, the
+    rate (but at least 1) is returned.
+    """
+    if rate is None:
+        return None
+
+    if burst is None:
+        return max(1.0, rate)
+
+    if (isinstance(burst, bool) or not isinstance(burst, (int, float)) or
+        burst < 1):
+        raise ValueError("%s must be a number no less than 1 or None" %
+                         (parameter_name,))
+    return float(burst)
+
+def validate_limit(limit, parameter_name):
+    """
+    validate_limit(limit, parameter_name) -> int or None
+
+    Verify that limit is None or a positive integer.
+    """
+    if limit is None:
+        return None
+
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit <= 0:
+        raise ValueError("%s must be a positive integer or None" %
+                         (parameter_name,))
+    return limit
@@ -1,29 +1,55 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
 from base64 import b64decode, b64encode
-import ctypes as c
 from .handler import current_handler
 from logging import getLogger
 
 log = getLogger("failover.auth.apache")
 
+# libaprutil-1, loaded when a password is first checked; see load_libaprutil.
+libaprutil = None
+
+def load_libaprutil():
+    """
+    load_libaprutil() -> ctypes.CDLL
+
+    Load libaprutil-1 (once per process), raising RuntimeError if it is not
+    available on this system.
+    """
+    global libaprutil
+    if libaprutil is not None:
+        return libaprutil
+
+    import ctypes as c
+
+    for ext in (".dylib", ".sl", ".so"):
+        try:
+            log.info("Trying libaprutil-1" + ext)
+            lib = c.CDLL("libaprutil-1" + ext)
+            break
+        except OSError as e: # pragma: nocover
+            log.error("Failed to load libaprutil-1" + ext, exc_info=1)
+    else: # pragma: nocover
+        raise RuntimeError("libaprutil-1 not found")
+
+    lib.apr_password_validate.argtypes = (c.c_char_p, c.c_char_p)
+    lib.apr_password_validate.restype = c.c_int
+    libaprutil = lib
+    return lib
+
 class ApachePasswdFileCheck(object):
+    """
+    ApachePasswdFileCheck(filename)
+
+    Create an ApachePasswdFileCheck object that, when called, checks the HTTP
+    basic authentication credentials of the current request against the
+    Apache htpasswd file filename.
+
+    Password hashes are verified with libaprutil-1, which is loaded the first
+    time a password is checked rather than when this object is created.
+    """
     def __init__(self, filename):
         super(ApachePasswdFileCheck, self).__init__()
-        # Make sure libaprutil-1 exists on this system.
-        for ext in (".dylib", ".sl", ".so"):
-            try:
-                log.info("Trying libaprutil-1" + ext)
-                self.libaprutil = c.CDLL("libaprutil-1" + ext)
-                break
-            except OSError as e: # pragma: nocover
-                log.error("Failed to load libaprutil-1" + ext, exc_info=1)
-        else: # pragma: nocover
-            raise RuntimeError("libaprutil-1 not found")
-
-        self.libaprutil.apr_password_validate.argtypes = (
-            c.c_char_p, c.c_char_p)
-        self.libaprutil.apr_password_validate.restype = c.c_int
         self.filename = filename
         return
 
@@ -74,7 +100,7 @@ class ApachePasswdFileCheck(object):
                 if username != client_username:
                     continue
 
-                if (self.libaprutil.apr_password_validate(
+                if (load_libaprutil().apr_password_validate(
                         client_password, pwhash) == 0):
                     log.info("Authorization succeeded for %s", username)
                     return True
@@ -1,15 +1,21 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
 from logging import getLogger
+from .errorlog import ErrorLog
+from .events import Observable
 from .units import ok
 from .validation import validate_duration
 from threading import Condition, Thread
 
 log = getLogger("failover.background")
 
-class Background(Thread):
+# Failures of background tasks; see failover.errorlog.
+error_log = ErrorLog(log)
+
+class Background(Observable, Thread):
     """
-    Background(task, delay, start=ok)
+    Background(task, delay, initial_state=ok, start_thread=True,
+               max_delay=None, backoff=2.0)
 
     Create a Background object that invokes an underlying health check task
     asynchronously and saves the state.
@@ -21,12 +27,34 @@ class Background(Thread):
     the application server every 5 seconds; using a Background object to proxy
     these requests will prevent the server from filling up with health check
     tasks.
+
+    Observers (see failover.events.Observable) are notified when the cached
+    state changes.
+
+    If max_delay is not None, the interval adapts to the stability of the
+    task: each time the task returns the same state as before, the interval
+    is multiplied by backoff, up to max_delay.  When the state changes or the
+    task raises an exception, the interval snaps back to delay.
+
+    Exceptions raised by the task are logged (at most once per minute for
+    identical exceptions; see failover.errorlog) and counted in errors.
     """
-    def __init__(self, task, delay, initial_state=ok, start_thread=True):
+    def __init__(self, task, delay, initial_state=ok, start_thread=True,
+                 max_delay=None, backoff=2.0):
         super(Background, self).__init__()
         self.task = task
         self.state = initial_state
         self.delay = validate_duration(delay, "delay")
+        self.max_delay = (None if max_delay is None else
+                          validate_duration(max_delay, "max_delay"))
+        if self.max_delay is not None and self.max_delay < self.delay:
+            raise ValueError("max_delay must not be less than delay")
+        if (isinstance(backoff, bool) or
+            not isinstance(backoff, (int, float)) or backoff < 1):
+            raise ValueError("backoff must be a number no less than 1")
+        self.backoff = backoff
+        self.current_delay = self.delay
+        self.errors = 0
         self.lock = Condition()
         self.exit_requested = False
 
@@ -38,15 +66,47 @@ class Background(Thread):
         with self.lock:
             while not self.exit_requested:
                 # Allow another thread to request this thread to stop.
-                self.lock.wait(self.delay)
+                self.lock.wait(self.current_delay)
                 if self.exit_requested:
                     break
 
                 try:
+                    old_state = self.state
                     self.state = self.task()
+                    if bool(self.state) != bool(old_state):
+                        self.state_changed(old_state, self.state,
+                                           "Task %r returned %s" %
+                                           (self.task, ("OK" if self.state
+                                                        else "FAIL")))
+                        self.adapt(changed=True)
+                    else:
+                        self.adapt(changed=False)
                 except Exception as e:
-                    log.error("Failed to execute background task: %s", e,
-                              exc_info=True)
+                    self.errors += 1
+                    error_log.error("Failed to execute background task %r: %s",
+                                    self.task, e, exc_info=True)
+                    self.adapt(changed=True)
+        return
+
+    def adapt(self, changed):
+        """
+        background.adapt(changed)
+
+        Adjust the interval before the next invocation of the task according
+        to whether its result changed (or it failed).  This has no effect
+        unless max_delay was given.
+        """
+        if self.max_delay is None:
+            return
+
+        if changed:
+            if self.current_delay != self.delay:
+                log.debug("Task %r changed; checking every %gs", self.task,
+                          self.delay)
+            self.current_delay = self.delay
+        else:
+            self.current_delay = min(self.current_delay * self.backoff,
+                                     self.max_delay)
         return
 
     def __call__(self):
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from logging import getLogger
+from threading import Condition, Thread
+from time import time
+from .errorlog import ErrorLog
+from .units import ok
+from .validation import validate_duration
+
+log = getLogger("failover.budget")
+
+# Failures of underlying tasks; see failover.errorlog.
+error_log = ErrorLog(log)
+
+# The header marking an answer that is not the result of a run of the task
+# completed during the request.
+STALE_HEADER = "X-Failover-Stale"
+
+class Budget(object):
+    """
+    Budget(task, budget, initial_state=ok, name=None)
+
+    Create a Budget object that answers within a response budget, even if
+    the underlying health check task takes longer.
+
+    When called, the task is started in a separate thread (unless a run is
+    already in progress, which is joined instead) and its result is awaited
+    for up to budget.  If the run completes in time, its result is returned.
+    Otherwise, the last known result (initially, initial_state) is returned
+    and the run carries on in the background, refreshing the result for later
+    calls.
+
+    When a health check request is answered with anything but a fresh
+    result, the response carries an X-Failover-Stale header giving the age of
+    the answer in seconds, or "initial" if the task has never completed.
+
+    Exceptions raised by the underlying task are logged (at most once per
+    minute for identical exceptions; see failover.errorlog), counted in
+    errors, and leave the last known result unchanged.
+    """
+    def __init__(self, task, budget, initial_state=ok, name=None):
+        super(Budget, self).__init__()
+        self.task = task
+        self.budget = validate_duration(budget, "budget")
+        self.state = initial_state
+        self.name = name
+        self.lock = Condition()
+
+        # The time of the last successful run, or None if there hasn't been
+        # one.
+        self.updated = None
+
+        # Whether a run is in progress, and the number of runs completed
+        # (successfully or not).
+        self.running = False
+        self.completed = 0
+        self.errors = 0
+        return
+
+    def __call__(self):
+        start = time()
+        deadline = start + self.budget
+
+        with self.lock:
+            if not self.running:
+                self.running = True
+                thread = Thread(target=self.run,
+                                name="Budget(%s)" % (self.name,))
+                thread.daemon = True
+                thread.start()
+
+            completed = self.completed
+            while self.completed == completed:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                self.lock.wait(remaining)
+
+            state = self.state
+            updated = self.updated
+
+        if updated is None or updated < start:
+            self.mark_stale(updated)
+        return state
+
+    def run(self):
+        """
+        budget.run()
+
+        Run the task once, recording its result.  This is the body of the
+        thread started by a call that found no run in progress.
+        """
+        try:
+            state = self.task()
+            succeeded = True
+        except Exception as e:
+            self.errors += 1
+            error_log.error("Task %r failed; keeping last known state",
+                            self.task, exc_info=True)
+            succeeded = False
+
+        with self.lock:
+            if succeeded:
+                self.state = state
+                self.updated = time()
+            self.running = False
+            self.completed += 1
+            self.lock.notify_all()
+        return
+
+    def mark_stale(self, updated):
+        """
+        budget.mark_stale(updated)
+
+        Mark the response to the current health check request (if any) as
+        carrying a result last updated at the given time (or never, if None).
+        """
+        from .handler import current_handler
+
+        handler = current_handler()
+        if handler is None:
+            return
+
+        if updated is None:
+            age = "initial"
+        else:
+            age = "%.3f" % (max(0.0, time() - updated),)
+
+        log.debug("Task %r exceeded its budget; answering with a result of "
+                  "age %s", self.task, age)
+        handler.response_headers[STALE_HEADER] = age
+        return
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+"""
+Memory-compact health check tasks, for processes with very many components.
+
+The classes here behave as their namesakes (TCPCheck, Hysteresis, Toggle and
+Oneshot) do, and reuse their methods, but keep their attributes in __slots__
+rather than a per-instance __dict__, and share equal host names, timeouts and
+thresholds between instances.  Unlike the originals, they do not accept
+arbitrary extra attributes.
+
+TCPCheckTable goes further for homogeneous checks (many TCP endpoints probed
+with the same timeout and thresholds): each check is a row of a few arrays,
+and the task registered for it is a two-slot view of its row.
+"""
+from __future__ import absolute_import, print_function
+from array import array
+from logging import getLogger
+from six.moves import intern
+import socket
+from threading import Lock
+from time import time
+from .errorlog import ErrorLog
+from .events import Observable
+from .hysteresis import Hysteresis
+from .oneshot import Oneshot
+from .tcp import TCPCheck
+from .toggle import Toggle
+from .units import Quantity, count, fail, ok, second
+from .validation import (validate_after, validate_duration,
+                         validate_hostname, validate_port)
+
+log = getLogger("failover.compact")
+
+# Unexpected failures of TCPCheckTable checks; see failover.errorlog.
+error_log = ErrorLog(log)
+
+# Values shared between instances, keyed by value; see shared().
+shared_values = {}
+shared_values_lock = Lock()
+
+# Stop sharing new values past this many distinct ones, so a process that
+# creates checks with ever-changing timeouts doesn't grow this forever.
+MAX_SHARED_VALUES = 1024
+
+def shared(value):
+    """
+    shared(value) -> value
+
+    Return an object equal to value that may be shared with other compact
+    tasks: an interned string, or the first equal time, count or float seen.
+    """
+    if type(value) is str:
+        return intern(value)
+
+    if isinstance(value, Quantity):
+        key = (value.num, value.unit)
+    elif isinstance(value, float):
+        key = value
+    else:
+        return value
+
+    with shared_values_lock:
+        result = shared_values.get(key)
+        if result is None:
+            result = value
+            if len(shared_values) < MAX_SHARED_VALUES:
+                shared_values[key] = value
+    return result
+
+def method(cls, name):
+    """
+    method(cls, name) -> function
+
+    Return the function defining the method name of cls, for use as a method
+    of a compact class.
+    """
+    return vars(cls)[name]
+
+class CompactTCPCheck(object):
+    """
+    CompactTCPCheck(host, port, timeout, source_host=None, source_port=None,
+                    name=None)
+
+    A TCPCheck (see failover.tcp) without a per-instance __dict__.
+    """
+    __slots__ = ("host", "port", "timeout", "source_host", "source_port",
+                 "name")
+
+    # See failover.graph.
+    shareable = True
+
+    def __init__(self, host, port, timeout, source_host=None, source_port=None,
+                 name=None):
+        super(CompactTCPCheck, self).__init__()
+        self.host = shared(validate_hostname(host, "host"))
+        self.port = validate_port(port, "port")
+        self.timeout = shared(validate_duration(timeout, "timeout"))
+        self.source_host = shared(validate_hostname(
+            source_host, "source_host", optional=True) or "")
+        self.source_port = validate_port(source_port, "source_port",
+                                         optional=True) or 0
+        self.name = name
+        return
+
+    connect = method(TCPCheck, "connect")
+    __call__ = method(TCPCheck, "__call__")
+    __repr__ = method(TCPCheck, "__repr__")
+
+class CompactObservable(Observable):
+    """
+    Base class for compact tasks with observers (see
+    failover.events.Observable).
+    """
+    __slots__ = ("observers", "name", "lock")
+
+    def __init__(self, name):
+        super(CompactObservable, self).__init__()
+        self.observers = ()
+        self.name = name
+        self.lock = Lock()
+        return
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        else:
+            return object.__repr__(self)
+
+class CompactHysteresis(CompactObservable):
+    """
+    CompactHysteresis(task, initial_state=ok, fail_after=count(1),
+                      ok_after=count(1), name=None)
+
+    A Hysteresis (see failover.hysteresis) without a per-instance __dict__.
+    """
+    __slots__ = ("task", "current_state", "fail_after", "ok_after",
+                 "disagree_count", "disagree_start", "errors")
+
+    state_attribute = "current_state"
+
+    def __init__(self, task, initial_state=ok, fail_after=count(1),
+                 ok_after=count(1), name=None):
+        super(CompactHysteresis, self).__init__(name)
+        self.task = task
+        self.current_state = initial_state
+        self.fail_after = shared(validate_after(fail_after, "fail_after"))
+        self.ok_after = shared(validate_after(ok_after, "ok_after"))
+        self.disagree_count = 0
+        self.disagree_start = None
+        self.errors = 0
+        return
+
+    __call__ = method(Hysteresis, "__call__")
+    record = method(Hysteresis, "record")
+    save_state = method(Hysteresis, "save_state")
+    restore_state = method(Hysteresis, "restore_state")
+
+class CompactToggle(CompactObservable):
+    """
+    CompactToggle(to_fail, to_ok, initial_state=ok, name=None)
+
+    A Toggle (see failover.toggle) without a per-instance __dict__.
+    """
+    __slots__ = ("to_fail", "to_ok", "state", "errors")
+
+    def __init__(self, to_fail, to_ok, initial_state=ok, name=None):
+        super(CompactToggle, self).__init__(name)
+        self.to_fail = to_fail
+        self.to_ok = to_ok
+        self.state = initial_state
+        self.errors = 0
+        return
+
+    __call__ = method(Toggle, "__call__")
+    save_state = method(Toggle, "save_state")
+    restore_state = method(Toggle, "restore_state")
+
+class CompactOneshot(CompactObservable):
+    """
+    CompactOneshot(default_state=fail, auth=None, name=None)
+
+    A Oneshot (see failover.oneshot) without a per-instance __dict__.
+    """
+    __slots__ = ("default_state", "next_state", "auth")
+
+    state_attribute = "next_state"
+
+    def __init__(self, default_state=fail, auth=None, name=None):
+        super(CompactOneshot, self).__init__(name)
+        self.default_state = default_state
+        self.next_state = default_state
+        self.auth = auth
+        return
+
+    __call__ = method(Oneshot, "__call__")
+    fire = method(Oneshot, "fire")
+    save_state = method(Oneshot, "save_state")
+    restore_state = method(Oneshot, "restore_state")
+
+class TCPCheckTable(object):
+    """
+    TCPCheckTable(timeout, initial_state=ok, fail_after=count(1),
+                  ok_after=count(1), source_host=None)
+
+    Create a table of TCP checks sharing a connect timeout, source address,
+    and hysteresis thresholds.  Each check added with add() behaves as
+    Hysteresis(TCPCheck(host, port, timeout, source_host), initial_state,
+    fail_after, ok_after) would, but is stored as one element of each of a
+    few arrays; the task returned for it holds only the table and its index.
+
+    State changes are logged rather than reported to observers.  Unexpected
+    exceptions are logged (at most once per minute for identical exceptions;
+    see failover.errorlog), counted in errors, and leave the state unchanged.
+    Rows support save_state() and restore_state(), so a StateSnapshot may
+    include them.  Checks may run from several threads at once; connections
+    are made without any lock held.
+    """
+    def __init__(self, timeout, initial_state=ok, fail_after=count(1),
+                 ok_after=count(1), source_host=None):
+        super(TCPCheckTable, self).__init__()
+        self.timeout = validate_duration(timeout, "timeout")
+        self.initial_state = initial_state
+        self.fail_after = validate_after(fail_after, "fail_after")
+        self.ok_after = validate_after(ok_after, "ok_after")
+        self.source_address = (
+            validate_hostname(source_host, "source_host", optional=True) or "",
+            0)
+        self.lock = Lock()
+        self.errors = 0
+
+        # One element per row.  A disagreement start of 0.0 means there is no
+        # disagreement in progress.
+        self.names = []
+        self.hosts = []
+        self.ports = array("H")
+        self.states = bytearray()
+        self.disagree_counts = array("I")
+        self.disagree_starts = array("d")
+        return
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, host, port):
+        """
+        table.add(name, host, port) -> TCPCheckRow
+
+        Add a check of the TCP service at host and port, returning the task
+        performing it.  name is used in log messages and snapshots, and should
+        be the name of the component the task is added as.
+        """
+        host = shared(validate_hostname(host, "host"))
+        port = validate_port(port, "port")
+        with self.lock:
+            index = len(self.names)
+            self.names.append(name)
+            self.hosts.append(host)
+            self.ports.append(port)
+            self.states.append(1 if self.initial_state else 0)
+            self.disagree_counts.append(0)
+            self.disagree_starts.append(0.0)
+        return TCPCheckRow(self, index)
+
+    def check(self, index):
+        """
+        table.check(index) -> bool
+
+        Connect to the service of row index and return the (possibly new)
+        state of the row.
+        """
+        host, port = self.hosts[index], self.ports[index]
+        try:
+            socket.create_connection((host, port), self.timeout,
+                                     self.source_address).close()
+            next_state = ok
+        except socket.error as e:
+            log.info("Connection to %s:%d failed: %s", host, port, e)
+            next_state = fail
+        except Exception:
+            self.errors += 1
+            error_log.error("Check of %s:%d failed; returning current "
+                            "state", host, port, exc_info=True)
+            return bool(self.states[index])
+
+        with self.lock:
+            return self.record(index, next_state)
+
+    def record(self, index, next_state):
+        """
+        table.record(index, next_state) -> bool
+
+        Account for a result of the check of row index as Hysteresis.record()
+        does, returning the (possibly new) state of the row.  The lock must be
+        held.
+        """
+        current_state = bool(self.states[index])
+        if next_state == current_state:
+            return current_state
+
+        now = time()
+        self.disagree_counts[index] += 1
+        if not self.disagree_starts[index]:
+            self.disagree_starts[index] = now
+
+        after = self.ok_after if next_state else self.fail_after
+        if after.unit is second:
+            disagree = second(now - self.disagree_starts[index])
+        else:
+            disagree = count(self.disagree_counts[index])
+
+        if disagree < after:
+            return current_state
+
+        log.info("%s: disagreement %s exceeds threshold %s; moving to new "
+                 "state %s", self.names[index], disagree, after,
+                 ("OK" if next_state else "FAIL"))
+        self.states[index] = 1 if next_state else 0
+        self.disagree_counts[index] = 0
+        self.disagree_starts[index] = 0.0
+        return next_state
+
+    def save_row(self, index):
+        """
+        table.save_row(index) -> dict
+
+        Return a snapshot of row index, in the format of
+        Hysteresis.save_state().
+        """
+        with self.lock:
+            return {
+                "current_state": bool(self.states[index]),
+                "disagree_count": int(self.disagree_counts[index]),
+                "disagree_start": self.disagree_starts[index] or None,
+            }
+
+    def restore_row(self, index, state):
+        """
+        table.restore_row(index, state)
+
+        Restore a snapshot of row index previously returned by save_row() (or
+        by Hysteresis.save_state()).
+        """
+        with self.lock:
+            self.states[index] = 1 if state["current_state"] else 0
+            self.disagree_counts[index] = int(state.get("disagree_count", 0))
+            self.disagree_starts[index] = state.get("disagree_start") or 0.0
+        return
+
+class TCPCheckRow(object):
+    """
+    TCPCheckRow(table, index)
+
+    The task performing the check in row index of a TCPCheckTable.
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        super(TCPCheckRow, self).__init__()
+        self.table = table
+        self.index = index
+        return
+
+    def __call__(self):
+        return self.table.check(self.index)
+
+    @property
+    def name(self):
+        return self.table.names[self.index]
+
+    @property
+    def current_state(self):
+        return bool(self.table.states[self.index])
+
+    def save_state(self):
+        return self.table.save_row(self.index)
+
+    def restore_state(self, state):
+        return self.table.restore_row(self.index, state)
+
+    def __repr__(self):
+        return self.name
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from json import loads
+from logging import getLogger
+import os
+import re
+from six import iteritems, string_types
+from .units import count, day, hour, minute, second, ok, fail
+from .validation import validate_duration
+from threading import Condition, Thread
+
+log = getLogger("failover.config")
+
+"""
+Declarative configuration of health check components.
+
+A configuration is a mapping with a "components" key, mapping each component
+name (the URL path it is served on) to a component specification:
+
+    {
+        "components": {
+            "mail": {
+                "task": {
+                    "type": "Hysteresis",
+                    "initial_state": "fail",
+                    "ok_after": 5,
+                    "fail_after": "2min",
+                    "task": {"type": "TCPCheck", "host": "192.0.2.1",
+                             "port": "smtp", "timeout": "10s"}
+                }
+            }
+        }
+    }
+
+Each task specification names its class in "type"; the remaining keys are
+passed to the constructor.  Durations may be given as strings such as "10s",
+"2min", "1h" or "1d" (or as numbers of seconds); counts as integers or strings
+such as "5count"; states as "ok" or "fail".  A task may be given an "id", and
+a component's "on_post" may name the id of a Oneshot whose fire() method
+(or a PassiveCheck whose ingest_post() method) handles POST requests.
+"""
+
+# Parameters holding nested task specifications.
+TASK_PARAMETERS = ("task", "to_fail", "to_ok", "auth")
+
+# Parameters holding durations, hysteresis thresholds and states.
+DURATION_PARAMETERS = ("timeout", "read_timeout", "handshake_timeout",
+                       "delay", "max_delay", "budget", "window",
+                       "max_latency")
+AFTER_PARAMETERS = ("ok_after", "fail_after")
+STATE_PARAMETERS = ("initial_state", "default_state")
+
+QUANTITY_UNITS = {
+    "s": second, "sec": second, "second": second, "seconds": second,
+    "min": minute, "minute": minute, "minutes": minute,
+    "h": hour, "hour": hour, "hours": hour,
+    "d": day, "day": day, "days": day,
+    "count": count, "counts": count,
+}
+QUANTITY_REGEX = re.compile(r"^\s*([0-9]+(?:\.[0-9]*)?)\s*([a-z]+)\s*$")
+STATES = {"ok": ok, "fail": fail}
+
+# Large configurations repeat the same few quantity strings many times.
+quantity_cache = {}
+
+def task_types():
+    """
+    task_types() -> dict
+
+    Return the mapping of "type" names to task classes understood by the
+    configuration loader.
+    """
+    from .auth import ApachePasswdFileCheck
+    from .background import Background
+    from .budget import Budget
+    from .http import HTTPCheck
+    from .hysteresis import Hysteresis
+    from .oneshot import Oneshot
+    from .passive import PassiveCheck
+    from .remote import RemoteHealthCheck
+    from .smtp import SMTPCheck
+    from .tcp import TCPCheck
+    from .tls import TLSCheck
+    from .toggle import Toggle
+
+    return {
+        "ApachePasswdFileCheck": ApachePasswdFileCheck,
+        "Background": Background,
+        "Budget": Budget,
+        "HTTPCheck": HTTPCheck,
+        "Hysteresis": Hysteresis,
+        "Oneshot": Oneshot,
+        "PassiveCheck": PassiveCheck,
+        "RemoteHealthCheck": RemoteHealthCheck,
+        "SMTPCheck": SMTPCheck,
+        "TCPCheck": TCPCheck,
+        "TLSCheck": TLSCheck,
+        "Toggle": Toggle,
+    }
+
+def parse_quantity(value, parameter_name):
+    """
+    parse_quantity(value, parameter_name) -> quantity or number
+
+    Convert a configuration string such as "10s" or "5count" into a quantity.
+    Non-string values are returned unchanged.
+    """
+    if not isinstance(value, string_types):
+        return value
+
+    try:
+        return quantity_cache[value]
+    except KeyError:
+        pass
+
+    match = QUANTITY_REGEX.match(value.lower())
+    if match is None or match.group(2) not in QUANTITY_UNITS:
+        raise ValueError("%s: invalid quantity %r" % (parameter_name, value))
+
+    number = float(match.group(1))
+    if number == int(number):
+        number = int(number)
+
+    result = quantity_cache[value] = QUANTITY_UNITS[match.group(2)](number)
+    return result
+
+def parse_state(value, parameter_name):
+    """
+    parse_state(value, parameter_name) -> bool
+
+    Convert a configuration state ("ok", "fail", or a boolean) into a bool.
+    """
+    if isinstance(value, bool):
+        return value
+
+    try:
+        return STATES[value.lower()]
+    except (AttributeError, KeyError):
+        raise ValueError("%s: invalid state %r" % (parameter_name, value))
+
+def parse_config(text, format):
+    """
+    parse_config(text, format) -> dict
+
+    Parse configuration text in the given format ("json", "yaml" or "toml").
+    YAML and TOML require the PyYAML and toml packages, respectively.
+    """
+    if format == "json":
+        return loads(text)
+
+    if format == "yaml":
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is required for YAML configurations")
+        return yaml.safe_load(text)
+
+    if format == "toml":
+        try:
+            import toml
+        except ImportError:
+            raise RuntimeError("toml is required for TOML configurations")
+        return toml.loads(text)
+
+    raise ValueError("Unknown configuration format %r" % (format,))
+
+def format_for_filename(filename):
+    """
+    format_for_filename(filename) -> str
+
+    Guess the configuration format from a filename's extension.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in (".yaml", ".yml"):
+        return "yaml"
+    if extension == ".toml":
+        return "toml"
+    return "json"
+
+class Config(Thread):
+    """
+    Config(filename, server, delay=None, snapshot=None)
+
+    Create a Config object that builds health check components from the
+    configuration file filename and adds them to server (a HealthCheckServer).
+
+    If delay is not None, the file is checked for modification every delay
+    and reloaded when it changes.  A reload only rebuilds components whose
+    specification changed: a task whose specification (including everything
+    it wraps) is unchanged keeps the same object, and therefore its state.
+    Replaced tasks are stopped or closed if they support it.  A configuration
+    that fails to load leaves the previous one in effect.
+
+    If snapshot is not None, it is a failover.snapshot.StateSnapshot with
+    which newly built components are registered.
+    """
+    def __init__(self, filename, server, delay=None, snapshot=None):
+        super(Config, self).__init__()
+        self.daemon = True
+        self.filename = filename
+        self.server = server
+        self.delay = (None if delay is None else
+                      validate_duration(delay, "delay"))
+        self.snapshot = snapshot
+        self.lock = Condition()
+        self.exit_requested = False
+        self.types = task_types()
+
+        # (path, canonical spec) -> built task, for the current config.
+        self.tasks = {}
+        self.ids = {}
+        self.components = {}
+        self.stat = None
+
+        self.load()
+
+        if self.delay is not None:
+            self.start()
+        return
+
+    def load(self):
+        """
+        config.load()
+
+        Read and apply the configuration file.  Raises an exception (and
+        leaves the current configuration in effect) if it is invalid.
+        """
+        stat = os.stat(self.filename)
+        with open(self.filename) as fd:
+            text = fd.read()
+
+        self.apply(parse_config(text, format_for_filename(self.filename)))
+        self.stat = (stat.st_mtime, stat.st_size)
+        return
+
+    def apply(self, config):
+        """
+        config.apply(config)
+
+        Apply a parsed configuration mapping, reusing unchanged tasks.
+        """
+        with self.lock:
+            try:
+                components = config["components"]
+                items = list(iteritems(components))
+            except (KeyError, TypeError, AttributeError):
+                raise ValueError("Configuration must contain a "
+                                 "\"components\" mapping")
+
+            old_tasks = self.tasks
+            self.tasks = {}
+            self.ids = {}
+            built = {}
+
+            try:
+                for name, spec in items:
+                    if not isinstance(spec, dict) or "task" not in spec:
+                        raise ValueError("%s: component must specify a task" %
+                                         (name,))
+                    frozen = {}
+                    freeze(spec["task"], frozen)
+                    task = self.build(name, spec["task"], old_tasks, frozen)
+                    on_post = spec.get("on_post")
+                    if on_post is not None:
+                        try:
+                            target = self.ids[on_post]
+                            on_post = (getattr(target, "fire", None) or
+                                       target.ingest_post)
+                        except (KeyError, AttributeError):
+                            raise ValueError(
+                                "%s: on_post must name the id of a Oneshot "
+                                "or PassiveCheck" % (name,))
+                    built[name] = (task, on_post)
+            except Exception:
+                # Stop anything we started and revert to the old config.
+                for key, task in iteritems(self.tasks):
+                    if old_tasks.get(key) is not task:
+                        release(task)
+                self.tasks = old_tasks
+                raise
+
+            for name in self.components:
+                if name not in built:
+                    log.info("Removing component %s", name)
+                    self.server.remove_component(name)
+
+            for name, (task, on_post) in iteritems(built):
+                if self.components.get(name) != (task, on_post):
+                    log.info("Adding component %s", name)
+                    self.server.add_component(name, task, on_post=on_post)
+                    if self.snapshot is not None:
+                        self.snapshot.add(name, task)
+
+            self.components = built
+
+            reused = set(id(task) for task in self.tasks.values())
+            for task in old_tasks.values():
+                if id(task) not in reused:
+                    release(task)
+        return
+
+    def build(self, path, spec, old_tasks, frozen):
+        """
+        config.build(path, spec, old_tasks, frozen) -> task
+
+        Build the task described by spec at the given path, reusing the task
+        from old_tasks if an identical spec was built at the same path.
+        frozen maps id(spec) to the hashable form of each spec in the tree
+        (see freeze()).
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("%s: task must be a mapping" % (path,))
+
+        key = (path, frozen[id(spec)])
+        task = old_tasks.get(key)
+
+        if task is None:
+            task = self.construct(path, spec, old_tasks, frozen)
+        else:
+            # Still walk the children so their keys and ids are recorded.
+            for parameter in TASK_PARAMETERS:
+                if isinstance(spec.get(parameter), dict):
+                    self.build(path + "." + parameter, spec[parameter],
+                               old_tasks, frozen)
+
+        self.tasks[key] = task
+        if "id" in spec:
+            self.ids[spec["id"]] = task
+        return task
+
+    def construct(self, path, spec, old_tasks, frozen):
+        """
+        config.construct(path, spec, old_tasks, frozen) -> task
+
+        Construct a new task from spec.
+        """
+        kw = {}
+        type_name = None
+        for parameter, value in iteritems(spec):
+            parameter = str(parameter)
+            if parameter == "type":
+                type_name = value
+            elif parameter == "id":
+                continue
+            elif parameter in TASK_PARAMETERS and isinstance(value, dict):
+                kw[parameter] = self.build(path + "." + parameter, value,
+                                           old_tasks, frozen)
+            elif (parameter in DURATION_PARAMETERS or
+                  parameter in AFTER_PARAMETERS):
+                kw[parameter] = parse_quantity(value, path + "." + parameter)
+            elif parameter in STATE_PARAMETERS:
+                kw[parameter] = parse_state(value, path + "." + parameter)
+            else:
+                kw[parameter] = value
+
+        try:
+            cls = self.types[type_name]
+        except (KeyError, TypeError):
+            raise ValueError("%s: unknown task type %r" % (path, type_name))
+
+        try:
+            return cls(**kw)
+        except (TypeError, ValueError) as e:
+            raise ValueError("%s: %s" % (path, e))
+
+    def run(self):
+        with self.lock:
+            while not self.exit_requested:
+                self.lock.wait(self.delay)
+                if self.exit_requested:
+                    break
+
+                try:
+                    stat = os.stat(self.filename)
+                    if (stat.st_mtime, stat.st_size) == self.stat:
+                        continue
+                    log.info("Configuration %s changed; reloading",
+                             self.filename)
+                    self.load()
+                except Exception as e:
+                    log.error("Failed to reload configuration %s: %s",
+                              self.filename, e, exc_info=True)
+        return
+
+    def stop(self):
+        """
+        config.stop()
+
+        Stop watching the configuration file for changes.
+        """
+        with self.lock:
+            self.exit_requested = True
+            self.lock.notify()
+
+        if self.is_alive():
+            self.join()
+        return
+
+def freeze(value, frozen):
+    """
+    freeze(value, frozen) -> hashable
+
+    Convert a parsed configuration value into an equivalent hashable value,
+    recording the result for every mapping in frozen (keyed by id()).  This
+    lets every task in a tree be keyed by its full specification in a single
+    pass.
+    """
+    if isinstance(value, dict):
+        result = tuple(sorted(
+            (key, freeze(item, frozen)) for key, item in iteritems(value)))
+        frozen[id(value)] = result
+        return result
+
+    if isinstance(value, list):
+        return tuple(freeze(item, frozen) for item in value)
+
+    return value
+
+def release(task):
+    """
+    release(task)
+
+    Stop or close a task that is no longer part of the configuration.
+    """
+    for method in ("stop", "close"):
+        method = getattr(task, method, None)
+        if method is not None:
+            try:
+                method()
+            except Exception as e:
+                log.error("Failed to release %r: %s", task, e)
+            return
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from collections import OrderedDict
+from logging import ERROR
+import sys
+from threading import Lock
+from time import time
+from .units import second
+from .validation import validate_duration
+
+class ErrorLog(object):
+    """
+    ErrorLog(logger, interval=second(60), max_keys=1000)
+
+    Create an ErrorLog object that writes errors to logger (a
+    logging.Logger), logging each distinct error at most once per interval.
+
+    Errors are identical if they have the same message and arguments and,
+    when logged while handling an exception, the same exception type and
+    text.  The first occurrence is logged in full (with its traceback, if
+    requested); later occurrences within the interval are only counted.  The
+    count is reported when the error is next logged, or (if it stops
+    occurring) with the next error logged after the interval has passed, e.g.
+    "... [suppressed 4,812 identical errors in 60s]".
+
+    Formatting a traceback costs far more than handling a failed health
+    check; this keeps a failing dependency probed thousands of times a second
+    from turning the logs into the bottleneck.  At most max_keys distinct
+    errors are tracked; the least recently seen are forgotten first.
+
+    The total number of errors is kept in total, and the number of each
+    distinct error in counts().
+    """
+    def __init__(self, logger, interval=second(60), max_keys=1000):
+        super(ErrorLog, self).__init__()
+        if not isinstance(max_keys, int) or max_keys < 1:
+            raise ValueError("max_keys must be a positive integer")
+        self.logger = logger
+        self.interval = validate_duration(interval, "interval")
+        self.max_keys = max_keys
+        self.lock = Lock()
+        self.total = 0
+
+        # key -> [window start, suppressed, count, msg, args], least recently
+        # seen first.
+        self.entries = OrderedDict()
+        self.next_sweep = 0.0
+        return
+
+    def error(self, msg, *args, **kw):
+        """
+        error_log.error(msg, *args, exc_info=False, level=logging.ERROR)
+
+        Log an error as logger.log(level, msg, *args, exc_info=exc_info)
+        would, unless an identical error has already been logged within the
+        interval.
+        """
+        exc_info = kw.pop("exc_info", False)
+        level = kw.pop("level", ERROR)
+        if kw:
+            raise TypeError("unexpected keyword arguments: %s" %
+                            (", ".join(sorted(kw)),))
+
+        key = error_key(msg, args)
+        now = time()
+        suppressed = None
+
+        with self.lock:
+            self.total += 1
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                entry = [now, 0, 0, msg, args]
+                suppressed = (0, 0.0)
+            elif now - entry[0] >= self.interval:
+                suppressed = (entry[1], now - entry[0])
+                entry[0] = now
+                entry[1] = 0
+            else:
+                entry[1] += 1
+            entry[2] += 1
+            self.entries[key] = entry
+
+            summaries = []
+            while len(self.entries) > self.max_keys:
+                summaries.append(summarize(self.entries.popitem(last=False)[1],
+                                           now))
+            if now >= self.next_sweep:
+                self.next_sweep = now + self.interval
+                summaries.extend(self.sweep(now))
+
+        for summary in summaries:
+            if summary is not None:
+                self.logger.log(level, *summary)
+
+        if suppressed is not None:
+            if suppressed[0]:
+                msg += " [suppressed %s identical errors in %.0fs]"
+                args += ("{:,}".format(suppressed[0]), suppressed[1])
+            self.logger.log(level, msg, *args, exc_info=exc_info)
+        return
+
+    def sweep(self, now):
+        """
+        error_log.sweep(now) -> list
+
+        Return summaries (logger.log() arguments after the level) of errors
+        suppressed for a whole interval that have not recurred since, and
+        start a new interval for each.  The lock must be held.
+        """
+        summaries = []
+        for entry in self.entries.values():
+            if entry[1] and now - entry[0] >= self.interval:
+                summaries.append(summarize(entry, now))
+                entry[0] = now
+                entry[1] = 0
+        return summaries
+
+    def counts(self):
+        """
+        error_log.counts() -> dict
+
+        Return the number of occurrences of each distinct error still
+        tracked, keyed by the message formatted with its arguments.
+        """
+        with self.lock:
+            entries = list(self.entries.values())
+
+        result = {}
+        for start, suppressed, count, msg, args in entries:
+            try:
+                text = msg % args
+            except Exception:
+                text = msg
+            result[text] = result.get(text, 0) + count
+        return result
+
+def error_key(msg, args):
+    """
+    error_key(msg, args) -> tuple
+
+    Return the key identifying an error with the given message and arguments,
+    including the exception being handled (if any).
+    """
+    exc_type, exc_value = sys.exc_info()[:2]
+    try:
+        exc_text = str(exc_value)
+    except Exception:
+        exc_text = None
+    return (msg, tuple(repr(arg) for arg in args), exc_type, exc_text)
+
+def summarize(entry, now):
+    """
+    summarize(entry, now) -> tuple or None
+
+    Return the logger.log() arguments (after the level) reporting the
+    suppressed occurrences of an entry, or None if there are none.
+    """
+    start, suppressed, count, msg, args = entry
+    if not suppressed:
+        return None
+    return ((msg + " [suppressed %s identical errors in %.0fs]",) + args +
+            ("{:,}".format(suppressed), now - start))
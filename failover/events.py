@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from collections import deque, namedtuple
+from logging import getLogger
+from six.moves.queue import Full, Queue
+from threading import Lock, Thread
+from time import time
+from .snapshot import SUBTASK_ATTRIBUTES
+
+log = getLogger("failover.events")
+
+class StateChange(namedtuple("StateChange", ["component", "old", "new",
+                                             "timestamp", "reason"])):
+    """
+    StateChange(component, old, new, timestamp, reason)
+
+    Describes a change in the state of a component: its name, the old and new
+    states (ok or fail), when the change happened (seconds since the epoch)
+    and a human-readable reason.
+    """
+    __slots__ = ()
+
+# Serializes changes to observer lists, which are rare; notifying observers
+# takes no lock.
+observers_lock = Lock()
+
+class Observable(object):
+    """
+    Mixin for components whose state changes over time (Hysteresis, Toggle,
+    Oneshot and Background).  Observers are called with a StateChange
+    whenever the state flips.
+    """
+    # Subclasses may be compact (see failover.compact).
+    __slots__ = ()
+
+    # Replaced (never mutated) when observers are added or removed, so it can
+    # be iterated without a lock while another thread changes it.
+    observers = ()
+
+    # The attribute holding the state that observers are told about.
+    state_attribute = "state"
+
+    def observed_state(self):
+        """
+        observable.observed_state() -> bool
+
+        Return the current state without invoking any tasks.
+        """
+        return bool(getattr(self, self.state_attribute))
+
+    def add_observer(self, observer):
+        """
+        observable.add_observer(observer)
+
+        Call observer(change) with a StateChange each time the state of this
+        object changes.  Observers are called synchronously by the thread
+        making the change, so they must be quick.
+        """
+        with observers_lock:
+            self.observers = self.observers + (observer,)
+        return
+
+    def remove_observer(self, observer):
+        """
+        observable.remove_observer(observer)
+
+        Stop calling observer on state changes.  Unknown observers are
+        ignored.
+        """
+        with observers_lock:
+            self.observers = tuple(o for o in self.observers
+                                   if o != observer)
+        return
+
+    def subscribe(self, subscriber, max_pending=100, dispatcher=None):
+        """
+        observable.subscribe(subscriber, max_pending=100, dispatcher=None)
+            -> Subscription
+
+        Deliver a StateChange to subscriber each time the state of this object
+        changes, without making the thread that changed it wait.
+
+        subscriber may be a callable, which is called on one of dispatcher's
+        threads (by default, a shared Dispatcher), or a queue, onto which
+        changes are put without blocking.  Each callable subscriber receives
+        changes in order, one at a time; up to max_pending undelivered
+        changes are kept for a slow subscriber, after which further changes
+        are dropped (and logged).
+
+        The returned Subscription may be passed to unsubscribe().
+        """
+        subscription = Subscription(subscriber, max_pending, dispatcher)
+        self.add_observer(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        observable.unsubscribe(subscription)
+
+        Stop delivering changes to a subscription returned by subscribe().
+        Changes already pending may still be delivered.
+        """
+        self.remove_observer(subscription)
+        return
+
+    def state_changed(self, old, new, reason):
+        """
+        observable.state_changed(old, new, reason)
+
+        Notify observers that the state has changed from old to new.
+        """
+        if not self.observers:
+            return
+
+        change = StateChange(getattr(self, "name", None), old, new, time(),
+                             reason)
+        for observer in self.observers:
+            try:
+                observer(change)
+            except Exception as e:
+                log.error("State change observer %r failed: %s", observer, e,
+                          exc_info=True)
+        return
+
+class Subscription(object):
+    """
+    Subscription(subscriber, max_pending=100, dispatcher=None)
+
+    An observer that hands state changes to subscriber asynchronously; see
+    Observable.subscribe().
+    """
+    def __init__(self, subscriber, max_pending=100, dispatcher=None):
+        super(Subscription, self).__init__()
+        if not isinstance(max_pending, int) or max_pending <= 0:
+            raise ValueError("max_pending must be a positive integer")
+
+        self.subscriber = subscriber
+        self.max_pending = max_pending
+        self.dispatcher = dispatcher
+        self.pending = deque()
+        self.lock = Lock()
+        self.scheduled = False
+        self.dropped = 0
+        return
+
+    def __call__(self, change):
+        put = getattr(self.subscriber, "put_nowait", None)
+        if put is not None:
+            try:
+                put(change)
+            except Full:
+                self.drop(change)
+            return
+
+        with self.lock:
+            if len(self.pending) >= self.max_pending:
+                self.drop(change)
+                return
+
+            self.pending.append(change)
+            if self.scheduled:
+                # deliver() is already queued or running and will get to it.
+                return
+            self.scheduled = True
+
+        (self.dispatcher or default_dispatcher()).submit(self.deliver)
+        return
+
+    def drop(self, change):
+        """
+        subscription.drop(change)
+
+        Discard a change that the subscriber has no room for.
+        """
+        self.dropped += 1
+        log.warning("Subscriber %r is not keeping up; dropped %s",
+                    self.subscriber, change)
+        return
+
+    def deliver(self):
+        """
+        subscription.deliver()
+
+        Call the subscriber with each pending change.  This runs on a
+        dispatcher thread.
+        """
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.scheduled = False
+                    return
+                change = self.pending.popleft()
+
+            try:
+                self.subscriber(change)
+            except Exception as e:
+                log.error("Subscriber %r failed: %s", self.subscriber, e,
+                          exc_info=True)
+
+class Dispatcher(object):
+    """
+    Dispatcher(workers=4)
+
+    A fixed set of daemon threads, started on first use, that run functions
+    submitted to it.  Used to call subscribers without blocking health
+    checks.
+    """
+    def __init__(self, workers=4):
+        super(Dispatcher, self).__init__()
+        if not isinstance(workers, int) or workers <= 0:
+            raise ValueError("workers must be a positive integer")
+
+        self.workers = workers
+        self.queue = Queue()
+        self.threads = []
+        self.lock = Lock()
+        return
+
+    def submit(self, function):
+        """
+        dispatcher.submit(function)
+
+        Call function() on one of the dispatcher's threads.
+        """
+        if len(self.threads) < self.workers:
+            with self.lock:
+                while len(self.threads) < self.workers:
+                    thread = Thread(target=self.run)
+                    thread.daemon = True
+                    thread.start()
+                    self.threads.append(thread)
+
+        self.queue.put(function)
+        return
+
+    def run(self):
+        while True:
+            function = self.queue.get()
+            if function is None:
+                break
+
+            try:
+                function()
+            except Exception as e:
+                log.error("Dispatched function %r failed: %s", function, e,
+                          exc_info=True)
+        return
+
+    def stop(self):
+        """
+        dispatcher.stop()
+
+        Stop the dispatcher's threads once the functions already submitted
+        have run.
+        """
+        with self.lock:
+            for thread in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+        return
+
+# The Dispatcher used by subscriptions that don't specify one.
+shared_dispatcher = None
+shared_dispatcher_lock = Lock()
+
+def default_dispatcher():
+    """
+    default_dispatcher() -> Dispatcher
+
+    Return the shared Dispatcher, creating it if necessary.
+    """
+    global shared_dispatcher
+    if shared_dispatcher is None:
+        with shared_dispatcher_lock:
+            if shared_dispatcher is None:
+                shared_dispatcher = Dispatcher()
+    return shared_dispatcher
+
+def find_observable(task):
+    """
+    find_observable(task) -> Observable or None
+
+    Return the outermost Observable in the tree of tasks rooted at task (task
+    itself, or a task it wraps), or None if there is none.
+    """
+    if isinstance(task, Observable):
+        return task
+
+    for attr in SUBTASK_ATTRIBUTES:
+        subtask = getattr(task, attr, None)
+        if subtask is not None:
+            result = find_observable(subtask)
+            if result is not None:
+                return result
+    return None
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+A fast parser for health probe requests.
+
+Health probes are tiny requests such as "GET /name HTTP/1.1" with a handful
+of headers.  BaseHTTPRequestHandler parses every request's headers through
+mimetools (Python 2) or email (Python 3), which costs more than handling the
+rest of the probe.  parse_probe() handles the common subset directly and
+hands anything else to the full parser.
+"""
+from __future__ import absolute_import, print_function
+from logging import getLogger
+from six.moves.http_client import BAD_REQUEST
+
+log = getLogger("failover.fastparse")
+
+# The largest header block (excluding the request line) accepted by the fast
+# parser, in bytes.  Larger requests are rejected.
+MAX_HEADER_SIZE = 8192
+
+PROBE_METHODS = ("GET", "HEAD")
+PROBE_VERSIONS = ("HTTP/1.0", "HTTP/1.1")
+HEADER_ENDS = (b"\r\n", b"\n", b"")
+
+class ProbeHeaders(object):
+    """
+    ProbeHeaders(headers)
+
+    The headers of a probe request parsed by parse_probe(), where headers
+    maps lowercased names to values.  Lookups are case-insensitive, as with
+    the message objects produced by the full parser.
+    """
+    def __init__(self, headers):
+        super(ProbeHeaders, self).__init__()
+        self.headers = headers
+        return
+
+    def get(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    # mimetools.Message (Python 2) spelling.
+    getheader = get
+
+    def __getitem__(self, name):
+        return self.headers[name.lower()]
+
+    def __contains__(self, name):
+        return name.lower() in self.headers
+
+    def __len__(self):
+        return len(self.headers)
+
+class ReplayReader(object):
+    """
+    ReplayReader(lines, fp)
+
+    A file-like object that returns the given lines before reading from fp.
+    This lets the full parser reread a header block already consumed by the
+    fast parser.
+    """
+    def __init__(self, lines, fp):
+        super(ReplayReader, self).__init__()
+        self.lines = list(lines)
+        self.fp = fp
+        return
+
+    def readline(self, size=-1):
+        if self.lines:
+            return self.lines.pop(0)
+        return self.fp.readline(size)
+
+    def read(self, size=-1):
+        if not self.lines:
+            return self.fp.read(size)
+
+        data = b"".join(self.lines)
+        self.lines = []
+        if size < 0:
+            return data + self.fp.read()
+        if len(data) > size:
+            self.lines = [data[size:]]
+            return data[:size]
+        return data + self.fp.read(size - len(data))
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+def parse_probe(handler):
+    """
+    parse_probe(handler) -> bool or None
+
+    Parse the request read by handler (a BaseHTTPRequestHandler whose
+    raw_requestline has been read), as parse_request() would.
+
+    GET and HEAD requests for absolute paths using HTTP/1.0 or HTTP/1.1 with
+    simple "Name: value" headers are parsed here, setting the handler's
+    command, path, request_version, requestline, headers (a ProbeHeaders
+    object) and close_connection, and True is returned.  A header block
+    larger than MAX_HEADER_SIZE is answered with 400 Bad Request and False is
+    returned.
+
+    Anything else returns None without parsing the request; the handler's
+    rfile is left positioned so that the full parser reads the same request.
+    """
+    requestline = handler.raw_requestline
+    if not isinstance(requestline, str):
+        requestline = requestline.decode("latin-1")
+    requestline = requestline.rstrip("\r\n")
+
+    words = requestline.split(" ")
+    if len(words) != 3:
+        return None
+
+    command, path, version = words
+    if (command not in PROBE_METHODS or version not in PROBE_VERSIONS or
+        not path.startswith("/") or path.startswith("//")):
+        return None
+
+    # Read the whole header block, so the full parser can be given it if
+    # anything in it is unusual.
+    readline = handler.rfile.readline
+    decode = not isinstance(handler.raw_requestline, str)
+    lines = []
+    size = 0
+    simple = True
+    headers = {}
+    while True:
+        line = readline(MAX_HEADER_SIZE + 1)
+        size += len(line)
+        if size > MAX_HEADER_SIZE:
+            log.warning("Request header from %s exceeds %d bytes",
+                        handler.client_address[0], MAX_HEADER_SIZE)
+            handler.requestline = requestline
+            handler.request_version = version
+            handler.command = command
+            handler.send_error(BAD_REQUEST, "Request header too large")
+            return False
+
+        lines.append(line)
+        if line in HEADER_ENDS:
+            break
+
+        if simple:
+            if decode:
+                line = line.decode("latin-1")
+            name, sep, value = line.partition(":")
+            key = name.lower()
+            if sep and name and name == name.strip() and key not in headers:
+                headers[key] = value.strip()
+            else:
+                # Continuation lines, repeated headers, etc.
+                simple = False
+
+    if not simple:
+        if isinstance(handler.rfile, ReplayReader):
+            # Reuse the reader left by an earlier request on this connection,
+            # so readers don't pile up over its lifetime.
+            handler.rfile.lines = lines + handler.rfile.lines
+        else:
+            handler.rfile = ReplayReader(lines, handler.rfile)
+        return None
+
+    handler.command = command
+    handler.path = path
+    handler.request_version = version
+    handler.requestline = requestline
+    handler.headers = ProbeHeaders(headers)
+
+    # As decided by BaseHTTPRequestHandler.parse_request.
+    keep_alive = (handler.protocol_version >= "HTTP/1.1")
+    connection = headers.get("connection", "").lower()
+    if connection == "close":
+        handler.close_connection = True
+    elif connection == "keep-alive" and keep_alive:
+        handler.close_connection = False
+    else:
+        handler.close_connection = not (keep_alive and version == "HTTP/1.1")
+    return True
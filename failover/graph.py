@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+import inspect
+from json import dumps
+from logging import getLogger
+from six.moves.http_client import OK
+from threading import Condition, Lock
+from time import time
+from .snapshot import SUBTASK_ATTRIBUTES
+from .units import second
+from .validation import validate_duration
+
+log = getLogger("failover.graph")
+
+getargspec = getattr(inspect, "getfullargspec", None) or inspect.getargspec
+
+class CheckGraph(object):
+    """
+    CheckGraph(server, tick=second(1), path="/_graph")
+
+    Create a CheckGraph object that merges identical health checks across the
+    components of server (a HealthCheckServer) into a shared graph, and
+    serves a description of the graph as JSON on path.
+
+    Checks whose class sets shareable to True (TCPCheck and its subclasses)
+    are identical if they are of the same class and were constructed with the
+    same parameters (other than name).  Every use of such a check, at the top
+    of a component or wrapped in a Hysteresis, Toggle, Background, etc., is
+    replaced by a single SharedTask, which runs the check at most once per
+    tick: calls within a tick of the start of the last run get its result,
+    and calls while a run is in progress wait for it.  Other tasks are left
+    as they are; those used in several places are shown as shared in the
+    graph, but are not cached.
+
+    Components added to the server later are merged when the graph endpoint
+    is next requested, or when refresh() is called.
+    """
+    def __init__(self, server, tick=second(1), path="/_graph"):
+        super(CheckGraph, self).__init__()
+        self.server = server
+        self.tick = validate_duration(tick, "tick")
+        self.path = path
+        self.lock = Lock()
+
+        # share key -> SharedTask.
+        self.shared = {}
+
+        self.refresh()
+        server.endpoints[path] = self.handle
+        return
+
+    def refresh(self):
+        """
+        graph.refresh()
+
+        Merge the identical checks of all of the server's components,
+        including those added since the last refresh.
+        """
+        with self.lock:
+            seen = {}
+            handlers = self.server.get_handlers
+            for name in sorted(handlers):
+                task = handlers[name]
+                merged = self.merge(task, seen)
+                if merged is not task:
+                    handlers[name] = merged
+        return
+
+    def add_component(self, name, task, on_post=None):
+        """
+        graph.add_component(name, task, on_post=None)
+
+        Add a component to the server (see HealthCheckServer.add_component)
+        and merge its checks into the graph.
+        """
+        self.server.add_component(name, task, on_post=on_post)
+        self.refresh()
+        return
+
+    def merge(self, task, seen):
+        """
+        graph.merge(task, seen) -> task
+
+        Return the task to use in place of task: its SharedTask if it is
+        shareable, or task itself with the tasks it wraps merged.  seen maps
+        the id() of each task already merged during this refresh to its
+        replacement.  The lock must be held.
+        """
+        if isinstance(task, SharedTask):
+            return task
+
+        replacement = seen.get(id(task))
+        if replacement is not None:
+            return replacement
+
+        key = share_key(task)
+        if key is not None:
+            replacement = self.shared.get(key)
+            if replacement is None:
+                log.debug("Sharing %r", task)
+                replacement = self.shared[key] = SharedTask(task, self.tick)
+            seen[id(task)] = replacement
+            return replacement
+
+        seen[id(task)] = task
+        for attr in SUBTASK_ATTRIBUTES:
+            subtask = getattr(task, attr, None)
+            if subtask is not None:
+                merged = self.merge(subtask, seen)
+                if merged is not subtask:
+                    setattr(task, attr, merged)
+        return task
+
+    def describe(self):
+        """
+        graph.describe() -> dict
+
+        Return a JSON-serializable description of the graph: the root node
+        of each component, and each node with the nodes it wraps (children),
+        the nodes using it (consumers), the components it belongs to, and
+        (for shared checks) its call and run counts.
+        """
+        with self.lock:
+            handlers = dict(self.server.get_handlers)
+            ids = {}
+            nodes = []
+            components = {}
+            for name in sorted(handlers):
+                components[name] = self.visit(handlers[name], None, name, ids,
+                                              nodes)
+
+        for node in nodes:
+            roots = sum(1 for root in components.values()
+                        if root == node["id"])
+            node["shared"] = len(node["consumers"]) + roots > 1
+        return {"components": components, "nodes": nodes}
+
+    def visit(self, task, parent, component, ids, nodes):
+        """
+        graph.visit(task, parent, component, ids, nodes) -> int
+
+        Describe task (used by the node numbered parent, or at the top of
+        component if parent is None) and the tasks it wraps, appending new
+        nodes to nodes.  ids maps the id() of each task described to its node
+        number, which is returned.
+        """
+        node_id = ids.get(id(task))
+        if node_id is None:
+            node_id = ids[id(task)] = len(nodes)
+            nodes.append(describe_node(task, node_id))
+
+        node = nodes[node_id]
+        if parent is not None and parent not in node["consumers"]:
+            node["consumers"].append(parent)
+        if component in node["components"]:
+            return node_id
+
+        node["components"].append(component)
+        if not isinstance(task, SharedTask):
+            children = []
+            for attr in SUBTASK_ATTRIBUTES:
+                subtask = getattr(task, attr, None)
+                if subtask is not None:
+                    children.append(self.visit(subtask, node_id, component,
+                                               ids, nodes))
+            node["children"] = children
+        return node_id
+
+    def handle(self, handler):
+        """
+        graph.handle(handler)
+
+        Answer a request for the description of the graph.
+        """
+        self.refresh()
+        return handler.respond(OK, dumps(self.describe(), sort_keys=True),
+                               content_type="application/json")
+
+    def close(self):
+        """
+        graph.close()
+
+        Remove the graph endpoint.  Merged checks stay merged.
+        """
+        if self.server.endpoints.get(self.path) == self.handle:
+            del self.server.endpoints[self.path]
+        return
+
+class SharedTask(object):
+    """
+    SharedTask(task, tick)
+
+    A health check task shared by several consumers, run at most once per
+    tick.  A call within tick of the start of the last completed run returns
+    its result (or raises its exception) again; a call made while a run is in
+    progress waits for that run.  Otherwise, the task is run.  A run
+    interrupted by an exception that isn't an Exception (KeyboardInterrupt,
+    SystemExit, etc.) is not recorded, and a caller waiting for it runs the
+    task itself.
+
+    calls counts the calls made, and runs the times the task actually ran.
+    """
+    def __init__(self, task, tick):
+        super(SharedTask, self).__init__()
+        self.task = task
+        self.tick = validate_duration(tick, "tick")
+        self.name = None
+        self.lock = Condition()
+        self.running = False
+        self.calls = 0
+        self.runs = 0
+
+        # The start time and outcome of the last completed run.
+        self.started = None
+        self.result = None
+        self.error = None
+        return
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            while self.running:
+                runs = self.runs
+                while self.running and self.runs == runs:
+                    self.lock.wait()
+                if self.runs != runs:
+                    return self.outcome()
+                # The run was interrupted; run the task ourselves, unless
+                # another caller got there first.
+
+            if self.started is not None and time() - self.started < self.tick:
+                return self.outcome()
+
+            self.running = True
+
+        start = time()
+        result = error = None
+        completed = False
+        try:
+            try:
+                result = self.task()
+            except Exception as e:
+                error = e
+            completed = True
+        finally:
+            # Waiters must be released even if the task raised something
+            # other than an Exception (e.g. KeyboardInterrupt).
+            with self.lock:
+                self.running = False
+                if completed:
+                    self.started = start
+                    self.result = result
+                    self.error = error
+                    self.runs += 1
+                self.lock.notify_all()
+
+        if error is not None:
+            raise error
+        return result
+
+    def outcome(self):
+        """
+        shared_task.outcome() -> result
+
+        Return the result of the last run, or raise its exception.  The lock
+        must be held.
+        """
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        return "SharedTask(%r)" % (self.task,)
+
+def share_key(task):
+    """
+    share_key(task) -> tuple or None
+
+    Return a key identifying task by its class and constructor parameters
+    (read back from the attributes of the same names), or None if task is not
+    shareable or its parameters can't be determined.
+    """
+    cls = type(task)
+    if not getattr(cls, "shareable", False):
+        return None
+
+    try:
+        parameters = getargspec(cls.__init__).args[1:]
+    except TypeError:
+        return None
+
+    values = []
+    for parameter in parameters:
+        if parameter == "name":
+            continue
+        try:
+            values.append((parameter, freeze(getattr(task, parameter))))
+        except (AttributeError, TypeError):
+            return None
+    return (cls, tuple(values))
+
+def freeze(value):
+    """
+    freeze(value) -> hashable
+
+    Return a hashable equivalent of a parameter value, raising TypeError if
+    there is none.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    hash(value)
+    return value
+
+def describe_node(task, node_id):
+    """
+    describe_node(task, node_id) -> dict
+
+    Return the description of a node of the graph, before its consumers,
+    components and children are filled in.
+    """
+    node = {"id": node_id, "type": type(task).__name__, "task": repr(task),
+            "children": [], "consumers": [], "components": []}
+    if isinstance(task, SharedTask):
+        node["type"] = type(task.task).__name__
+        node["task"] = repr(task.task)
+        node["calls"] = task.calls
+        node["runs"] = task.runs
+        node["tick"] = task.tick
+    return node
@@ -1,10 +1,21 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
 from logging import getLogger
+from math import ceil
 from six.moves.BaseHTTPServer import BaseHTTPRequestHandler
 from six.moves.http_client import (
-    INTERNAL_SERVER_ERROR, NOT_FOUND, OK, SERVICE_UNAVAILABLE)
+    FORBIDDEN, INTERNAL_SERVER_ERROR, NOT_FOUND, OK, SERVICE_UNAVAILABLE)
+import socket
 from threading import local
+from .errorlog import ErrorLog
+from .fastparse import parse_probe
+
+# The client address given to connections over a Unix domain socket.
+UNIX_CLIENT = "unix"
+
+# Unknown components and failed checks, which can arrive in storms; see
+# failover.errorlog.
+error_log = ErrorLog(getLogger("failover.handler"))
 
 class FailoverRequestHandler(BaseHTTPRequestHandler):
     """
@@ -12,6 +23,34 @@ class FailoverRequestHandler(BaseHTTPRequestHandler):
     what properties and methods are available, see:
     https://docs.python.org/2/library/basehttpserver.html
     """
+    # True for requests forwarded from a prefork worker, which have already
+    # been admitted by the worker.
+    proxied = False
+
+    # True for connections over a Unix domain socket (see
+    # HealthCheckServer's unix_socket).
+    unix = False
+
+    # Set once a response to the current request has been sent.
+    responded = False
+
+    def setup(self):
+        """
+        Prepare the connection, allowing it to be kept open between requests
+        if the server is configured to.
+        """
+        if getattr(self.request, "family", None) == socket.AF_UNIX:
+            # Unix domain clients are unnamed; give them an address that
+            # works wherever a TCP client's would (logs, admission control).
+            self.unix = True
+            self.client_address = (UNIX_CLIENT, 0)
+
+        if self.server.keep_alive:
+            # Requests on idle connections time out after this long.
+            self.protocol_version = "HTTP/1.1"
+            self.timeout = self.server.keep_alive_timeout
+        return BaseHTTPRequestHandler.setup(self)
+
     def handle_one_request(self):
         """
         Handle a single HTTP request, setting and clearing the current
@@ -19,16 +58,37 @@ class FailoverRequestHandler(BaseHTTPRequestHandler):
         """
         global thread_local
         thread_local.current_handler = self
+
+        # Headers that tasks want added to the response; see respond().
+        self.response_headers = {}
+
+        # POST handlers such as Oneshot.fire() may respond themselves.
+        self.responded = False
         try:
             return BaseHTTPRequestHandler.handle_one_request(self)
         finally:
             del thread_local.current_handler
 
+    def parse_request(self):
+        """
+        Parse the request, using the fast probe parser (see
+        failover.fastparse) if the server enables it and the request is
+        simple enough.
+        """
+        if self.server.fast_parser:
+            result = parse_probe(self)
+            if result is not None:
+                return result
+        return BaseHTTPRequestHandler.parse_request(self)
+
     def do_GET(self):
         """
         Routes a health check request to the appropriate component.
         """
         log = getLogger("failover.get")
+        endpoint = self.server.endpoints.get(self.path.split("?", 1)[0])
+        if endpoint is not None:
+            return endpoint(self)
         return self.select_and_run_component(self.server.get_handlers, log)
 
     def do_HEAD(self):
@@ -43,6 +103,10 @@ class FailoverRequestHandler(BaseHTTPRequestHandler):
         Routes an update to the appropriate component.
         """
         log = getLogger("failover.post")
+        if self.server.unix_post_only and not self.unix:
+            log.warning("Refused POST for %s from %s over TCP", self.path,
+                        self.client_address[0])
+            return self.respond(FORBIDDEN, u"FORBIDDEN")
         return self.select_and_run_component(self.server.post_handlers, log)
 
     def select_and_run_component(self, component_map, log):
@@ -57,20 +121,66 @@ class FailoverRequestHandler(BaseHTTPRequestHandler):
         log.debug("Converted path %r to component_name %r", self.path,
                   component_name)
 
+        # Turn away excess requests before doing any work for them.
+        admission = self.server.admission
+        if admission is None or self.proxied:
+            return self.route_component(component_map, component_name, log,
+                                        None)
+
+        retry_after = admission.admit(self.client_address[0])
+        if retry_after is not None:
+            return self.reject(component_name, retry_after, log)
+
+        try:
+            return self.route_component(component_map, component_name, log,
+                                        admission)
+        finally:
+            admission.release()
+
+    def route_component(self, component_map, component_name, log, admission):
+        """
+        Locates a component and executes it, subject to the concurrency
+        limits of admission (if not None).
+        """
+        # In a prefork worker, stateful components are run by the state
+        # owner process so that every worker gives the same answer.
+        owner = self.server.owner
+        if owner is not None and component_name in owner.shared:
+            return owner.forward(self, component_name)
+
         try:
             component = component_map[component_name]
         except KeyError:
             # We don't know about this -- return a 404 (NOT_FOUND) and error
             # FIXME: This should be a 400 (Bad method) for POSTs that are
             # invalid.
-            log.error("Unknown component %s", component_name)
+            error_log.error("Unknown component %s", component_name)
             return self.respond(NOT_FOUND, u"ERROR")
 
+        if admission is None:
+            return self.run_component(component, component_name, log)
+
+        if not admission.acquire(component_name):
+            return self.reject(component_name, 1.0, log)
+
+        try:
+            return self.run_component(component, component_name, log)
+        finally:
+            admission.finish(component_name)
+
+    def run_component(self, component, component_name, log):
+        """
+        Executes a component and reports its result.
+        """
         # Call the specific check function and see whether the component
         # is healthy.
         try:
             log.info("Invoking health check for component %s", component_name)
-            if component():
+            result = component()
+            if self.responded:
+                # The component has answered the request itself.
+                return
+            if result:
                 # Healthy.  Indicate OK.
                 log.info("Health check for component %s passed", component_name)
                 return self.respond(OK, u"OK")
@@ -80,26 +190,82 @@ class FailoverRequestHandler(BaseHTTPRequestHandler):
                 return self.respond(SERVICE_UNAVAILABLE, u"FAIL")
         except Exception as e:
             # Health check error
-            log.error("Health check for component %s raised an exception",
-                      component_name, exc_info=True)
+            error_log.error("Health check for component %s raised an "
+                            "exception", component_name, exc_info=True)
             return self.respond(INTERNAL_SERVER_ERROR, u"ERROR")
 
-    def respond(self, code, message):
-        self.send_response(code)
+    def reject(self, component_name, retry_after, log):
+        """
+        Turns away a request without running its component, asking the
+        client to retry after retry_after seconds.
+        """
+        log.debug("Rejected request for component %s; retry after %.3fs",
+                  component_name, retry_after)
+        return self.respond(
+            SERVICE_UNAVAILABLE, u"BUSY",
+            headers={"Retry-After": str(max(1, int(ceil(retry_after))))})
+
+    def respond(self, code, message, headers=None,
+                content_type="text/plain; charset=utf-8"):
+        """
+        Send a complete response.  headers, if given, is a mapping of
+        additional headers to send, along with any in response_headers.
 
-        # All of our responses are plaintext UTF-8
+        The status line, headers and body are assembled into one buffer and
+        written with a single call, rather than piecemeal through
+        send_response() and send_header() (which, on Python 2, write each
+        line to the unbuffered socket as it goes).
+        """
+        self.log_request(code)
+        self.responded = True
+
+        # Unless otherwise specified, responses are plaintext UTF-8
         message = message.encode("utf-8")
-        self.send_header("Content-Type", "text/plain; charset=utf-8")
-        self.send_header("Content-Length", str(len(message)))
+        parts = []
+
+        if self.request_version != "HTTP/0.9":
+            reason = self.responses.get(code, ("",))[0]
+            lines = [
+                "%s %d %s" % (self.protocol_version, code, reason),
+                "Server: %s" % (self.version_string(),),
+                "Date: %s" % (self.date_time_string(),),
+                "Content-Type: %s" % (content_type,),
+                "Content-Length: %d" % (len(message),),
+            ]
+            all_headers = dict(self.response_headers)
+            all_headers.update(headers or {})
+            for name, value in sorted(all_headers.items()):
+                lines.append("%s: %s" % (name, value))
+
+            # Close the connection unless the server allows keep-alive (see
+            # setup()) and the client asked for it.  Request bodies aren't
+            # necessarily read, so connections never outlive other methods.
+            if self.command not in ("GET", "HEAD"):
+                self.close_connection = True
+            if self.close_connection:
+                lines.append("Connection: close")
+            elif self.request_version != "HTTP/1.1":
+                lines.append("Connection: keep-alive")
+            lines.extend(("", ""))
+            parts.append("\r\n".join(lines).encode("latin-1"))
+        else:
+            self.close_connection = True
 
-        # Always close the connection
-        self.send_header("Connection", "close")
-        self.end_headers()
-        
         # Don't send a response if we have a HEAD request.
         if self.command != "HEAD":
-            self.wfile.write(message)
+            parts.append(message)
+
+        self.wfile.write(b"".join(parts))
         return
+
+    def address_string(self):
+        """
+        Return the client address for logging.  Unix domain clients have no
+        host name to look up.
+        """
+        if self.unix:
+            return UNIX_CLIENT
+        return BaseHTTPRequestHandler.address_string(self)
 # end FailoverRequestHandler
 
 # Thread-local data; used for storing the current request handler
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from logging import getLogger
+from six.moves.http_client import HTTPConnection, HTTPException, HTTPSConnection
+from .pool import default_pool
+from .tcp import TCPCheck
+from .units import ok, fail, second
+from .validation import validate_duration
+import socket
+
+log = getLogger("failover.http")
+
+class HTTPCheck(TCPCheck):
+    """
+    HTTPCheck(host, port=None, path="/", method="GET", timeout=second(10),
+              read_timeout=second(10), expected_status=200, tls=False,
+              tls_context=None, headers=None, keep_alive=True, max_idle=2,
+              max_body_size=65536, source_host=None, source_port=None,
+              pool=None, name=None)
+
+    Create an HTTPCheck object that performs a healthcheck on an HTTP service
+    when called.  The check succeeds if the request completes and the response
+    status is expected_status (an integer or a collection of integers).
+
+    Port defaults to 443 if tls is True, 80 otherwise.  If tls is True, the
+    connection is made over TLS using tls_context (an ssl.SSLContext; the
+    system default context is used if this is None).
+
+    The timeout parameter limits the time spent connecting (including the TLS
+    handshake); read_timeout limits the time spent waiting for each read of
+    the response.  At most max_body_size bytes of the response body are read;
+    connections with unread data are discarded rather than reused.
+
+    If keep_alive is True, connections are kept open between checks and
+    reused.  Idle connections are held by pool (a failover.pool.ConnectionPool;
+    by default, the pool shared by all checks), so checks of the same
+    destination share them; up to max_idle are kept for this destination.  A
+    request that fails on a reused connection is retried once on a fresh
+    connection, since the server may have closed an idle connection in the
+    meantime.
+    """
+
+    def __init__(self, host, port=None, path="/", method="GET",
+                 timeout=second(10), read_timeout=second(10),
+                 expected_status=200, tls=False, tls_context=None,
+                 headers=None, keep_alive=True, max_idle=2,
+                 max_body_size=65536, source_host=None, source_port=None,
+                 pool=None, name=None):
+        if port is None:
+            port = 443 if tls else 80
+
+        super(HTTPCheck, self).__init__(
+            host=host, port=port, timeout=timeout, source_host=source_host,
+            source_port=source_port, name=name)
+        self.path = path
+        self.method = method
+        self.read_timeout = validate_duration(read_timeout, "read_timeout")
+
+        if isinstance(expected_status, int):
+            expected_status = (expected_status,)
+        self.expected_status = frozenset(int(s) for s in expected_status)
+
+        self.tls = bool(tls)
+        self.tls_context = tls_context
+        self.headers = dict(headers or {})
+        self.keep_alive = bool(keep_alive)
+        if not self.keep_alive:
+            self.headers["Connection"] = "close"
+
+        self.max_idle = int(max_idle)
+        self.max_body_size = int(max_body_size)
+        if self.max_body_size < 0:
+            raise ValueError("max_body_size must be a non-negative integer")
+
+        self.pool = default_pool() if pool is None else pool
+
+        # Connections are interchangeable if they have the same destination,
+        # TLS settings and source address.
+        self.pool_key = (self.host, self.port, self.tls, self.tls_context,
+                         self.source_host, self.source_port)
+        return
+
+    @property
+    def idle(self):
+        """
+        The idle connections to this check's destination.
+        """
+        return self.pool.connections(self.pool_key)
+
+    def __call__(self):
+        connection = None
+        if self.keep_alive:
+            connection = self.pool.checkout(self.pool_key)
+        reused = connection is not None
+
+        while True:
+            if connection is None:
+                try:
+                    log.info("Connecting to %s:%d", self.host, self.port)
+                    connection = self.create_connection()
+                except (socket.error, HTTPException, ValueError) as e:
+                    # ssl.CertificateError is a ValueError on older Pythons.
+                    log.info("Connection to %s:%d failed: %s", self.host,
+                             self.port, e)
+                    return fail
+
+            try:
+                status, body, reusable = self.request(connection)
+                break
+            except (socket.error, HTTPException) as e:
+                connection.close()
+                connection = None
+
+                if not reused:
+                    log.info("Request to %s:%d%s failed: %s", self.host,
+                             self.port, self.path, e)
+                    return fail
+
+                log.info("Request on reused connection to %s:%d failed: %s; "
+                         "retrying on a new connection", self.host, self.port,
+                         e)
+                reused = False
+
+        if reusable:
+            self.pool.checkin(self.pool_key, connection, self.max_idle)
+        else:
+            connection.close()
+
+        return self.evaluate(status, body)
+
+    def evaluate(self, status, body):
+        """
+        http_check.evaluate(status, body) -> bool
+
+        Judge the response status and (possibly truncated) body, returning ok
+        or fail.
+        """
+        if status in self.expected_status:
+            log.info("Request to %s:%d%s returned %d", self.host, self.port,
+                     self.path, status)
+            return ok
+
+        log.info("Request to %s:%d%s returned %d; expected %s", self.host,
+                 self.port, self.path, status, sorted(self.expected_status))
+        return fail
+
+    def create_connection(self):
+        """
+        http_check.create_connection() -> HTTPConnection
+
+        Open a new connection to the target, applying the connect timeout to
+        the connection (and TLS handshake) and the read timeout thereafter.
+        """
+        source_address = None
+        if self.source_host or self.source_port:
+            source_address = (self.source_host, self.source_port)
+
+        if self.tls:
+            connection = HTTPSConnection(
+                self.host, self.port, timeout=self.timeout,
+                source_address=source_address, context=self.tls_context)
+        else:
+            connection = HTTPConnection(
+                self.host, self.port, timeout=self.timeout,
+                source_address=source_address)
+
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+    def request(self, connection):
+        """
+        http_check.request(connection) -> (int, bytes, bool)
+
+        Issue the check request on the given connection, returning the
+        response status, up to max_body_size bytes of the body, and whether
+        the connection can be reused.
+        """
+        connection.request(self.method, self.path, headers=self.headers)
+        response = connection.getresponse()
+        body = response.read(self.max_body_size + 1)
+        if len(body) > self.max_body_size:
+            log.info("Response from %s:%d%s exceeds %d bytes; discarding "
+                     "connection", self.host, self.port, self.path,
+                     self.max_body_size)
+            return response.status, body[:self.max_body_size], False
+
+        reusable = (self.keep_alive and not response.will_close and
+                    response.isclosed())
+        return response.status, body, reusable
+
+    def close(self):
+        """
+        http_check.close()
+
+        Close all idle connections to this check's destination.
+        """
+        self.pool.clear(self.pool_key)
+        return
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        else:
+            return ("HTTPCheck(host=%r, port=%r, path=%r, method=%r, "
+                    "timeout=%r, read_timeout=%r, tls=%r)" % (
+                        self.host, self.port, self.path, self.method,
+                        self.timeout, self.read_timeout, self.tls))
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
 from logging import getLogger
+from threading import Lock
 from time import time
+from .errorlog import ErrorLog
+from .events import Observable
 from .units import count, second, ok
 from .validation import validate_after
 
-class Hysteresis(object):
+# Failures of underlying tasks; see failover.errorlog.
+error_log = ErrorLog(getLogger("failover.hysteresis"))
+
+class Hysteresis(Observable):
     """
     Hysteresis(task, initial_state=ok, ok_after=count(1), fail_after=count(1),
                name=None)
@@ -22,9 +28,20 @@ class Hysteresis(object):
     If the underlying task does meet these criteria, the current state is
     retained.
 
-    Exceptions raised by the underlying task are logged and dropped.  These
-    effects are ignored by Hysteresis.
+    Exceptions raised by the underlying task are logged (at most once per
+    minute for identical exceptions; see failover.errorlog), counted in
+    errors, and dropped.  These effects are ignored by Hysteresis.
+
+    Observers (see failover.events.Observable) are notified when the state
+    changes.
+
+    Hysteresis objects may be called from several threads at once.  The
+    underlying task runs without any lock held; only the bookkeeping of its
+    result is serialized, by a lock private to each object.
     """
+    # See failover.events.Observable.
+    state_attribute = "current_state"
+
     def __init__(self, task, initial_state=ok, fail_after=count(1),
                  ok_after=count(1), name=None):
         super(Hysteresis, self).__init__()
@@ -34,7 +51,9 @@ class Hysteresis(object):
         self.ok_after = validate_after(ok_after, "ok_after")
         self.disagree_count = 0
         self.disagree_start = None
+        self.errors = 0
         self.name = name
+        self.lock = Lock()
         return
 
     def __call__(self):
@@ -45,12 +64,26 @@ class Hysteresis(object):
         try:
             next_state = bool(self.task())
         except Exception as e:
-            log.error("Underlying task failed; ignoring this response and "
-                      "returning current state %s",
-                      ("OK" if self.current_state else "FAIL"),
-                      exc_info=True)
+            self.errors += 1
+            error_log.error("Underlying task %r failed; ignoring this "
+                            "response and returning current state %s",
+                            self.task,
+                            ("OK" if self.current_state else "FAIL"),
+                            exc_info=True)
             return self.current_state
 
+        with self.lock:
+            return self.record(next_state)
+
+    def record(self, next_state):
+        """
+        hysteresis.record(next_state) -> bool
+
+        Account for a result of the underlying task, returning the (possibly
+        new) current state.  The lock must be held.
+        """
+        log = getLogger("failover.hysteresis")
+
         if next_state != self.current_state:
             now = time()
 
@@ -75,7 +108,7 @@ class Hysteresis(object):
                 after = self.fail_after
 
             # Are we doing count-based or time-based?
-            if after.unit.canonical() is second:
+            if after.unit is second:
                 disagree = second(disagree_time)
             else:
                 disagree = count(self.disagree_count)
@@ -86,9 +119,13 @@ class Hysteresis(object):
                          "new state %s", disagree, after,
                          ("OK" if next_state else "FAIL"))
                 # Yep; set the new state.
+                old_state = self.current_state
                 self.current_state = next_state
                 self.disagree_count = 0
                 self.disagree_start = None
+                self.state_changed(old_state, next_state,
+                                   "Disagreement %s exceeds threshold %s" %
+                                   (disagree, after))
             else:
                 log.info("Disagreement %s does not exceed threshold %s; "
                          "staying in current state %s", disagree, after,
@@ -96,6 +133,36 @@ class Hysteresis(object):
 
         return self.current_state
 
+    def save_state(self):
+        """
+        hysteresis.save_state() -> dict
+
+        Return a JSON-serializable snapshot of the current state, including
+        any disagreement in progress.  See failover.snapshot.StateSnapshot.
+        """
+        with self.lock:
+            return {
+                "current_state": self.current_state,
+                "disagree_count": self.disagree_count,
+                "disagree_start": self.disagree_start,
+            }
+
+    def restore_state(self, state):
+        """
+        hysteresis.restore_state(state)
+
+        Restore a snapshot previously returned by save_state().
+        """
+        with self.lock:
+            old_state = self.current_state
+            self.current_state = bool(state["current_state"])
+            self.disagree_count = int(state.get("disagree_count", 0))
+            self.disagree_start = state.get("disagree_start")
+            if self.current_state != old_state:
+                self.state_changed(old_state, self.current_state,
+                                   "Restored from snapshot")
+        return
+
     def __repr__(self):
         if self.name is not None:
             return self.name
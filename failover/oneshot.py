@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
-from .handler import current_handler
 from logging import getLogger
-from six.moves.http_client import UNAUTHORIZED, OK
+from threading import Lock
+from .events import Observable
 from .units import ok, fail
 
-class Oneshot(object):
+class Oneshot(Observable):
     """
     Oneshot(default_state=fail, auth=None, name=None)
 
@@ -17,44 +17,99 @@ class Oneshot(object):
 
     This is typically combined with a Toggle object to enable manual reset
     on a task.
+
+    Observers (see failover.events.Observable) are notified when the object
+    is armed and when it returns to its default state.
+
+    Oneshot objects may be called and fired from several threads at once;
+    an armed object returns the opposite result to exactly one caller.
     """
+    # See failover.events.Observable.
+    state_attribute = "next_state"
+
     def __init__(self, default_state=fail, auth=None, name=None):
         super(Oneshot, self).__init__()
         self.default_state = default_state
         self.next_state = default_state
         self.auth = auth
         self.name = name
+        self.lock = Lock()
         return
 
     def __call__(self):
-        result = self.next_state
-        self.next_state = self.default_state
+        if self.next_state == self.default_state:
+            # Not armed; nothing to reset, so don't bother with the lock.
+            return self.default_state
+
+        with self.lock:
+            result = self.next_state
+            self.next_state = self.default_state
+            if result != self.default_state:
+                self.state_changed(result, self.default_state, "Fired")
         return result
 
-    def fire(self):
+    def fire(self, authorized=False):
         """
-        oneshot.fire() -> bool
+        oneshot.fire(authorized=False) -> bool
 
         If auth has been set, it is invoked.  If it fails, then no action is
         taken (except providing any existing HTTP handler with a
         "401 Unauthorized" response) and False is returned.
 
+        If authorized is True, the caller has already invoked auth itself
+        (e.g. a prefork worker process) and it is not invoked again.
+
         If auth is not set or succeeds, this object becomes armed (i.e. will
         return the opposite of default_state the next time it is invoked),
         any existing HTTP handler is provided a "200 Ok" response, and True is
         returned.
         """
+        # The HTTP machinery is only needed if this is ever fired.
+        from .handler import current_handler
+        from six.moves.http_client import UNAUTHORIZED, OK
+
         handler = current_handler()
-        if self.auth is not None and not self.auth():
+        if not authorized and self.auth is not None and not self.auth():
             if handler is not None:
                 handler.respond(UNAUTHORIZED, "Invalid credentials")
             return False
 
-        self.next_state = not self.default_state
+        with self.lock:
+            if self.next_state == self.default_state:
+                self.next_state = not self.default_state
+                self.state_changed(self.default_state, self.next_state,
+                                   "Armed")
         if handler is not None:
             handler.respond(OK, "Armed")
         return True
 
+    # See failover.prefork: workers may invoke auth themselves and pass
+    # authorized=True.
+    fire.preauthorized = True
+
+    def save_state(self):
+        """
+        oneshot.save_state() -> dict
+
+        Return a JSON-serializable snapshot of the current state (whether the
+        object is armed).  See failover.snapshot.StateSnapshot.
+        """
+        return {"next_state": self.next_state}
+
+    def restore_state(self, state):
+        """
+        oneshot.restore_state(state)
+
+        Restore a snapshot previously returned by save_state().
+        """
+        with self.lock:
+            old_state = self.next_state
+            self.next_state = bool(state["next_state"])
+            if self.next_state != old_state:
+                self.state_changed(old_state, self.next_state,
+                                   "Restored from snapshot")
+        return
+
     def __repr__(self):
         if self.name is not None:
             return self.name
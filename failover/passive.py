@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+"""
+Passive health checks, fed with the outcomes of an application's own work.
+
+Outcomes are reported one per line, as "ok" or "fail" optionally followed by
+a latency in seconds:
+
+    ok 0.012
+    fail 1.5
+    ok
+
+PassiveCheck.ingest_post() accepts a batch of these as the body of a POST
+request; PassiveListener accepts them in datagrams sent to a UDP or Unix
+domain socket, each line prefixed by the name of the check to update.
+"""
+from __future__ import absolute_import, print_function
+from collections import deque
+from logging import getLogger
+import os
+import socket
+from threading import Lock, Thread
+from time import time
+from .units import ok, fail, second
+from .validation import validate_duration
+
+log = getLogger("failover.passive")
+
+OUTCOMES = {"ok": True, "fail": False}
+
+class PassiveCheck(object):
+    """
+    PassiveCheck(window=second(60), buckets=12, max_error_rate=0.5,
+                 min_events=10, max_latency=None, max_pending=100000,
+                 initial_state=ok, name=None)
+
+    Create a PassiveCheck object that reports the health of an application
+    from the outcomes of its own requests, rather than by probing it.
+
+    Outcomes are reported with record() (or ingest(), ingest_post() or a
+    PassiveListener) and counted in a ring of buckets covering the last
+    window of time.  When called, the check fails if the fraction of failures
+    in the window exceeds max_error_rate or, if max_latency is not None, if
+    the mean latency of the outcomes reporting one exceeds max_latency.  With
+    fewer than min_events outcomes in the window, the previous result
+    (initially, initial_state) is returned.
+
+    Reporting an outcome appends it to a queue without taking a lock; queued
+    outcomes are counted in batches, when the check is called or when more
+    than a thousand are waiting.  At most max_pending outcomes are queued;
+    beyond that, the oldest are dropped.  Memory use is therefore fixed
+    regardless of the rate of outcomes.
+
+    Wrap the check in a Hysteresis to require several consecutive results
+    before changing state, or in a Toggle to act on changes.
+    """
+    # The queue length beyond which record() counts queued outcomes itself.
+    drain_threshold = 1024
+
+    def __init__(self, window=second(60), buckets=12, max_error_rate=0.5,
+                 min_events=10, max_latency=None, max_pending=100000,
+                 initial_state=ok, name=None):
+        super(PassiveCheck, self).__init__()
+        self.window = validate_duration(window, "window")
+        if self.window <= 0:
+            raise ValueError("window must be positive")
+        if not isinstance(buckets, int) or buckets < 1:
+            raise ValueError("buckets must be a positive integer")
+        if (not isinstance(max_error_rate, (int, float)) or
+            not 0 <= max_error_rate <= 1):
+            raise ValueError("max_error_rate must be a number from 0 to 1")
+        if not isinstance(min_events, int) or min_events < 0:
+            raise ValueError("min_events must be a non-negative integer")
+        if not isinstance(max_pending, int) or max_pending < 1:
+            raise ValueError("max_pending must be a positive integer")
+
+        self.buckets = buckets
+        self.bucket_width = self.window / buckets
+        self.max_error_rate = float(max_error_rate)
+        self.min_events = min_events
+        if max_latency is not None:
+            max_latency = validate_duration(max_latency, "max_latency")
+        self.max_latency = max_latency
+        self.state = initial_state
+        self.name = name
+
+        # Outcomes not yet counted, as (time, success, latency) tuples.
+        # deque.append and deque.popleft are atomic, so reporting an outcome
+        # needs no lock.
+        self.pending = deque(maxlen=max_pending)
+
+        # The lock is held while counting outcomes into the buckets.  Each
+        # bucket is [index, successes, failures, latency total, latencies],
+        # where index identifies the span of time (time // bucket_width) it
+        # currently counts.
+        self.lock = Lock()
+        self.counts = [[None, 0, 0, 0.0, 0] for _ in range(buckets)]
+
+        # The number of lines that could not be parsed by ingest().
+        self.malformed = 0
+        return
+
+    def __call__(self):
+        now = time()
+        self.drain(now)
+
+        current = int(now // self.bucket_width)
+        successes = failures = latencies = 0
+        latency_total = 0.0
+        with self.lock:
+            for index, bucket_ok, bucket_fail, bucket_latency, n_latency in \
+                    self.counts:
+                if index is not None and current - index < self.buckets:
+                    successes += bucket_ok
+                    failures += bucket_fail
+                    latency_total += bucket_latency
+                    latencies += n_latency
+
+        total = successes + failures
+        if total < self.min_events or total == 0:
+            log.debug("%r has %d outcomes in its window; keeping state %s",
+                      self, total, "OK" if self.state else "FAIL")
+            return self.state
+
+        error_rate = float(failures) / total
+        state = ok
+        if error_rate > self.max_error_rate:
+            log.info("%r error rate %.3f exceeds %.3f", self, error_rate,
+                     self.max_error_rate)
+            state = fail
+        elif (self.max_latency is not None and latencies and
+              latency_total / latencies > self.max_latency):
+            log.info("%r mean latency %.3fs exceeds %.3fs", self,
+                     latency_total / latencies, self.max_latency)
+            state = fail
+
+        self.state = state
+        return state
+
+    def record(self, success, latency=None):
+        """
+        passive_check.record(success, latency=None)
+
+        Report the outcome of one request: whether it succeeded and,
+        optionally, how long it took in seconds.
+        """
+        self.pending.append((time(), success, latency))
+        if len(self.pending) > self.drain_threshold:
+            self.drain(blocking=False)
+        return
+
+    def ingest(self, data):
+        """
+        passive_check.ingest(data) -> int
+
+        Report the outcomes given one per line in data (bytes or text; see
+        failover.passive) and return the number accepted.  Malformed lines
+        are skipped and counted in malformed.
+        """
+        now = time()
+        append = self.pending.append
+        accepted = 0
+        for outcome in parse_outcomes(data):
+            if outcome is None:
+                self.malformed += 1
+            else:
+                append((now, outcome[0], outcome[1]))
+                accepted += 1
+
+        if len(self.pending) > self.drain_threshold:
+            self.drain(now, blocking=False)
+        return accepted
+
+    def ingest_post(self, max_size=65536):
+        """
+        passive_check.ingest_post(max_size=65536) -> bool
+
+        Report the outcomes in the body of the POST request being handled
+        (see ingest()).  This is intended to be passed as the on_post
+        argument of HealthCheckServer.add_component().
+
+        False (and so a 503 response) is returned if there is no request in
+        progress or its body is missing or larger than max_size bytes.
+        """
+        from .handler import current_handler
+
+        handler = current_handler()
+        if handler is None:
+            return False
+
+        try:
+            length = int(handler.headers.get("Content-Length"))
+        except (TypeError, ValueError):
+            length = -1
+
+        if length < 0 or length > max_size:
+            log.warning("Rejecting outcomes for %r from %s: bad or too large "
+                        "Content-Length", self, handler.client_address[0])
+            # The body (if any) hasn't been read.
+            handler.close_connection = True
+            return False
+
+        accepted = self.ingest(handler.rfile.read(length))
+        log.debug("Accepted %d outcomes for %r from %s", accepted, self,
+                  handler.client_address[0])
+        return True
+
+    def drain(self, now=None, blocking=True):
+        """
+        passive_check.drain(now=None, blocking=True)
+
+        Count queued outcomes into the buckets.  If blocking is False and
+        another thread is already doing so, return immediately.
+        """
+        if not self.lock.acquire(blocking):
+            return
+
+        try:
+            if now is None:
+                now = time()
+            width = self.bucket_width
+            n_buckets = self.buckets
+            counts = self.counts
+            oldest = int(now // width) - n_buckets
+            popleft = self.pending.popleft
+
+            while True:
+                try:
+                    when, success, latency = popleft()
+                except IndexError:
+                    break
+
+                index = int(when // width)
+                if index <= oldest:
+                    continue
+
+                bucket = counts[index % n_buckets]
+                if bucket[0] != index:
+                    if bucket[0] is not None and bucket[0] > index:
+                        # An outcome queued before the bucket was reused.
+                        continue
+                    bucket[:] = [index, 0, 0, 0.0, 0]
+
+                if success:
+                    bucket[1] += 1
+                else:
+                    bucket[2] += 1
+                if latency is not None:
+                    bucket[3] += latency
+                    bucket[4] += 1
+        finally:
+            self.lock.release()
+        return
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        else:
+            return "PassiveCheck(window=%g, max_error_rate=%g)" % (
+                self.window, self.max_error_rate)
+
+def parse_outcomes(data):
+    """
+    parse_outcomes(data)
+
+    Yield (success, latency) for each outcome line in data, or None for each
+    malformed line.  Blank lines are ignored.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+
+    for line in data.splitlines():
+        words = line.split()
+        if not words:
+            continue
+
+        success = OUTCOMES.get(words[0].lower())
+        if success is None or len(words) > 2:
+            yield None
+            continue
+
+        latency = None
+        if len(words) == 2:
+            try:
+                latency = float(words[1])
+            except ValueError:
+                yield None
+                continue
+            if not latency >= 0:
+                yield None
+                continue
+
+        yield (success, latency)
+    return
+
+class PassiveListener(Thread):
+    """
+    PassiveListener(address, checks, max_datagram=65507)
+
+    Create and start a thread receiving outcomes for the PassiveCheck objects
+    in checks (a mapping of names to checks) on a datagram socket.  If
+    address is a (host, port) tuple, the socket is a UDP socket; if it is a
+    string, it is the path of a Unix domain socket, which is created (and
+    removed by stop()).
+
+    Each line of a datagram is the name of a check followed by an outcome,
+    e.g. "api ok 0.012".  Lines naming unknown checks are discarded.
+    Datagrams are unacknowledged; nothing is ever sent back.
+    """
+    def __init__(self, address, checks, max_datagram=65507):
+        super(PassiveListener, self).__init__(
+            name="PassiveListener(%s)" % (address,))
+        self.daemon = True
+        self.checks = dict(checks)
+        self.max_datagram = max_datagram
+        self.discarded = 0
+        self.exit_requested = False
+
+        if isinstance(address, tuple):
+            self.path = None
+            family = socket.getaddrinfo(
+                address[0], address[1], 0, socket.SOCK_DGRAM)[0][0]
+            self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        else:
+            self.path = address
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+        try:
+            self.socket.bind(address)
+        except:
+            self.socket.close()
+            raise
+
+        self.address = self.socket.getsockname()
+        # Wake up periodically to check whether to exit.
+        self.socket.settimeout(0.5)
+        self.start()
+        return
+
+    def run(self):
+        while not self.exit_requested:
+            try:
+                datagram = self.socket.recv(self.max_datagram)
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                if self.exit_requested:
+                    break
+                log.error("Receiving outcomes on %s failed: %s", self.address,
+                          e)
+                continue
+
+            try:
+                self.dispatch(datagram)
+            except Exception:
+                log.error("Failed to process outcomes received on %s",
+                          self.address, exc_info=True)
+
+        self.socket.close()
+        return
+
+    def dispatch(self, datagram):
+        """
+        listener.dispatch(datagram)
+
+        Pass each line of a datagram to the check it names.
+        """
+        by_check = {}
+        for line in datagram.decode("utf-8", "replace").splitlines():
+            name, _, outcome = line.strip().partition(" ")
+            if not name:
+                continue
+
+            check = self.checks.get(name)
+            if check is None:
+                self.discarded += 1
+                continue
+            by_check.setdefault(check, []).append(outcome)
+
+        for check, outcomes in by_check.items():
+            check.ingest("\n".join(outcomes))
+        return
+
+    def stop(self):
+        """
+        listener.stop()
+
+        Stop receiving outcomes, wait for the thread to exit and remove the
+        Unix domain socket (if any).
+        """
+        self.exit_requested = True
+        self.join()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        return
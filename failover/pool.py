@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from logging import getLogger
+import select
+import socket
+from threading import Lock
+from time import time
+from .units import second
+from .validation import validate_duration
+
+log = getLogger("failover.pool")
+
+class ConnectionPool(object):
+    """
+    ConnectionPool(max_idle=64, max_idle_per_key=4, max_age=second(300),
+                   idle_timeout=second(30))
+
+    Create a ConnectionPool object holding idle HTTP connections (or other
+    objects with sock and close() attributes) for reuse, keyed by their
+    destination (see HTTPCheck.pool_key for an example).
+
+    At most max_idle connections are kept in total, and at most
+    max_idle_per_key (unless overridden by checkin()) for each key; the least
+    recently used are closed first.  Connections are closed rather than
+    reused once they are older than max_age (counted from when they were
+    first returned to the pool) or have been idle for longer than
+    idle_timeout.  Idle connections are also checked before reuse, and
+    discarded if the peer has closed them or sent unsolicited data.
+
+    ConnectionPool objects may be used from several threads at once.
+    """
+    def __init__(self, max_idle=64, max_idle_per_key=4, max_age=second(300),
+                 idle_timeout=second(30)):
+        super(ConnectionPool, self).__init__()
+        if not isinstance(max_idle, int) or max_idle < 0:
+            raise ValueError("max_idle must be a non-negative integer")
+        if not isinstance(max_idle_per_key, int) or max_idle_per_key < 0:
+            raise ValueError("max_idle_per_key must be a non-negative "
+                             "integer")
+        self.max_idle = max_idle
+        self.max_idle_per_key = max_idle_per_key
+        self.max_age = validate_duration(max_age, "max_age")
+        self.idle_timeout = validate_duration(idle_timeout, "idle_timeout")
+        self.lock = Lock()
+
+        # key -> list of (connection, created, released), least recently
+        # released first.
+        self.idle = {}
+        self.n_idle = 0
+        return
+
+    def checkout(self, key):
+        """
+        pool.checkout(key) -> connection or None
+
+        Remove and return the most recently used idle connection for key that
+        is still usable, or None if there is none.
+        """
+        now = time()
+        stale = []
+        connection = None
+
+        with self.lock:
+            entries = self.idle.get(key)
+            while entries:
+                entry = entries.pop()
+                self.n_idle -= 1
+                if self.usable(entry, now):
+                    connection = entry[0]
+                    break
+                stale.append(entry[0])
+
+            if not entries:
+                self.idle.pop(key, None)
+
+        for candidate in stale:
+            log.debug("Discarding stale connection to %s", key)
+            candidate.close()
+        return connection
+
+    def checkin(self, key, connection, max_idle=None):
+        """
+        pool.checkin(key, connection, max_idle=None)
+
+        Return a connection to the pool after a successful request.  If
+        max_idle is not None, it overrides max_idle_per_key for this key.
+        """
+        now = time()
+        created = getattr(connection, "pool_created", None)
+        if created is None:
+            created = connection.pool_created = now
+
+        if max_idle is None:
+            max_idle = self.max_idle_per_key
+
+        evicted = []
+        with self.lock:
+            if now - created >= self.max_age or max_idle <= 0:
+                evicted.append(connection)
+            else:
+                entries = self.idle.setdefault(key, [])
+                entries.append((connection, created, now))
+                self.n_idle += 1
+
+                while len(entries) > max_idle:
+                    evicted.append(entries.pop(0)[0])
+                    self.n_idle -= 1
+
+                while self.n_idle > self.max_idle:
+                    evicted.append(self.evict_oldest())
+
+        for connection in evicted:
+            connection.close()
+        return
+
+    def evict_oldest(self):
+        """
+        pool.evict_oldest() -> connection
+
+        Remove and return the least recently used idle connection.  The lock
+        must be held and the pool must not be empty.
+        """
+        oldest_key = min(self.idle, key=lambda key: self.idle[key][0][2])
+        entries = self.idle[oldest_key]
+        connection = entries.pop(0)[0]
+        if not entries:
+            del self.idle[oldest_key]
+        self.n_idle -= 1
+        return connection
+
+    def usable(self, entry, now):
+        """
+        pool.usable(entry, now) -> bool
+
+        Indicate whether an idle entry (connection, created, released) is
+        young enough and still open.
+        """
+        connection, created, released = entry
+        if (now - created >= self.max_age or
+            now - released >= self.idle_timeout):
+            return False
+
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            return False
+
+        try:
+            # An idle connection has nothing to read: if it is readable, the
+            # peer has closed it (or is confused).
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (socket.error, select.error, ValueError):
+            return False
+        return not readable
+
+    def connections(self, key):
+        """
+        pool.connections(key) -> list
+
+        Return the idle connections for key, least recently used first.
+        """
+        with self.lock:
+            return [entry[0] for entry in self.idle.get(key, ())]
+
+    def clear(self, key=None):
+        """
+        pool.clear(key=None)
+
+        Close the idle connections for key, or all idle connections if key is
+        None.
+        """
+        with self.lock:
+            if key is None:
+                idle, self.idle = self.idle, {}
+            else:
+                entries = self.idle.pop(key, [])
+                idle = {key: entries} if entries else {}
+            for entries in idle.values():
+                self.n_idle -= len(entries)
+
+        for entries in idle.values():
+            for entry in entries:
+                entry[0].close()
+        return
+
+# The ConnectionPool used by checks that don't specify one.
+shared_pool = None
+shared_pool_lock = Lock()
+
+def default_pool():
+    """
+    default_pool() -> ConnectionPool
+
+    Return the shared ConnectionPool, creating it if necessary.
+    """
+    global shared_pool
+    if shared_pool is None:
+        with shared_pool_lock:
+            if shared_pool is None:
+                shared_pool = ConnectionPool()
+    return shared_pool
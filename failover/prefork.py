@@ -0,0 +1,668 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from functools import partial
+from json import dumps, loads
+from logging import getLogger
+from multiprocessing import cpu_count
+import os
+from select import select
+import signal
+from six.moves.http_client import INTERNAL_SERVER_ERROR, UNAUTHORIZED
+import socket
+from tempfile import mkdtemp
+from threading import active_count, Lock, Thread
+from .handler import FailoverRequestHandler, thread_local
+from .snapshot import SUBTASK_ATTRIBUTES
+
+log = getLogger("failover.prefork")
+
+class PreforkServer(object):
+    """
+    PreforkServer(server, workers=None, shared=None, socket_path=None)
+
+    Serve the components of server (a HealthCheckServer created with
+    reuse_port=True) from several worker processes, each listening on the
+    same port via SO_REUSEPORT, so that request handling is not limited to a
+    single core.
+
+    Stateful components (those whose task tree includes a Hysteresis, Toggle,
+    Oneshot, Background or anything else providing save_state()) and those
+    with a POST handler cannot simply be copied into each worker: each copy
+    would evolve separately and workers would disagree.  Instead, these are
+    run by a state owner thread in the parent process, and workers forward
+    requests for them over a Unix domain socket at socket_path.  Other
+    components run directly in the workers.  shared may be given to override
+    which component names are forwarded.
+
+    POST requests are authenticated in the worker when the POST handler is
+    marked as accepting requests authenticated by its caller (see
+    worker_auth(); Oneshot.fire is), so that expensive password hashing is
+    spread across workers too.
+
+    workers defaults to the number of CPUs.  All components must be added
+    before serve_forever() is called.
+
+    Workers are forked by a spawner process (see Spawner), itself forked
+    before the state owner starts any threads.  No worker (including one
+    restarted after a crash) is then forked from a process running threads,
+    provided no other threads are running when serve_forever() is called.
+    Background tasks start their threads when created unless given
+    start_thread=False, so they should be created with start_thread=False:
+    serve_forever() starts any threads in the components' task trees that
+    haven't been started once the spawner exists, and shutdown() stops them.
+    A warning is logged if other threads are already running.
+    """
+    def __init__(self, server, workers=None, shared=None, socket_path=None):
+        super(PreforkServer, self).__init__()
+        if not getattr(server, "reuse_port", False):
+            raise ValueError("server must be created with reuse_port=True")
+
+        self.server = server
+        self.workers = int(workers or cpu_count())
+        if self.workers <= 0:
+            raise ValueError("workers must be a positive integer")
+
+        self.shared = None if shared is None else frozenset(shared)
+        self.socket_path = socket_path
+        self.socket_dir = None
+        self.pids = {}
+        self.owner = None
+        self.spawner = None
+        self.threads = []
+        self.exit_requested = False
+        self.poll_interval = 0.1
+        return
+
+    def serve_forever(self):
+        """
+        prefork.serve_forever()
+
+        Start the state owner and worker processes, restarting any worker
+        that exits unexpectedly, until shutdown() is called.
+        """
+        shared = self.shared
+        if shared is None:
+            shared = shared_components(self.server)
+
+        if self.socket_path is None:
+            self.socket_dir = mkdtemp()
+            self.socket_path = self.socket_dir + "/owner.sock"
+
+        if active_count() > 1:
+            log.warning("%d threads are running; workers forked now may "
+                        "deadlock on locks they hold.  Create Background "
+                        "tasks with start_thread=False so they start after "
+                        "forking.", active_count())
+
+        # Listen before forking so workers can connect right away, but don't
+        # start any threads until the spawner, which forks every worker
+        # (including any restarted later), exists.
+        self.threads = unstarted_threads(self.server)
+        self.owner = StateOwner(self.socket_path, self.server)
+        self.spawner = Spawner(self, shared)
+        for thread in self.threads:
+            thread.start()
+
+        # Every worker binds its own socket; we don't accept on ours.
+        self.server.socket.close()
+
+        try:
+            for index in range(self.workers):
+                self.spawner.spawn(index)
+            while len(self.pids) < self.workers:
+                for message in self.spawner.messages(None):
+                    self.report(message)
+
+            self.owner.start()
+            while not self.exit_requested:
+                for message in self.spawner.messages(self.poll_interval):
+                    self.report(message)
+        except KeyboardInterrupt:
+            pass
+        except socket.error as e:
+            if not self.exit_requested:
+                log.error("Worker spawner exited unexpectedly: %s", e)
+
+        self.shutdown()
+        self.spawner.close()
+        return
+
+    def report(self, message):
+        """
+        prefork.report(message)
+
+        Account for a report from the spawner of a worker that has started
+        or exited, restarting a worker that exited unexpectedly.
+        """
+        pid = message["pid"]
+        if "started" in message:
+            self.pids[pid] = message["started"]
+            return
+
+        index = self.pids.pop(pid, message["exited"])
+        if not self.exit_requested:
+            log.error("Worker %d (pid %d) exited with status %d; restarting",
+                      index, pid, message["status"])
+            self.spawner.spawn(index)
+        return
+
+    def run_worker(self, index, shared):
+        """
+        prefork.run_worker(index, shared)
+
+        Serve requests in a worker process.  This does not return until the
+        worker is killed.
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        self.owner.listener.close()
+
+        # Each worker binds its own socket to the same port; the kernel
+        # balances incoming connections across them.  The socket inherited
+        # from the parent is closed, and must not be used.
+        server = self.server
+        server.socket.close()
+        server.socket = socket.socket(server.address_family,
+                                      server.socket_type)
+        server.server_bind()
+        server.server_activate()
+
+        server.owner = OwnerClient(self.socket_path, shared)
+        log.info("Worker %d (pid %d) serving on port %d", index, os.getpid(),
+                 server.server_address[1])
+        server.serve_forever()
+        return
+
+    def shutdown(self):
+        """
+        prefork.shutdown()
+
+        Stop all worker processes and the state owner.
+        """
+        self.exit_requested = True
+        if self.spawner is not None:
+            self.spawner.stop()
+        self.pids.clear()
+
+        if self.owner is not None:
+            self.owner.close()
+
+        for thread in self.threads:
+            if hasattr(thread, "stop"):
+                thread.stop()
+        self.threads = []
+
+        if self.socket_dir is not None:
+            try:
+                os.rmdir(self.socket_dir)
+            except OSError:
+                pass
+        return
+
+def is_stateful(task):
+    """
+    is_stateful(task) -> bool
+
+    Indicates whether task, or any task it wraps, keeps state between calls.
+    """
+    if hasattr(task, "save_state") or isinstance(task, Thread):
+        return True
+
+    for attr in SUBTASK_ATTRIBUTES:
+        subtask = getattr(task, attr, None)
+        if subtask is not None and is_stateful(subtask):
+            return True
+
+    return False
+
+def find_threads(task, result):
+    """
+    find_threads(task, result)
+
+    Append to result the threads in the tree of task (which may include
+    task itself) that have not been started and aren't in result already.
+    """
+    if (isinstance(task, Thread) and task.ident is None and
+        not any(thread is task for thread in result)):
+        result.append(task)
+
+    for attr in SUBTASK_ATTRIBUTES:
+        subtask = getattr(task, attr, None)
+        if subtask is not None:
+            find_threads(subtask, result)
+    return
+
+def unstarted_threads(server):
+    """
+    unstarted_threads(server) -> list
+
+    Return the threads in the task trees of server's components (such as
+    Background tasks created with start_thread=False) that have not been
+    started.
+    """
+    result = []
+    for task in server.get_handlers.values():
+        find_threads(task, result)
+    return result
+
+def shared_components(server):
+    """
+    shared_components(server) -> frozenset
+
+    Return the names of the components of server that must be run by the
+    state owner: those that are stateful or have a POST handler.
+    """
+    shared = set(server.post_handlers)
+    for name, task in server.get_handlers.items():
+        if is_stateful(task):
+            shared.add(name)
+    return frozenset(shared)
+
+class Spawner(object):
+    """
+    Spawner(prefork, shared)
+
+    Fork a spawner process, which forks the workers of prefork (a
+    PreforkServer) on request and reports each worker started or exited.
+
+    A process forked while other threads are running inherits any locks they
+    hold (the logging module's, for example) but not the threads, and may
+    deadlock on them.  The spawner is forked before the state owner (or any
+    Background task created with start_thread=False) starts any threads, and
+    never starts any itself, so workers are forked from a single-threaded
+    process as long as no other threads were running when it was forked (see
+    PreforkServer).  It terminates its workers and exits when stopped, or
+    when the connection to the PreforkServer's process closes.
+    """
+    def __init__(self, prefork, shared):
+        super(Spawner, self).__init__()
+        self.buffer = b""
+        self.connection, child = socket.socketpair()
+        self.pid = os.fork()
+        if self.pid != 0:
+            child.close()
+            return
+
+        self.connection.close()
+        try:
+            self.run(prefork, shared, child)
+        except SystemExit:
+            pass
+        except BaseException:
+            log.error("Worker spawner failed", exc_info=True)
+        finally:
+            os._exit(0)
+
+    def spawn(self, index):
+        """
+        spawner.spawn(index)
+
+        Ask the spawner to fork worker number index.
+        """
+        send_message(self.connection, {"spawn": index})
+        return
+
+    def messages(self, timeout):
+        """
+        spawner.messages(timeout) -> list
+
+        Wait up to timeout seconds (or indefinitely, if timeout is None) for
+        reports from the spawner, returning those received.  Raises
+        socket.error if the spawner has exited.
+        """
+        if not select([self.connection], [], [], timeout)[0]:
+            return []
+
+        data = self.connection.recv(4096)
+        if not data:
+            raise socket.error("Worker spawner closed connection")
+        return self.receive(data)
+
+    def receive(self, data):
+        """
+        spawner.receive(data) -> list
+
+        Return the messages completed by data received from the other end of
+        the connection.
+        """
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        return [loads(line.decode("utf-8")) for line in lines]
+
+    def stop(self):
+        """
+        spawner.stop()
+
+        Stop the spawner and its workers, waiting for them to exit.
+        """
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+            os.waitpid(self.pid, 0)
+        except OSError:
+            # Already stopped (possibly by another thread).
+            pass
+        return
+
+    def close(self):
+        """
+        spawner.close()
+
+        Close the connection to the spawner.
+        """
+        self.connection.close()
+        return
+
+    def run(self, prefork, shared, connection):
+        """
+        spawner.run(prefork, shared, connection)
+
+        The body of the spawner process.
+        """
+        signal.signal(signal.SIGTERM, exit_on_signal)
+        signal.signal(signal.SIGINT, exit_on_signal)
+
+        # Only workers accept connections.
+        prefork.server.socket.close()
+        prefork.owner.listener.close()
+
+        workers = {}
+        try:
+            while True:
+                if select([connection], [], [], prefork.poll_interval)[0]:
+                    data = connection.recv(4096)
+                    if not data:
+                        break
+
+                    for message in self.receive(data):
+                        index = message["spawn"]
+                        pid = os.fork()
+                        if pid == 0:
+                            connection.close()
+                            run_worker_process(prefork, index, shared)
+                        workers[pid] = index
+                        send_message(connection,
+                                     {"started": index, "pid": pid})
+
+                while workers:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                    if pid == 0:
+                        break
+                    index = workers.pop(pid, None)
+                    if index is not None:
+                        send_message(connection, {"exited": index, "pid": pid,
+                                                  "status": status})
+        finally:
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+            for pid in workers:
+                try:
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+        return
+
+def run_worker_process(prefork, index, shared):
+    """
+    run_worker_process(prefork, index, shared)
+
+    Run worker number index of prefork in a newly forked process, exiting the
+    process when it returns.
+    """
+    try:
+        prefork.run_worker(index, shared)
+    except BaseException:
+        log.error("Worker %d failed", index, exc_info=True)
+    finally:
+        os._exit(0)
+
+def worker_auth(on_post):
+    """
+    worker_auth(on_post) -> callable or None
+
+    Return the auth callable a worker should invoke before forwarding a POST
+    request to the handler on_post, or None if on_post authenticates requests
+    itself.  Workers only authenticate requests for methods marked with a
+    true preauthorized attribute, which must accept authorized=True to skip
+    authentication (as Oneshot.fire does), of objects with an auth attribute.
+    """
+    if not getattr(on_post, "preauthorized", False):
+        return None
+    return getattr(getattr(on_post, "__self__", None), "auth", None)
+
+def exit_on_signal(signum, frame):
+    """
+    Signal handler raising SystemExit, so cleanup code runs.
+    """
+    raise SystemExit(0)
+
+def send_message(connection, message):
+    """
+    send_message(connection, message)
+
+    Send a message (a JSON-serializable object) over a socket, as a line of
+    JSON.
+    """
+    connection.sendall((dumps(message) + "\n").encode("utf-8"))
+    return
+
+class OwnerClient(object):
+    """
+    OwnerClient(path, shared)
+
+    The worker side of the connection to the state owner.  Requests for
+    components named in shared are forwarded to the owner listening at path.
+    """
+    def __init__(self, path, shared):
+        super(OwnerClient, self).__init__()
+        self.path = path
+        self.shared = shared
+        self.connection = None
+        self.reader = None
+        self.lock = Lock()
+        return
+
+    def forward(self, handler, component_name):
+        """
+        owner_client.forward(handler, component_name)
+
+        Forward the request being handled by handler to the state owner and
+        relay its response.
+        """
+        request = {
+            "method": handler.command,
+            "component": component_name,
+            "authorization": handler.headers.get("Authorization"),
+        }
+
+        try:
+            if handler.command == "POST":
+                auth = worker_auth(
+                    handler.server.post_handlers.get(component_name))
+                if auth is not None:
+                    if not auth():
+                        return handler.respond(UNAUTHORIZED,
+                                               u"Invalid credentials")
+                    request["authorized"] = True
+
+            response = self.call(request)
+        except Exception as e:
+            log.error("Failed to forward request for component %s",
+                      component_name, exc_info=True)
+            return handler.respond(INTERNAL_SERVER_ERROR, u"ERROR")
+
+        kw = {"headers": response.get("headers")}
+        if response.get("content_type") is not None:
+            kw["content_type"] = response["content_type"]
+        return handler.respond(response["status"], response["message"], **kw)
+
+    def call(self, request):
+        """
+        owner_client.call(request) -> dict
+
+        Send a request to the state owner and return its response.  A request
+        that fails on an existing connection is retried once on a new one.
+        """
+        data = (dumps(request) + "\n").encode("utf-8")
+        with self.lock:
+            for attempt in (0, 1):
+                reconnected = self.connection is None
+                if reconnected:
+                    self.connection = socket.socket(socket.AF_UNIX,
+                                                    socket.SOCK_STREAM)
+                    self.connection.connect(self.path)
+                    self.reader = self.connection.makefile("rb")
+
+                try:
+                    self.connection.sendall(data)
+                    line = self.reader.readline()
+                    if not line:
+                        raise socket.error("State owner closed connection")
+                    return loads(line.decode("utf-8"))
+                except socket.error:
+                    self.close()
+                    if reconnected:
+                        raise
+        return
+
+    def close(self):
+        """
+        owner_client.close()
+
+        Close the connection to the state owner.
+        """
+        if self.connection is not None:
+            self.reader.close()
+            self.connection.close()
+            self.connection = None
+            self.reader = None
+        return
+
+class StateOwner(Thread):
+    """
+    StateOwner(path, server)
+
+    Run components of server on behalf of prefork workers, listening on the
+    Unix domain socket path.  Each worker connection is served by its own
+    thread.
+    """
+    def __init__(self, path, server):
+        super(StateOwner, self).__init__()
+        self.daemon = True
+        self.path = path
+        self.server = server
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        os.chmod(path, 0o600)
+        self.listener.listen(128)
+        return
+
+    def run(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except socket.error:
+                # Listener closed.
+                break
+
+            thread = Thread(target=self.serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+        return
+
+    def serve(self, connection):
+        """
+        owner.serve(connection)
+
+        Answer requests from a single worker connection until it closes.
+        """
+        reader = connection.makefile("rb")
+        try:
+            for line in reader:
+                response = self.execute(loads(line.decode("utf-8")))
+                connection.sendall((dumps(response) + "\n").encode("utf-8"))
+        except (socket.error, ValueError) as e:
+            log.info("Worker connection closed: %s", e)
+        finally:
+            reader.close()
+            connection.close()
+        return
+
+    def execute(self, request):
+        """
+        owner.execute(request) -> dict
+
+        Run the component named by a forwarded request, returning the status,
+        message, headers and content type of the response it produced.
+        """
+        method = request["method"]
+        name = request["component"]
+        headers = {}
+        if request.get("authorization") is not None:
+            headers["Authorization"] = request["authorization"]
+
+        if method == "POST":
+            component_map = self.server.post_handlers
+            if (request.get("authorized") and
+                worker_auth(component_map.get(name)) is not None):
+                # The worker has already authenticated this request.
+                component_map = {
+                    name: partial(component_map[name], authorized=True)}
+        else:
+            component_map = self.server.get_handlers
+
+        proxied = ProxiedRequest(self.server, method, "/" + name, headers)
+        thread_local.current_handler = proxied
+        try:
+            proxied.select_and_run_component(component_map, log)
+        finally:
+            del thread_local.current_handler
+
+        status, message, headers, content_type = proxied.response
+        return {"status": status, "message": message, "headers": headers,
+                "content_type": content_type}
+
+    def close(self):
+        """
+        owner.close()
+
+        Stop accepting worker connections and remove the socket.
+        """
+        self.listener.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        return
+
+class ProxiedRequest(FailoverRequestHandler):
+    """
+    A request forwarded by a worker, run in the state owner with the same
+    routing and error handling as a direct request.  The first response
+    produced (including response_headers, such as those set by Budget) is
+    recorded rather than written to a socket.
+    """
+    proxied = True
+
+    def __init__(self, server, command, path, headers):
+        # BaseHTTPRequestHandler.__init__ is deliberately not called: it
+        # would try to handle a request on a socket, and there isn't one.
+        self.server = server
+        self.command = command
+        self.path = path
+        self.headers = headers
+        self.response_headers = {}
+        self.response = None
+        return
+
+    def respond(self, code, message, headers=None, content_type=None):
+        if self.response is None:
+            all_headers = dict(self.response_headers)
+            all_headers.update(headers or {})
+            self.response = (code, message, all_headers, content_type)
+        return
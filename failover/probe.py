@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+"""
+Check many health check components in one run.
+
+Usage: failover-probe --url http://localhost:8080/ [options] component...
+       failover-probe --unix /run/failover.sock [options] component...
+       failover-probe --config failover.json [options] [component...]
+
+With --url or --unix, each component is requested from a running
+HealthCheckServer, reusing one keep-alive connection where the server allows
+it.  With --config, the components of a configuration file (see
+failover.config) are built and evaluated in this process, several at a time;
+all components are checked if none are named.  Wrappers such as Hysteresis
+and Background are evaluated through the checks they wrap, since a single
+call would only return their initial state.
+
+The exit status follows the Nagios plugin convention: 0 if every component is
+OK, 2 if any is FAIL, and 3 if any could not be checked (or the arguments are
+invalid).
+"""
+from __future__ import absolute_import, print_function
+from argparse import ArgumentParser
+from json import dumps
+import logging
+import socket
+import sys
+from threading import Thread
+from time import time
+
+# Only what the chosen mode needs is imported, and only when it is needed:
+# a probe is a short-lived process whose cost is dominated by startup.
+
+log = logging.getLogger("failover.probe")
+
+EXIT_OK = 0
+EXIT_FAIL = 2
+EXIT_UNKNOWN = 3
+
+OK = "OK"
+FAIL = "FAIL"
+ERROR = "ERROR"
+
+class ProbeResult(object):
+    """
+    ProbeResult(name, state, elapsed, detail=None)
+
+    The outcome of checking one component: state is "OK", "FAIL" or "ERROR"
+    (the component could not be checked, as explained by detail), and
+    elapsed is the time taken in seconds.
+    """
+    def __init__(self, name, state, elapsed, detail=None):
+        super(ProbeResult, self).__init__()
+        self.name = name
+        self.state = state
+        self.elapsed = elapsed
+        self.detail = detail
+        return
+
+    def to_json(self):
+        result = {"state": self.state, "elapsed": round(self.elapsed, 6)}
+        if self.detail is not None:
+            result["detail"] = self.detail
+        return result
+
+def unix_connection_class():
+    """
+    unix_connection_class() -> class
+
+    Return an HTTPConnection subclass connecting to a Unix domain socket.
+    """
+    from six.moves.http_client import HTTPConnection
+
+    class UnixHTTPConnection(HTTPConnection):
+        def __init__(self, path, timeout):
+            HTTPConnection.__init__(self, "localhost", timeout=timeout)
+            self.unix_path = path
+            return
+
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.unix_path)
+            return
+
+    return UnixHTTPConnection
+
+def connection_factory(url=None, unix_path=None, timeout=10.0):
+    """
+    connection_factory(url=None, unix_path=None, timeout=10.0)
+        -> (factory, base_path)
+
+    Return a function creating connections to the HealthCheckServer at url
+    (an http or https URL) or listening on the Unix domain socket unix_path,
+    and the path prefix of its components.
+    """
+    if unix_path is not None:
+        cls = unix_connection_class()
+        return (lambda: cls(unix_path, timeout)), ""
+
+    from six.moves.http_client import HTTPConnection, HTTPSConnection
+    from six.moves.urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("url must be an http or https URL: %r" % (url,))
+
+    cls = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+    host, port = parts.hostname, parts.port
+    return (lambda: cls(host, port, timeout=timeout)), parts.path.rstrip("/")
+
+def probe_server(factory, base_path, components):
+    """
+    probe_server(factory, base_path, components) -> list of ProbeResult
+
+    Request each named component in turn from a HealthCheckServer, using
+    connections created by factory.  A connection is kept for the next
+    request unless the server closes it; a request that fails on a reused
+    connection (which the server may have timed out) is retried once on a
+    new one.
+    """
+    from six.moves.http_client import HTTPException, SERVICE_UNAVAILABLE
+    from six.moves.http_client import OK as HTTP_OK
+    from six.moves.urllib.parse import quote
+
+    results = []
+    connection = None
+    for name in components:
+        path = base_path + "/" + quote(name)
+        start = time()
+        while True:
+            reused = connection is not None
+            if connection is None:
+                connection = factory()
+
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                body = response.read(1024)
+            except (socket.error, HTTPException) as e:
+                connection.close()
+                connection = None
+                if reused:
+                    continue
+                results.append(ProbeResult(name, ERROR, time() - start,
+                                           "request failed: %s" % (e,)))
+                break
+
+            if response.will_close or response.length:
+                # Unread body bytes would corrupt the next response.
+                connection.close()
+                connection = None
+
+            body = body.strip().decode("utf-8", "replace")
+            if response.status == HTTP_OK:
+                state, detail = OK, None
+            elif response.status == SERVICE_UNAVAILABLE and body == FAIL:
+                state, detail = FAIL, None
+            else:
+                state = ERROR
+                detail = "HTTP %d %s" % (response.status, body)
+            results.append(ProbeResult(name, state, time() - start, detail))
+            break
+
+    if connection is not None:
+        connection.close()
+    return results
+
+class ComponentTable(object):
+    """
+    ComponentTable()
+
+    Collects the components added by a failover.config.Config, standing in
+    for a HealthCheckServer when components are evaluated in-process.
+    """
+    def __init__(self):
+        super(ComponentTable, self).__init__()
+        self.get_handlers = {}
+        self.post_handlers = {}
+        return
+
+    def add_component(self, name, task, on_post=None):
+        if getattr(task, "name", None) is None:
+            try:
+                task.name = name
+            except Exception:
+                pass
+        self.get_handlers[name] = task
+        return
+
+    def remove_component(self, name):
+        self.get_handlers.pop(name, None)
+        return
+
+def probe_config(filename, components=None, parallel=8):
+    """
+    probe_config(filename, components=None, parallel=8)
+        -> list of ProbeResult
+
+    Build the components of the configuration file filename and call each of
+    those named (or all of them, in name order, if components is None),
+    running up to parallel at a time.  Each component is checked once, with
+    check_once(), so the result reflects the underlying checks rather than
+    the initial state of wrappers such as Hysteresis or Background.
+    """
+    from .config import Config, release
+
+    table = ComponentTable()
+    config = Config(filename, table)
+    try:
+        if components is None:
+            components = sorted(table.get_handlers)
+
+        results = [None] * len(components)
+        work = list(enumerate(components))
+
+        def worker():
+            while True:
+                try:
+                    index, name = work.pop()
+                except IndexError:
+                    return
+                results[index] = evaluate(name, table.get_handlers.get(name))
+
+        threads = [Thread(target=worker, name="probe-%d" % (i,))
+                   for i in range(max(1, min(parallel, len(work))))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    finally:
+        for task, on_post in config.components.values():
+            release(task)
+
+def evaluate(name, task):
+    """
+    evaluate(name, task) -> ProbeResult
+
+    Call a task in-process, as HealthCheckServer would.
+    """
+    start = time()
+    if task is None:
+        return ProbeResult(name, ERROR, 0.0, "unknown component")
+
+    try:
+        state = OK if check_once(task) else FAIL
+        detail = None
+    except Exception as e:
+        log.debug("Component %s raised an exception", name, exc_info=True)
+        state = ERROR
+        detail = "%s: %s" % (type(e).__name__, e)
+    return ProbeResult(name, state, time() - start, detail)
+
+def check_once(task):
+    """
+    check_once(task) -> bool
+
+    Evaluate a freshly built task once.  Wrappers that hold a state between
+    calls or run their task in the background (Hysteresis, Background, Budget
+    and the like, which wrap a single task in their task attribute) would only
+    report their initial state, so the task they wrap is checked instead.  A
+    Toggle checks the task it would call in its current state.  A
+    PassiveCheck, which is only fed by application events, can't be checked
+    in-process; ValueError is raised.
+    """
+    from .passive import PassiveCheck
+
+    if isinstance(task, PassiveCheck):
+        raise ValueError("passive checks can't be evaluated in-process")
+
+    to_fail = getattr(task, "to_fail", None)
+    to_ok = getattr(task, "to_ok", None)
+    if to_fail is not None and to_ok is not None:
+        return check_once(to_fail if task.state else to_ok)
+
+    subtask = getattr(task, "task", None)
+    if subtask is not None and callable(subtask):
+        return check_once(subtask)
+
+    return bool(task())
+
+def exit_status(results):
+    """
+    exit_status(results) -> int
+
+    Return the exit status for a list of ProbeResult objects.
+    """
+    states = set(result.state for result in results)
+    if FAIL in states:
+        return EXIT_FAIL
+    if ERROR in states or not results:
+        return EXIT_UNKNOWN
+    return EXIT_OK
+
+def format_text(results):
+    width = max([len(result.name) for result in results] + [1])
+    lines = []
+    for result in results:
+        line = "%-*s %-5s %8.3fs" % (width, result.name, result.state,
+                                     result.elapsed)
+        if result.detail is not None:
+            line += "  " + result.detail
+        lines.append(line)
+    return "\n".join(lines)
+
+def format_json(results):
+    return dumps({
+        "status": {EXIT_OK: OK, EXIT_FAIL: FAIL}.get(exit_status(results),
+                                                     ERROR),
+        "components": dict((result.name, result.to_json())
+                           for result in results),
+    }, sort_keys=True)
+
+def format_nagios(results):
+    status = exit_status(results)
+    label = {EXIT_OK: "OK", EXIT_FAIL: "CRITICAL"}.get(status, "UNKNOWN")
+    failing = [result.name for result in results if result.state == FAIL]
+    errors = [result.name for result in results if result.state == ERROR]
+
+    if status == EXIT_OK:
+        summary = "%d components OK" % (len(results),)
+    elif not results:
+        summary = "no components checked"
+    else:
+        parts = []
+        if failing:
+            parts.append("FAIL: " + ", ".join(failing))
+        if errors:
+            parts.append("ERROR: " + ", ".join(errors))
+        summary = "; ".join(parts)
+
+    perfdata = " ".join("'%s'=%.6fs" % (result.name.replace("'", "''"),
+                                        result.elapsed)
+                        for result in results)
+    return "FAILOVER %s - %s | %s" % (label, summary, perfdata)
+
+FORMATTERS = {
+    "text": format_text,
+    "json": format_json,
+    "nagios": format_nagios,
+    "quiet": None,
+}
+
+class ProbeArgumentParser(ArgumentParser):
+    """
+    An ArgumentParser exiting with EXIT_UNKNOWN (rather than 2, which means
+    FAIL here) on invalid arguments.
+    """
+    def error(self, message):
+        self.print_usage(sys.stderr)
+        self.exit(EXIT_UNKNOWN, "%s: error: %s\n" % (self.prog, message))
+
+def main(args=None):
+    """
+    main(args=None) -> int
+
+    The failover-probe command: parse args (by default, sys.argv[1:]), check
+    the components, print the results and return the exit status.
+    """
+    parser = ProbeArgumentParser(
+        prog="failover-probe", description=__doc__.strip().split("\n")[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a HealthCheckServer")
+    target.add_argument("--unix", metavar="PATH",
+                        help="Unix domain socket of a HealthCheckServer")
+    target.add_argument("--config", metavar="FILE",
+                        help="Configuration file to evaluate in-process")
+    parser.add_argument("--format", choices=sorted(FORMATTERS),
+                        default="text", help="Output format (default: text)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="Request timeout in seconds (default: 10)")
+    parser.add_argument("--parallel", type=int, default=8,
+                        help="Components evaluated at once with --config "
+                        "(default: 8)")
+    parser.add_argument("--verbose", "-v", action="count", default=0,
+                        help="Log to stderr (twice for debug messages)")
+    parser.add_argument("components", nargs="*", metavar="component")
+    args = parser.parse_args(args)
+
+    if args.verbose:
+        logging.basicConfig(
+            stream=sys.stderr,
+            level=logging.DEBUG if args.verbose > 1 else logging.INFO,
+            format="%(asctime)s %(name)s [%(levelname)s] %(message)s")
+    elif not logging.getLogger("failover").handlers:
+        # Stay quiet (without Python 2's "no handlers" complaint) unless the
+        # embedding program has configured logging.
+        logging.getLogger("failover").addHandler(logging.NullHandler())
+
+    try:
+        if args.config is not None:
+            results = probe_config(args.config, args.components or None,
+                                   args.parallel)
+        else:
+            if not args.components:
+                parser.error("components must be named with --url or --unix")
+            factory, base_path = connection_factory(args.url, args.unix,
+                                                    args.timeout)
+            results = probe_server(factory, base_path, args.components)
+    except (EnvironmentError, ValueError) as e:
+        print("failover-probe: %s" % (e,), file=sys.stderr)
+        return EXIT_UNKNOWN
+
+    formatter = FORMATTERS[args.format]
+    if formatter is not None:
+        print(formatter(results))
+    return exit_status(results)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from json import loads
+from logging import getLogger
+from six.moves.http_client import (
+    HTTPException, NOT_MODIFIED, OK, SERVICE_UNAVAILABLE)
+from six.moves.urllib.parse import quote, urlsplit
+import socket
+from threading import Condition, Event, Lock, Thread
+from .http import HTTPCheck
+from .units import ok, fail, second
+from .validation import validate_duration
+
+log = getLogger("failover.remote")
+
+class RemoteError(RuntimeError):
+    """
+    Raised by RemoteHealthCheck when the remote server answers with anything
+    but OK or FAIL, e.g. because its check raised an exception, the component
+    is unknown, or the request was turned away.
+    """
+    pass
+
+class RemoteHealthCheck(HTTPCheck):
+    """
+    RemoteHealthCheck(url, component, timeout=second(10),
+                      read_timeout=second(10), tls_context=None,
+                      headers=None, max_idle=2, pool=None, watch=False,
+                      watch_path="/_watch", watch_timeout=second(30),
+                      name=None)
+
+    Create a RemoteHealthCheck object that reports the state of a component
+    of another HealthCheckServer, whose base URL (e.g.
+    "http://site1.example.com:8080/") is given by url.
+
+    The check succeeds if the remote server answers 200 OK and fails if it
+    answers 503 FAIL or cannot be reached.  Any other answer (500 ERROR, 404
+    for an unknown component, 503 BUSY when the request is turned away, and
+    so on) raises RemoteError; wrapped in a Hysteresis, this keeps the
+    current state.
+
+    Connections are pooled as for HTTPCheck (see failover.pool).  Concurrent
+    calls requesting the same remote component (from this or any other
+    RemoteHealthCheck) share a single request.
+
+    If watch is True, a thread subscribes to the remote server's WatchHub (see
+    failover.watch) at watch_path, long-polling for up to watch_timeout at a
+    time.  While the subscription is established and the remote component's
+    state is known, calls return that state without making a request;
+    otherwise they fall back to requesting the component.  close() must be
+    called to stop the thread.
+    """
+    def __init__(self, url, component, timeout=second(10),
+                 read_timeout=second(10), tls_context=None, headers=None,
+                 max_idle=2, pool=None, watch=False, watch_path="/_watch",
+                 watch_timeout=second(30), name=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("url must be an http or https URL: %r" % (url,))
+        if parts.query or parts.fragment:
+            raise ValueError("url must not have a query or fragment: %r" %
+                             (url,))
+        if not component or component.startswith("/"):
+            raise ValueError("component must be a name without a leading "
+                             "slash: %r" % (component,))
+
+        path = parts.path.rstrip("/") + "/" + quote(component)
+        super(RemoteHealthCheck, self).__init__(
+            host=parts.hostname, port=parts.port, path=path, timeout=timeout,
+            read_timeout=read_timeout, expected_status=(OK,),
+            tls=(parts.scheme == "https"), tls_context=tls_context,
+            headers=headers, max_idle=max_idle, max_body_size=1024,
+            pool=pool, name=name)
+        self.url = url
+        self.component = component
+
+        # Requests with the same destination, path and headers are shared.
+        self.coalesce_key = (self.pool_key, self.path,
+                             tuple(sorted(self.headers.items())))
+
+        self.watcher = None
+        if watch:
+            self.watcher = RemoteWatcher(
+                self, parts.path.rstrip("/") + watch_path,
+                validate_duration(watch_timeout, "watch_timeout"))
+        return
+
+    def __call__(self):
+        if self.watcher is not None:
+            state = self.watcher.state
+            if state is not None:
+                return state
+
+        with in_flight_lock:
+            call = in_flight.get(self.coalesce_key)
+            leader = call is None
+            if leader:
+                call = in_flight[self.coalesce_key] = PendingCall()
+
+        if not leader:
+            log.debug("Joining request in progress for remote component %s "
+                      "at %s", self.component, self.url)
+            return call.wait()
+
+        try:
+            call.result = super(RemoteHealthCheck, self).__call__()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with in_flight_lock:
+                del in_flight[self.coalesce_key]
+            call.done.set()
+
+    def evaluate(self, status, body):
+        """
+        remote_check.evaluate(status, body) -> bool
+
+        Translate the remote server's answer into ok or fail, raising
+        RemoteError if it is neither.
+        """
+        body = body.strip()
+        if status == OK:
+            log.info("Remote component %s at %s is OK", self.component,
+                     self.url)
+            return ok
+
+        if status == SERVICE_UNAVAILABLE and body == b"FAIL":
+            log.info("Remote component %s at %s is FAIL", self.component,
+                     self.url)
+            return fail
+
+        raise RemoteError("Remote component %s at %s returned %d %s" % (
+            self.component, self.url, status,
+            body.decode("utf-8", "replace")))
+
+    def close(self):
+        """
+        remote_check.close()
+
+        Stop watching the remote component (if watch is True), and close all
+        idle connections to the remote server.
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+        super(RemoteHealthCheck, self).close()
+        return
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        else:
+            return ("RemoteHealthCheck(url=%r, component=%r)" %
+                    (self.url, self.component))
+
+class PendingCall(object):
+    """
+    A request in progress, whose result (or exception) is shared with
+    concurrent callers.
+    """
+    def __init__(self):
+        super(PendingCall, self).__init__()
+        self.done = Event()
+        self.result = None
+        self.error = None
+        return
+
+    def wait(self):
+        """
+        pending_call.wait() -> bool
+
+        Wait for the request to complete, returning its result or raising its
+        exception.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+# coalesce key -> PendingCall for requests in progress.
+in_flight = {}
+in_flight_lock = Lock()
+
+class RemoteWatcher(Thread):
+    """
+    RemoteWatcher(check, path, timeout)
+
+    A thread that long-polls the WatchHub at path on the server of check (a
+    RemoteHealthCheck) for the state of its component.  state is ok or fail
+    while the subscription is established and the state is known, and None
+    otherwise.
+    """
+    # The longest wait before retrying after a failure.
+    max_retry_delay = 30.0
+
+    def __init__(self, check, path, timeout):
+        super(RemoteWatcher, self).__init__(
+            name="RemoteWatcher(%s)" % (check.component,))
+        self.daemon = True
+        self.check = check
+        self.path = "%s?component=%s&timeout=%g" % (
+            path, quote(check.component), timeout)
+        self.timeout = timeout
+        self.state = None
+        self.etag = None
+        self.connection = None
+        self.lock = Condition()
+        self.exit_requested = False
+        self.start()
+        return
+
+    def run(self):
+        retry_delay = 1.0
+        while True:
+            try:
+                self.poll()
+                retry_delay = 1.0
+            except (socket.error, HTTPException, KeyError, ValueError) as e:
+                self.reset()
+                log.info("Watching remote component %s at %s failed: %s; "
+                         "retrying in %gs", self.check.component,
+                         self.check.url, e, retry_delay)
+                with self.lock:
+                    if not self.exit_requested:
+                        self.lock.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+
+            with self.lock:
+                if self.exit_requested:
+                    break
+
+        self.reset()
+        return
+
+    def poll(self):
+        """
+        watcher.poll()
+
+        Make one long-poll request, waiting for the state to change from the
+        one last seen.
+        """
+        connection = self.connection
+        if connection is None:
+            connection = self.check.create_connection()
+            # The server holds the request for up to the watch timeout.
+            connection.sock.settimeout(self.timeout + self.check.read_timeout)
+
+        # Publish the connection and check for a stop request under the lock,
+        # so stop() either sees the connection to interrupt or is seen here.
+        with self.lock:
+            self.connection = connection
+            if self.exit_requested:
+                return
+
+        headers = dict(self.check.headers)
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        connection.request("GET", self.path, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        if response.will_close:
+            with self.lock:
+                connection.close()
+                self.connection = None
+
+        if response.status == NOT_MODIFIED:
+            return
+
+        if response.status != OK:
+            raise ValueError("watch request returned %d" % (response.status,))
+
+        state = loads(body.decode("utf-8"))["components"][
+            self.check.component]
+        if state not in ("OK", "FAIL", None):
+            raise ValueError("unexpected state %r" % (state,))
+
+        etag = response.getheader("ETag")
+        if etag is None:
+            raise ValueError("watch response has no ETag")
+
+        old_state = self.state
+        self.etag = etag
+        if state is None:
+            # The remote component doesn't report changes; calls must
+            # request it.
+            self.state = None
+        else:
+            self.state = ok if state == "OK" else fail
+
+        if self.state != old_state:
+            log.info("Remote component %s at %s is now %s",
+                     self.check.component, self.check.url, state)
+        return
+
+    def reset(self):
+        """
+        watcher.reset()
+
+        Forget the state and close the connection after a failure.
+        """
+        self.state = None
+        self.etag = None
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+        return
+
+    def stop(self):
+        """
+        watcher.stop()
+
+        Stop watching and wait for the thread to exit, interrupting a request
+        in progress.
+        """
+        with self.lock:
+            self.exit_requested = True
+            self.lock.notify()
+
+            # Interrupt a long poll in progress.  The thread closes the
+            # connection as it exits.
+            connection = self.connection
+            if connection is not None and connection.sock is not None:
+                try:
+                    connection.sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+        self.join()
+        return
@@ -1,15 +1,66 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
+import errno
+import os
 from six.moves.BaseHTTPServer import HTTPServer
+from six.moves.socketserver import ThreadingMixIn, UnixStreamServer
+import socket
+import stat
+from threading import Thread
+from .units import second
+from .validation import validate_duration
 
-class HealthCheckServer(HTTPServer):
+# Not exposed by the socket module on Python 2; this is the Linux value.
+SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", 15)
+
+class HealthCheckServer(ThreadingMixIn, HTTPServer):
     """
-    HealthCheckServer(port, host="")
+    HealthCheckServer(port, host="", reuse_port=False, threaded=False,
+                      fast_parser=False, keep_alive=False,
+                      keep_alive_timeout=second(5), unix_socket=None,
+                      unix_socket_mode=0o600, unix_post_only=False)
 
     Create a HealthCheckServer (an HTTP server) listening on the given port
     (and interface, if specified).
+
+    If reuse_port is True, the listening socket is bound with SO_REUSEPORT,
+    allowing other processes to listen on the same port (see
+    failover.prefork.PreforkServer).
+
+    If threaded is True, each request is handled in its own thread; this is
+    required for endpoints that hold connections open, such as
+    failover.watch.WatchHub.  Otherwise, requests are handled one at a time.
+
+    If fast_parser is True, simple probe requests (GET or HEAD with plain
+    headers) are parsed by failover.fastparse rather than the standard
+    library's full header parser, and header blocks over
+    failover.fastparse.MAX_HEADER_SIZE bytes are rejected.
+
+    If keep_alive is True, connections from HTTP/1.1 clients (and HTTP/1.0
+    clients asking for keep-alive) are kept open for further GET and HEAD
+    requests until they have been idle for keep_alive_timeout.  This spares
+    frequent probes (such as failover.remote.RemoteHealthCheck) a new
+    connection each time, and requires threaded to be True.
+
+    If unix_socket is not None, the server also listens on a Unix domain
+    socket created at that path with the permissions given by
+    unix_socket_mode; if port is None, it listens only there.  A stale socket
+    left at the path by a server that has exited is replaced.  Requests on the
+    Unix socket are handled exactly as those over TCP, with a client_address
+    of ("unix", 0).  If unix_post_only is True, POST requests over TCP are
+    refused with 403 Forbidden, so that only users permitted to open the
+    socket can change state.  server_close() removes the socket.
     """
-    def __init__(self, port, host=""):
+    daemon_threads = True
+
+    # SocketServer's default backlog of 5 overflows with a handful of
+    # concurrent clients, and each dropped SYN costs the client a second.
+    request_queue_size = 128
+
+    def __init__(self, port, host="", reuse_port=False, threaded=False,
+                 fast_parser=False, keep_alive=False,
+                 keep_alive_timeout=second(5), unix_socket=None,
+                 unix_socket_mode=0o600, unix_post_only=False):
         # Create a function which instantiates the handler with a link back
         # to this server.
         def create_handler(*args, **kw):
@@ -18,11 +69,99 @@ class HealthCheckServer(HTTPServer):
             handler.server = self
             return handler
 
-        HTTPServer.__init__(self, (host, port), create_handler)
+        if keep_alive and not threaded:
+            raise ValueError("keep_alive requires a threaded server")
+        if port is None and unix_socket is None:
+            raise ValueError("port or unix_socket must be specified")
+        if port is None and reuse_port:
+            raise ValueError("reuse_port requires a port")
+        if unix_post_only and unix_socket is None:
+            raise ValueError("unix_post_only requires a unix_socket")
+
+        self.reuse_port = reuse_port
+        self.threaded = threaded
+        self.fast_parser = fast_parser
+        self.keep_alive = keep_alive
+        self.keep_alive_timeout = validate_duration(keep_alive_timeout,
+                                                    "keep_alive_timeout")
+        self.unix_socket = unix_socket
+        self.unix_socket_mode = unix_socket_mode
+        self.unix_post_only = unix_post_only
+        self.unix_listener = None
+        self.unix_thread = None
+
+        if port is None:
+            self.address_family = socket.AF_UNIX
+            HTTPServer.__init__(self, unix_socket, create_handler)
+        else:
+            HTTPServer.__init__(self, (host, port), create_handler)
+            if unix_socket is not None:
+                try:
+                    self.unix_listener = UnixListener(self, unix_socket,
+                                                      unix_socket_mode)
+                except:
+                    HTTPServer.server_close(self)
+                    raise
+
         self.get_handlers = {}
         self.post_handlers = {}
+
+        # Special paths (e.g. "/_watch") mapped to functions taking the
+        # request handler; these take precedence over components on GET.
+        self.endpoints = {}
+
+        # Set in prefork worker processes; see failover.prefork.
+        self.owner = None
+
+        # Set by failover.admission.AdmissionControl.
+        self.admission = None
         return
-    
+
+    def server_bind(self):
+        if self.address_family == socket.AF_UNIX:
+            return bind_unix_socket(self, self.unix_socket_mode)
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        return HTTPServer.server_bind(self)
+
+    def process_request(self, request, client_address):
+        if self.threaded:
+            return ThreadingMixIn.process_request(self, request,
+                                                  client_address)
+        return HTTPServer.process_request(self, request, client_address)
+
+    def serve_forever(self, poll_interval=0.5):
+        """
+        hcs.serve_forever(poll_interval=0.5)
+
+        Handle requests until shutdown() is called, on the Unix domain socket
+        (in a separate thread) as well as over TCP if both are enabled.
+        """
+        if self.unix_listener is not None and self.unix_thread is None:
+            self.unix_thread = Thread(
+                target=self.unix_listener.serve_forever,
+                args=(poll_interval,), name="UnixListener(%s)" % (
+                    self.unix_socket,))
+            self.unix_thread.daemon = True
+            self.unix_thread.start()
+        return HTTPServer.serve_forever(self, poll_interval)
+
+    def shutdown(self):
+        HTTPServer.shutdown(self)
+        if self.unix_thread is not None:
+            self.unix_listener.shutdown()
+            self.unix_thread.join()
+            self.unix_thread = None
+        return
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        if self.unix_listener is not None:
+            self.unix_listener.server_close()
+        elif getattr(self, "unix_bound", False):
+            unlink_socket(self.unix_socket)
+        return
+
     def add_component(self, name, task, on_post=None):
         """
         hcs.add_component(name, task, on_post=None)
@@ -50,3 +189,109 @@ class HealthCheckServer(HTTPServer):
         if on_post:
             self.post_handlers[name] = on_post
         return
+
+    def remove_component(self, name):
+        """
+        hcs.remove_component(name)
+
+        Remove the health check task (and POST handler, if any) at the
+        specified path name.  Unknown names are ignored.
+        """
+        self.get_handlers.pop(name, None)
+        self.post_handlers.pop(name, None)
+        return
+
+class UnixListener(ThreadingMixIn, UnixStreamServer):
+    """
+    UnixListener(server, path, mode)
+
+    A Unix domain socket created at path with the given permissions, whose
+    connections are handled as if they had arrived at server (a
+    HealthCheckServer listening over TCP).
+    """
+    daemon_threads = True
+    request_queue_size = HealthCheckServer.request_queue_size
+
+    def __init__(self, server, path, mode):
+        # Handlers see the HealthCheckServer, not this listener, so that
+        # components, endpoints and settings are shared.
+        def create_handler(request, client_address, listener):
+            from .handler import FailoverRequestHandler
+            return FailoverRequestHandler(request, client_address, server)
+
+        self.health_check_server = server
+        self.mode = mode
+        UnixStreamServer.__init__(self, path, create_handler)
+        return
+
+    def server_bind(self):
+        return bind_unix_socket(self, self.mode)
+
+    def process_request(self, request, client_address):
+        if self.health_check_server.threaded:
+            return ThreadingMixIn.process_request(self, request,
+                                                  client_address)
+        return UnixStreamServer.process_request(self, request, client_address)
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if getattr(self, "unix_bound", False):
+            unlink_socket(self.server_address)
+        return
+
+def bind_unix_socket(server, mode):
+    """
+    bind_unix_socket(server, mode)
+
+    Bind the socket of server (a SocketServer) to the path in its
+    server_address, replacing a stale socket, and set its permissions.
+    server.unix_bound is set once the socket file has been created.  The
+    socket is not yet listening, so no connection can be made before the
+    permissions are set.
+    """
+    path = server.server_address
+    remove_stale_socket(path)
+    server.socket.bind(path)
+    # Only a socket this server created is removed by server_close().
+    server.unix_bound = True
+    os.chmod(path, mode)
+
+    # Stand-ins for the TCP values set by HTTPServer.server_bind().
+    server.server_name = "localhost"
+    server.server_port = None
+    return
+
+def remove_stale_socket(path):
+    """
+    remove_stale_socket(path)
+
+    Remove the Unix domain socket at path if nothing is listening on it.  A
+    socket in use (or any other kind of file) is left for bind() to fail on.
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except OSError:
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as e:
+        if e.errno == errno.ECONNREFUSED:
+            unlink_socket(path)
+    finally:
+        probe.close()
+    return
+
+def unlink_socket(path):
+    """
+    unlink_socket(path)
+
+    Remove the Unix domain socket at path, if it still exists.
+    """
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    return
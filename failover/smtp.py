@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from logging import getLogger
+from .tcp import TCPCheck
+from .units import ok, fail, second
+from .validation import validate_duration
+import socket
+from threading import Lock
+
+log = getLogger("failover.smtp")
+
+class SMTPCheck(TCPCheck):
+    """
+    SMTPCheck(host, port="smtp", timeout=second(10), read_timeout=second(10),
+              expected_code=220, max_reply_size=4096, keep_alive=False,
+              source_host=None, source_port=None, name=None)
+
+    Create an SMTPCheck object that performs a healthcheck on an SMTP service
+    when called.  The check succeeds if we are able to connect within timeout
+    and the server greets us with a reply code of expected_code (normally
+    220) within read_timeout.
+
+    Replies are read into a buffer of at most max_reply_size bytes; a server
+    which sends a longer greeting is treated as unhealthy.
+
+    If keep_alive is True, the connection is held open after a successful
+    check and subsequent checks send a NOOP command on it (expecting a 250
+    reply) instead of reconnecting.  If the held connection has gone away,
+    a fresh connection is made and the greeting checked again.  Otherwise,
+    a QUIT command is sent and the connection is closed after each check.
+    """
+
+    def __init__(self, host, port="smtp", timeout=second(10),
+                 read_timeout=second(10), expected_code=220,
+                 max_reply_size=4096, keep_alive=False, source_host=None,
+                 source_port=None, name=None):
+        super(SMTPCheck, self).__init__(
+            host=host, port=port, timeout=timeout, source_host=source_host,
+            source_port=source_port, name=name)
+        self.read_timeout = validate_duration(read_timeout, "read_timeout")
+        self.expected_code = int(expected_code)
+        self.max_reply_size = int(max_reply_size)
+        if self.max_reply_size <= 0:
+            raise ValueError("max_reply_size must be a positive integer")
+        self.keep_alive = bool(keep_alive)
+        self.connection = None
+        self.lock = Lock()
+        return
+
+    def __call__(self):
+        with self.lock:
+            if self.connection is not None:
+                try:
+                    log.info("Sending NOOP to %s:%d", self.host, self.port)
+                    self.connection.sendall(b"NOOP\r\n")
+                    code, _ = read_reply(self.connection, self.max_reply_size)
+                    if code == 250:
+                        return ok
+
+                    log.info("NOOP to %s:%d returned %d; reconnecting",
+                             self.host, self.port, code)
+                except (socket.error, ValueError) as e:
+                    log.info("Held connection to %s:%d failed: %s; "
+                             "reconnecting", self.host, self.port, e)
+                self.close()
+
+            try:
+                log.info("Connecting to %s:%d", self.host, self.port)
+                connection = self.connect()
+            except socket.error as e:
+                log.info("Connection to %s:%d failed: %s", self.host,
+                         self.port, e)
+                return fail
+
+            try:
+                connection.settimeout(self.read_timeout)
+                code, text = read_reply(connection, self.max_reply_size)
+            except (socket.error, ValueError) as e:
+                log.info("Failed to read greeting from %s:%d: %s", self.host,
+                         self.port, e)
+                connection.close()
+                return fail
+
+            if code != self.expected_code:
+                log.info("Greeting from %s:%d has code %d; expected %d",
+                         self.host, self.port, code, self.expected_code)
+                connection.close()
+                return fail
+
+            log.info("Greeting from %s:%d: %d %s", self.host, self.port, code,
+                     text)
+
+            if self.keep_alive:
+                self.connection = connection
+            else:
+                try:
+                    connection.sendall(b"QUIT\r\n")
+                except socket.error:
+                    pass
+                connection.close()
+
+            return ok
+
+    def close(self):
+        """
+        smtp_check.close()
+
+        Close any connection held open by keep_alive.
+        """
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except socket.error:
+                pass
+        return
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        else:
+            return ("SMTPCheck(host=%r, port=%r, timeout=%r, read_timeout=%r, "
+                    "expected_code=%r)" % (
+                        self.host, self.port, self.timeout, self.read_timeout,
+                        self.expected_code))
+
+def read_reply(connection, max_size):
+    """
+    read_reply(connection, max_size) -> (int, str)
+
+    Read a complete (possibly multi-line) SMTP reply from the given socket,
+    returning the reply code and the text of the final line.  At most max_size
+    bytes are buffered; ValueError is raised if the reply is longer than this
+    or is malformed.  socket.error is raised if the connection fails or times
+    out.
+    """
+    buffer = b""
+    start = 0
+
+    while True:
+        end = buffer.find(b"\r\n", start)
+        if end == -1:
+            if len(buffer) >= max_size:
+                raise ValueError("Reply exceeds %d bytes" % max_size)
+
+            data = connection.recv(max_size - len(buffer))
+            if not data:
+                raise ValueError("Connection closed before reply completed")
+
+            buffer += data
+            continue
+
+        line = buffer[start:end]
+        start = end + 2
+
+        if len(line) < 3 or not line[:3].isdigit():
+            raise ValueError("Malformed reply line %r" % (line,))
+
+        # Continuation lines have a '-' after the code; the final line has a
+        # space (or nothing at all).
+        if line[3:4] != b"-":
+            return int(line[:3]), line[4:].decode("utf-8", "replace")
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from json import dump, load
+from logging import getLogger
+import os
+from .units import second
+from .validation import validate_duration
+from threading import Condition, Thread
+
+log = getLogger("failover.snapshot")
+
+# Attributes through which wrapper tasks refer to the tasks they wrap.
+SUBTASK_ATTRIBUTES = ("task", "to_fail", "to_ok")
+
+class StateSnapshot(Thread):
+    """
+    StateSnapshot(filename, delay=second(1), start_thread=True)
+
+    Create a StateSnapshot object that periodically checkpoints the state of
+    registered components (Hysteresis, Toggle and Oneshot objects, or anything
+    else providing save_state() and restore_state() methods) to a file, and
+    restores it when the components are registered.
+
+    Checkpoints are taken by a background thread every delay; the file is only
+    rewritten if some state has changed since the last write.  Health checks
+    themselves never touch the disk.  Writes are atomic: the new snapshot is
+    written to a temporary file which is then renamed over the old one, so a
+    crash never leaves a truncated snapshot behind.
+
+    The thread is automatically started unless start_thread is False.
+    """
+    def __init__(self, filename, delay=second(1), start_thread=True):
+        super(StateSnapshot, self).__init__()
+        self.daemon = True
+        self.filename = filename
+        self.delay = validate_duration(delay, "delay")
+        self.lock = Condition()
+        self.exit_requested = False
+        self.components = {}
+        self.saved = self.read()
+        self.written = dict(self.saved)
+
+        if start_thread:
+            self.start()
+        return
+
+    def add(self, name, component):
+        """
+        snapshot.add(name, component)
+
+        Register component (and, recursively, any tasks it wraps) under the
+        given name, restoring its state from the snapshot file if it was
+        present there.  Wrapped tasks are registered as name.attribute, e.g.
+        "mail.to_fail.task".
+        """
+        for attr in SUBTASK_ATTRIBUTES:
+            subtask = getattr(component, attr, None)
+            if subtask is not None:
+                self.add(name + "." + attr, subtask)
+
+        if not (hasattr(component, "save_state") and
+                hasattr(component, "restore_state")):
+            return
+
+        with self.lock:
+            self.components[name] = component
+            state = self.saved.pop(name, None)
+
+        if state is not None:
+            try:
+                component.restore_state(state)
+                log.info("Restored state of %s: %s", name, state)
+            except Exception as e:
+                log.error("Unable to restore state of %s from %r: %s", name,
+                          state, e)
+        return
+
+    def run(self):
+        with self.lock:
+            while not self.exit_requested:
+                self.lock.wait(self.delay)
+                if self.exit_requested:
+                    break
+
+                try:
+                    self.flush()
+                except Exception as e:
+                    log.error("Failed to write snapshot %s: %s",
+                              self.filename, e, exc_info=True)
+        return
+
+    def flush(self):
+        """
+        snapshot.flush()
+
+        Write the current state of all registered components to the snapshot
+        file if it differs from what was last written.
+        """
+        with self.lock:
+            current = dict(self.saved)
+            for name, component in self.components.items():
+                current[name] = component.save_state()
+
+            if current == self.written:
+                return
+
+            self.write(current)
+            self.written = current
+        return
+
+    def read(self):
+        """
+        snapshot.read() -> dict
+
+        Read the snapshot file, returning a mapping of component names to
+        saved states.  A missing or unreadable file yields an empty mapping.
+        """
+        try:
+            with open(self.filename) as fd:
+                data = load(fd)
+            return dict(data["components"])
+        except (IOError, OSError) as e:
+            log.info("No snapshot read from %s: %s", self.filename, e)
+        except (ValueError, KeyError, TypeError) as e:
+            log.error("Ignoring corrupt snapshot %s: %s", self.filename, e)
+        return {}
+
+    def write(self, components):
+        """
+        snapshot.write(components)
+
+        Atomically replace the snapshot file with the given mapping of
+        component names to saved states.
+        """
+        tempname = self.filename + ".tmp"
+        with open(tempname, "w") as fd:
+            dump({"version": 1, "components": components}, fd,
+                 sort_keys=True)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        os.rename(tempname, self.filename)
+        log.debug("Wrote snapshot %s", self.filename)
+        return
+
+    def stop(self):
+        """
+        snapshot.stop()
+
+        Stop the checkpoint thread and write a final snapshot.
+        """
+        with self.lock:
+            self.exit_requested = True
+            self.lock.notify()
+
+        if self.is_alive():
+            self.join()
+
+        self.flush()
+        return
@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+"""
+A memory-mapped table of component results shared between processes.
+
+The file starts with a header followed by a fixed number of fixed-size
+records, one per component:
+
+    header: magic (8 bytes), record size, capacity, records in use
+    record: sequence number, name (UTF-8, NUL padded), state, timestamp,
+            latency
+
+A single process (the one holding the table open for writing) updates
+records; any number of processes may map the file read-only.  Each record is
+guarded by a sequence lock: the writer makes the sequence number odd before
+changing a record and even again afterwards, and readers retry if the number
+was odd or changed while they were copying the record.  Readers therefore
+never block the writer or each other.  A writer that dies partway through an
+update leaves the record's sequence number odd; the record is cleared (as if
+never written) when the table is next opened for writing.
+
+A writer that has to reinitialize the file (to change its capacity, say)
+builds the new table in a temporary file and renames it into place, then
+marks the old table as replaced; readers check for that on each read and map
+the new file.  Readers also check the name stored in each record they read,
+so a record reused for another name is never mistaken for theirs.
+"""
+from __future__ import absolute_import, print_function
+import fcntl
+from logging import getLogger
+import mmap
+import os
+from struct import Struct
+from threading import Lock
+from time import time
+from .units import fail
+from .validation import validate_duration
+
+log = getLogger("failover.statetable")
+
+MAGIC = b"FOSTATE1"
+HEADER = Struct("<8sIII")
+HEADER_SIZE = 32
+USED_OFFSET = 16
+SEQUENCE = Struct("<I")
+RECORD = Struct("<I64sB3xdd")
+NAME_SIZE = 64
+
+STATE_FAIL = 0
+STATE_OK = 1
+
+# How many times a reader retries a record that is being written before
+# giving up; a writer that dies mid-update leaves the sequence number odd.
+READ_RETRIES = 1000
+
+class StateTable(object):
+    """
+    StateTable(filename, writable=False, capacity=64)
+
+    Open the state table stored in filename.
+
+    If writable is True, the file is created (or reinitialized, if it has a
+    different capacity or is not a state table) and an exclusive lock is taken
+    on it; OSError is raised if another process already has it open for
+    writing.  Otherwise, the file must already exist and is mapped read-only.
+    """
+    def __init__(self, filename, writable=False, capacity=64):
+        super(StateTable, self).__init__()
+        self.filename = filename
+        self.writable = writable
+        self.lock = Lock()
+        self.slots = {}
+
+        if writable:
+            if not isinstance(capacity, int) or capacity <= 0:
+                raise ValueError("capacity must be a positive integer")
+            fd = self.lock_file()
+            try:
+                fd, self.map = self.initialize(fd, capacity)
+            except:
+                os.close(fd)
+                raise
+            # Keep the descriptor (and therefore the lock) while we're open.
+            self.fd = fd
+        else:
+            self.map = self.map_file()
+            self.fd = None
+
+        self.capacity = table_capacity(self.map)
+        if self.capacity is None:
+            self.close()
+            raise ValueError("%s is not a state table" % (filename,))
+        return
+
+    def lock_file(self):
+        """
+        table.lock_file() -> int
+
+        Open the file for writing, creating it if necessary, and take an
+        exclusive lock on it, returning the descriptor.  OSError is raised if
+        another process already has it locked.
+        """
+        while True:
+            fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = os.fstat(fd)
+                try:
+                    current = os.stat(self.filename)
+                except OSError:
+                    current = None
+            except:
+                os.close(fd)
+                raise
+
+            if (current is not None and
+                (current.st_dev, current.st_ino) ==
+                (locked.st_dev, locked.st_ino)):
+                return fd
+
+            # Another writer replaced the file after we opened it; lock the
+            # file that is there now instead.
+            os.close(fd)
+
+    def initialize(self, fd, capacity):
+        """
+        table.initialize(fd, capacity) -> (fd, mmap)
+
+        Map the file open (and locked) on fd for writing.  Unless it already
+        holds a table with the given capacity, a new table is built in a
+        temporary file and renamed into place, so that readers never see the
+        file they have mapped truncated; the old table is marked as replaced,
+        which makes them map the new one.  The descriptor of the new file
+        (fd is closed) or fd itself is returned with the map.
+        """
+        size = HEADER_SIZE + capacity * RECORD.size
+        old = None
+        if os.fstat(fd).st_size >= HEADER_SIZE:
+            old = mmap.mmap(fd, 0)
+            if len(old) == size and table_capacity(old) == capacity:
+                self.repair(old, capacity)
+                return fd, old
+
+        temp = "%s.%d.tmp" % (self.filename, os.getpid())
+        new_fd = os.open(temp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        result = None
+        try:
+            fcntl.flock(new_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.ftruncate(new_fd, size)
+            result = mmap.mmap(new_fd, size)
+            HEADER.pack_into(result, 0, MAGIC, RECORD.size, capacity, 0)
+            os.rename(temp, self.filename)
+        except:
+            if result is not None:
+                result.close()
+            os.close(new_fd)
+            try:
+                os.unlink(temp)
+            except OSError:
+                pass
+            if old is not None:
+                old.close()
+            raise
+
+        if old is not None:
+            if old[:len(MAGIC)] == MAGIC:
+                old[:len(MAGIC)] = b"\0" * len(MAGIC)
+            old.close()
+        os.close(fd)
+        return new_fd, result
+
+    def map_file(self):
+        """
+        table.map_file() -> mmap
+
+        Map the file read-only.
+        """
+        fd = os.open(self.filename, os.O_RDONLY)
+        try:
+            return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+    def check_header(self):
+        """
+        table.check_header()
+
+        Map the file again if the writer has replaced the table mapped (or
+        changed its capacity) since it was mapped.
+        """
+        if self.writable:
+            return
+
+        magic, _, capacity, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC or capacity != self.capacity:
+            self.remap()
+        return
+
+    def remap(self):
+        """
+        table.remap()
+
+        Forget the records found so far and, on a read-only table, map the
+        file again.  The old map is left open for readers still using it, and
+        is kept if the file can't be mapped.
+        """
+        if self.writable:
+            with self.lock:
+                self.slots = {}
+            return
+
+        log.info("State table %s was replaced; mapping it again",
+                 self.filename)
+        try:
+            mapped = self.map_file()
+        except (IOError, OSError, ValueError) as e:
+            log.error("Failed to map state table %s: %s", self.filename, e)
+            return
+
+        capacity = table_capacity(mapped)
+        if capacity is None:
+            log.error("%s is no longer a state table", self.filename)
+            mapped.close()
+            return
+
+        with self.lock:
+            self.map = mapped
+            self.capacity = capacity
+            self.slots = {}
+        return
+
+    def repair(self, mapped, capacity):
+        """
+        table.repair(mapped, capacity)
+
+        Clear the records of a reopened table that a previous writer left
+        partway through an update (with an odd sequence number), making their
+        sequence numbers even again.  Their contents may be torn, so they are
+        marked as never written.
+        """
+        used = SEQUENCE.unpack_from(mapped, USED_OFFSET)[0]
+        for index in range(min(used, capacity)):
+            offset = self.offset(index)
+            sequence, name, _, _, _ = RECORD.unpack_from(mapped, offset)
+            if sequence & 1:
+                log.warning("Clearing record %d of state table %s, left "
+                            "partway through an update", index, self.filename)
+                RECORD.pack_into(mapped, offset, (sequence + 1) & 0xffffffff,
+                                 name, STATE_FAIL, 0.0, 0.0)
+        return
+
+    def slot(self, name):
+        """
+        table.slot(name) -> int or None
+
+        Return the index of the record for name, or None if there isn't one.
+        On a writable table, a record is allocated if necessary.
+        """
+        try:
+            return self.slots[name]
+        except KeyError:
+            pass
+
+        encoded = name.encode("utf-8")
+        if len(encoded) > NAME_SIZE:
+            raise ValueError("Component name %r is longer than %d bytes" %
+                             (name, NAME_SIZE))
+
+        with self.lock:
+            used = SEQUENCE.unpack_from(self.map, USED_OFFSET)[0]
+            for index in range(min(used, self.capacity)):
+                # Names are written once, before the record is counted as
+                # used, so they can be read without the sequence lock.
+                offset = self.offset(index) + SEQUENCE.size
+                existing = self.map[offset:offset + NAME_SIZE].rstrip(b"\0")
+                if existing == encoded:
+                    self.slots[name] = index
+                    return index
+
+            if not self.writable:
+                return None
+
+            if used >= self.capacity:
+                raise ValueError("State table %s is full (%d records)" %
+                                 (self.filename, self.capacity))
+
+            RECORD.pack_into(self.map, self.offset(used), 0, encoded,
+                             STATE_FAIL, 0.0, 0.0)
+            SEQUENCE.pack_into(self.map, USED_OFFSET, used + 1)
+            self.slots[name] = used
+            return used
+
+    def offset(self, index):
+        """
+        table.offset(index) -> int
+
+        Return the position of record index in the file.
+        """
+        return HEADER_SIZE + index * RECORD.size
+
+    def write(self, name, state, latency, timestamp=None):
+        """
+        table.write(name, state, latency, timestamp=None)
+
+        Record the result of the component name: its state (ok or fail), how
+        long the check took in seconds, and when it finished (defaulting to
+        now).
+        """
+        if not self.writable:
+            raise ValueError("State table %s is not open for writing" %
+                             (self.filename,))
+
+        if timestamp is None:
+            timestamp = time()
+
+        index = self.slot(name)
+        offset = self.offset(index)
+        with self.lock:
+            # Force the parity rather than incrementing blindly, so that a
+            # record somehow left odd can't invert the protocol for good.
+            writing = SEQUENCE.unpack_from(self.map, offset)[0] | 1
+            SEQUENCE.pack_into(self.map, offset, writing)
+            RECORD.pack_into(self.map, offset, writing,
+                             name.encode("utf-8"),
+                             STATE_OK if state else STATE_FAIL,
+                             float(timestamp), float(latency))
+            SEQUENCE.pack_into(self.map, offset, (writing + 1) & 0xffffffff)
+        return
+
+    def read(self, name):
+        """
+        table.read(name) -> (state, timestamp, latency) or None
+
+        Return the last result recorded for the component name, or None if
+        there is none (or the writer is stuck partway through updating it).
+        """
+        encoded = name.encode("utf-8")
+        self.check_header()
+        for attempt in range(2):
+            index = self.slot(name)
+            if index is None:
+                return None
+
+            record = self.read_record(index)
+            if record is None:
+                log.error("Record %s in state table %s is not consistent "
+                          "after %d attempts", name, self.filename,
+                          READ_RETRIES)
+                return None
+
+            record_name, state, timestamp, latency = record
+            if record_name != encoded:
+                # The record was reused for another name since we found it;
+                # the table has been reinitialized under us.
+                self.remap()
+                continue
+
+            if timestamp == 0.0:
+                # Allocated but never written.
+                return None
+            return (state == STATE_OK, timestamp, latency)
+
+        return None
+
+    def read_record(self, index):
+        """
+        table.read_record(index) -> (name, state, timestamp, latency) or None
+
+        Copy record index under its sequence lock, returning the name as
+        UTF-8 bytes, or None if it couldn't be read consistently.
+        """
+        mapped = self.map
+        offset = self.offset(index)
+        end = offset + RECORD.size
+        if end > len(mapped):
+            # Found in a larger table than the one now mapped.
+            return (b"", STATE_FAIL, 0.0, 0.0)
+
+        for attempt in range(READ_RETRIES):
+            before = SEQUENCE.unpack_from(mapped, offset)[0]
+            if before & 1:
+                continue
+
+            data = mapped[offset:end]
+            if SEQUENCE.unpack_from(mapped, offset)[0] != before:
+                continue
+
+            _, name, state, timestamp, latency = RECORD.unpack(data)
+            return (name.rstrip(b"\0"), state, timestamp, latency)
+
+        return None
+
+    def snapshot(self):
+        """
+        table.snapshot() -> dict
+
+        Return a mapping of every component name in the table to its
+        (state, timestamp, latency) result.
+        """
+        self.check_header()
+        used = SEQUENCE.unpack_from(self.map, USED_OFFSET)[0]
+        result = {}
+        for index in range(min(used, self.capacity)):
+            offset = self.offset(index) + SEQUENCE.size
+            name = self.map[offset:offset + NAME_SIZE].rstrip(b"\0")
+            name = name.decode("utf-8")
+            value = self.read(name)
+            if value is not None:
+                result[name] = value
+        return result
+
+    def close(self):
+        """
+        table.close()
+
+        Unmap the table and, if it was open for writing, release the lock.
+        """
+        self.map.close()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        return
+
+def table_capacity(mapped):
+    """
+    table_capacity(mapped) -> int or None
+
+    Return the capacity of the state table in mapped, or None if it doesn't
+    hold one (or has been replaced by a new table).
+    """
+    if len(mapped) < HEADER_SIZE:
+        return None
+
+    magic, record_size, capacity, _ = HEADER.unpack_from(mapped)
+    if (magic != MAGIC or record_size != RECORD.size or
+        len(mapped) < HEADER_SIZE + capacity * RECORD.size):
+        return None
+    return capacity
+
+class Published(object):
+    """
+    Published(task, table, name)
+
+    Create a Published object that invokes an underlying health check task
+    and records its result and latency under name in table (a writable
+    StateTable) before returning it.
+
+    This is typically wrapped in a Background object, so that one process
+    checks a backend periodically and any number of other processes can
+    answer health checks from the table via TableReader.
+    """
+    def __init__(self, task, table, name):
+        super(Published, self).__init__()
+        self.task = task
+        self.table = table
+        self.name = name
+        # Allocate the record now so a full table is reported immediately.
+        table.slot(name)
+        return
+
+    def __call__(self):
+        start = time()
+        result = self.task()
+        end = time()
+        self.table.write(self.name, result, end - start, end)
+        return result
+
+class TableReader(object):
+    """
+    TableReader(table, name, max_age=None, default_state=fail)
+
+    Create a TableReader object that returns the state recorded under name in
+    table (a StateTable) without doing any work itself.
+
+    If there is no result for name, or max_age is not None and the result is
+    older than max_age (e.g. because the writer has died), default_state is
+    returned instead.
+    """
+    def __init__(self, table, name, max_age=None, default_state=fail):
+        super(TableReader, self).__init__()
+        self.table = table
+        self.name = name
+        self.max_age = (None if max_age is None else
+                        validate_duration(max_age, "max_age"))
+        self.default_state = default_state
+        return
+
+    def __call__(self):
+        result = self.table.read(self.name)
+        if result is None:
+            return self.default_state
+
+        state, timestamp, _ = result
+        if self.max_age is not None and time() - timestamp > self.max_age:
+            log.debug("Result for %s in %s is stale", self.name,
+                      self.table.filename)
+            return self.default_state
+
+        return state
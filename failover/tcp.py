@@ -27,7 +27,13 @@ class TCPCheck(object):
 
     If source_port is not None, the specified port is used for outgoing
     traffic to the host.
+
+    Checks of this class (and its subclasses) with the same parameters may be
+    shared by a failover.graph.CheckGraph.
     """
+    # See failover.graph: instances hold no health state of their own, so
+    # instances constructed with the same parameters are interchangeable.
+    shareable = True
 
     def __init__(self, host, port, timeout, source_host=None, source_port=None,
                  name=None):
@@ -48,13 +54,23 @@ class TCPCheck(object):
 
         return
 
+    def connect(self):
+        """
+        tcp_check.connect() -> socket
+
+        Open a connection to the configured host and port, using the connect
+        timeout and source address given at construction.  Raises
+        socket.error if the connection cannot be established.
+        """
+        return socket.create_connection(
+            (self.host, self.port), self.timeout,
+            (self.source_host, self.source_port))
+
     def __call__(self):
         log = getLogger("failover.tcp")
         try:
             log.info("Connecting to %s:%d", self.host, self.port)
-            socket.create_connection(
-                (self.host, self.port), self.timeout,
-                (self.source_host, self.source_port))
+            self.connect().close()
             log.info("Connection to %s:%d succeeded", self.host, self.port)
             return ok
         except socket.error as e:
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from logging import getLogger
+from .tcp import TCPCheck
+from .units import ok, fail, second
+from .validation import validate_duration, validate_hostname
+import socket
+import ssl
+
+log = getLogger("failover.tls")
+
+class TLSCheck(TCPCheck):
+    """
+    TLSCheck(host, port=443, timeout=second(10), handshake_timeout=second(10),
+             server_hostname=None, tls_context=None, source_host=None,
+             source_port=None, name=None)
+
+    Create a TLSCheck object that performs a healthcheck on a TLS service when
+    called.  The check succeeds if we are able to connect within timeout and
+    complete a TLS handshake within handshake_timeout.
+
+    The handshake is performed using tls_context (an ssl.SSLContext; the
+    system default context, which verifies the certificate chain and hostname,
+    is used if this is None).  server_hostname is sent via SNI and used for
+    hostname verification; it defaults to host.
+
+    Unlike HTTPCheck and SMTPCheck, connections are never held open between
+    checks: the handshake is the thing being tested, so each check performs a
+    full one.
+    """
+
+    def __init__(self, host, port=443, timeout=second(10),
+                 handshake_timeout=second(10), server_hostname=None,
+                 tls_context=None, source_host=None, source_port=None,
+                 name=None):
+        super(TLSCheck, self).__init__(
+            host=host, port=port, timeout=timeout, source_host=source_host,
+            source_port=source_port, name=name)
+        self.handshake_timeout = validate_duration(
+            handshake_timeout, "handshake_timeout")
+        self.server_hostname = validate_hostname(
+            server_hostname, "server_hostname", optional=True)
+        if self.server_hostname is None:
+            self.server_hostname = self.host
+
+        if tls_context is None:
+            tls_context = ssl.create_default_context()
+        self.tls_context = tls_context
+        return
+
+    def __call__(self):
+        try:
+            log.info("Connecting to %s:%d", self.host, self.port)
+            connection = self.connect()
+        except socket.error as e:
+            log.info("Connection to %s:%d failed: %s", self.host, self.port,
+                     e)
+            return fail
+
+        try:
+            connection.settimeout(self.handshake_timeout)
+            connection = self.tls_context.wrap_socket(
+                connection, server_hostname=self.server_hostname)
+            log.info("TLS handshake with %s:%d succeeded (%s)", self.host,
+                     self.port, connection.version())
+            return ok
+        except (socket.error, ssl.SSLError, ValueError) as e:
+            # ssl.CertificateError is a ValueError on older Pythons.
+            log.info("TLS handshake with %s:%d failed: %s", self.host,
+                     self.port, e)
+            return fail
+        finally:
+            connection.close()
+
+    def __repr__(self):
+        if self.name is not None:
+            return self.name
+        else:
+            return ("TLSCheck(host=%r, port=%r, timeout=%r, "
+                    "handshake_timeout=%r, server_hostname=%r)" % (
+                        self.host, self.port, self.timeout,
+                        self.handshake_timeout, self.server_hostname))
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
 from logging import getLogger
+from threading import Lock
+from .errorlog import ErrorLog
+from .events import Observable
 from .units import ok, fail
 
-class Toggle(object):
+# Failures of underlying tasks; see failover.errorlog.
+error_log = ErrorLog(getLogger("failover.toggle"))
+
+class Toggle(Observable):
     """
     Toggle(to_fail, to_ok, initial_state=ok, name=None)
 
@@ -22,39 +28,90 @@ class Toggle(object):
     For example, to_fail will invoke the actual check; to_ok will be a Oneshot
     object.  When the to_fail task fails, the state will change to fail.  Only
     when the Oneshot object is fired will this task then change back to ok.
+
+    Observers (see failover.events.Observable) are notified when the state
+    changes.
+
+    Exceptions raised by the tasks are logged (at most once per minute for
+    identical exceptions; see failover.errorlog), counted in errors, and
+    leave the state unchanged.
+
+    Toggle objects may be called from several threads at once.  The tasks run
+    without any lock held; a task's result only changes the state if no other
+    call has changed it since the task was chosen.
     """
     def __init__(self, to_fail, to_ok, initial_state=ok, name=None):
         super(Toggle, self).__init__()
         self.to_fail = to_fail
         self.to_ok = to_ok
         self.state = initial_state
+        self.errors = 0
         self.name = name
+        self.lock = Lock()
         return
 
     def __call__(self):
         log = getLogger("failover.toggle")
 
-        task = self.to_fail if self.state else self.to_ok
-        toggle_result = not self.state
+        state = self.state
+        task = self.to_fail if state else self.to_ok
+        toggle_result = not state
         log.info("Current state is %s; invoking task %r",
-                 ("OK" if self.state else "FAIL"), task)
+                 ("OK" if state else "FAIL"), task)
         
         try:
             task_result = bool(task())
 
             if task_result == toggle_result:
-                self.state = not self.state
-                log.info("Task %r returned OK; setting state to %s",
-                         task, ("OK" if self.state else "FAIL"))
+                with self.lock:
+                    if self.state != state:
+                        # Another call toggled the state while our task was
+                        # running; its result no longer applies.
+                        log.info("Task %r returned %s, but state is already "
+                                 "%s", task, ("OK" if task_result else "FAIL"),
+                                 ("OK" if self.state else "FAIL"))
+                        return self.state
+
+                    self.state = toggle_result
+                    log.info("Task %r returned OK; setting state to %s",
+                             task, ("OK" if self.state else "FAIL"))
+                    self.state_changed(state, self.state,
+                                       "Task %r returned %s" %
+                                       (task, ("OK" if task_result
+                                               else "FAIL")))
             else:
                 log.info("Task %r returned FAIL; keeping state as %s",
                          task, ("OK" if self.state else "FAIL"))
         except Exception as e:
-            log.error("Task %r failed; preserving current state %s",
-                      task, ("OK" if self.state else "FAIL"))
+            self.errors += 1
+            error_log.error("Task %r failed; preserving current state %s",
+                            task, ("OK" if self.state else "FAIL"))
 
         return self.state
 
+    def save_state(self):
+        """
+        toggle.save_state() -> dict
+
+        Return a JSON-serializable snapshot of the current state.  See
+        failover.snapshot.StateSnapshot.
+        """
+        return {"state": self.state}
+
+    def restore_state(self, state):
+        """
+        toggle.restore_state(state)
+
+        Restore a snapshot previously returned by save_state().
+        """
+        with self.lock:
+            old_state = self.state
+            self.state = bool(state["state"])
+            if self.state != old_state:
+                self.state_changed(old_state, self.state,
+                                   "Restored from snapshot")
+        return
+
     def __repr__(self):
         if self.name is not None:
             return self.name
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from functools import partial
+from heapq import heappush, heapreplace
+from itertools import count as counter
+from json import dumps
+from logging import getLogger
+from six.moves.http_client import OK
+from six.moves.urllib.parse import parse_qs, urlsplit
+from threading import local, Lock
+from time import time
+from types import BuiltinFunctionType, FunctionType, MethodType
+from .handler import current_handler
+from .snapshot import SUBTASK_ATTRIBUTES
+
+log = getLogger("failover.trace")
+
+# Callables whose type can't (or shouldn't) be instrumented.  Their time is
+# included in that of the task calling them.
+UNTRACEABLE_TYPES = (BuiltinFunctionType, FunctionType, MethodType, partial)
+
+class Tracer(object):
+    """
+    Tracer(server, slowest=10, path="/_trace")
+
+    Create a Tracer object that records how long each task in the tree of
+    each of server's components takes, keeping the slowest traces for each
+    component and serving them as JSON on path.
+
+    Tracing works by replacing the __call__ method of each class of task found
+    in the components (Hysteresis, TCPCheck, and so on) until close() is
+    called; nothing is instrumented unless a Tracer is active, so tracing
+    costs nothing when it is not in use.  Plain functions are not
+    instrumented; their time is included in that of the task calling them.
+
+    A trace starts whenever an instrumented task is called and no trace is
+    in progress in the current thread: for a health check request, or for
+    the task run by a Background thread.  The slowest traces for each
+    component (up to slowest) are kept.
+
+    Only one Tracer should be active at a time.
+    """
+    def __init__(self, server, slowest=10, path="/_trace"):
+        super(Tracer, self).__init__()
+        if not isinstance(slowest, int) or slowest <= 0:
+            raise ValueError("slowest must be a positive integer")
+
+        self.server = server
+        self.slowest = slowest
+        self.path = path
+        self.lock = Lock()
+        self.local = local()
+
+        # component name -> heap of (duration, sequence, span, source,
+        # timestamp); the fastest kept trace is at the top.
+        self.traces = {}
+        self.sequence = counter()
+
+        # id(task) -> component name, for every task in every component.
+        self.owners = {}
+
+        # class -> its own __call__ before instrumentation (None if it was
+        # inherited), in the order instrumented.
+        self.patched = []
+
+        self.refresh()
+        server.endpoints[path] = self.handle
+        return
+
+    def refresh(self):
+        """
+        tracer.refresh()
+
+        Instrument the tasks of components added to the server since the
+        tracer was created or last refreshed.
+        """
+        owners = {}
+        for name, task in list(self.server.get_handlers.items()):
+            self.walk(name, task, owners)
+        self.owners = owners
+        return
+
+    def walk(self, name, task, owners):
+        """
+        tracer.walk(name, task, owners)
+
+        Instrument task and the tasks it wraps, recording them in owners as
+        belonging to the component name.
+        """
+        owners[id(task)] = name
+        self.instrument(type(task))
+        for attr in SUBTASK_ATTRIBUTES:
+            subtask = getattr(task, attr, None)
+            if subtask is not None:
+                self.walk(name, subtask, owners)
+        return
+
+    def instrument(self, cls):
+        """
+        tracer.instrument(cls)
+
+        Replace the __call__ method of cls with one that records its timing.
+        """
+        if (issubclass(cls, UNTRACEABLE_TYPES) or
+            any(patched is cls for patched, _ in self.patched) or
+            not hasattr(cls, "__call__")):
+            return
+
+        current = cls.__call__
+        # Don't trace twice if a base class is already instrumented.
+        original = getattr(current, "original", current)
+        tracer = self
+
+        def traced_call(task, *args, **kw):
+            return tracer.call(original, task, args, kw)
+        traced_call.original = original
+
+        own = cls.__dict__.get("__call__")
+        try:
+            cls.__call__ = traced_call
+        except TypeError:
+            # Extension types can't be modified.
+            return
+
+        self.patched.append((cls, own))
+        return
+
+    def call(self, original, task, args, kw):
+        """
+        tracer.call(original, task, args, kw)
+
+        Call the original __call__ method of task, timing it as part of the
+        trace in progress (or a new trace, if there is none).
+        """
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        elif stack and stack[-1][0] is task:
+            # An instrumented subclass calling its base class.
+            return original(task, *args, **kw)
+
+        # [task, start, end, children, exception name]
+        span = [task, time(), None, [], None]
+        if stack:
+            stack[-1][3].append(span)
+        stack.append(span)
+
+        try:
+            return original(task, *args, **kw)
+        except Exception as e:
+            span[4] = type(e).__name__
+            raise
+        finally:
+            span[2] = time()
+            stack.pop()
+            if not stack:
+                self.record(span)
+
+    def record(self, span):
+        """
+        tracer.record(span)
+
+        Keep a completed trace if it is among the slowest for its component.
+        """
+        task, start, end = span[:3]
+        duration = end - start
+        name = self.owners.get(id(task))
+        if name is None:
+            name = repr(task)
+        source = "request" if current_handler() is not None else "background"
+
+        with self.lock:
+            heap = self.traces.setdefault(name, [])
+            entry = (duration, next(self.sequence), span, source, start)
+            if len(heap) < self.slowest:
+                heappush(heap, entry)
+            elif duration > heap[0][0]:
+                heapreplace(heap, entry)
+        return
+
+    def report(self, names=None):
+        """
+        tracer.report(names=None) -> dict
+
+        Return the slowest traces for the components in names (or all
+        components, if names is None), slowest first, as JSON-serializable
+        mappings.
+        """
+        with self.lock:
+            traces = dict((name, list(heap))
+                          for name, heap in self.traces.items()
+                          if names is None or name in names)
+
+        result = {}
+        for name, entries in traces.items():
+            entries.sort(reverse=True)
+            result[name] = [{
+                "duration_ms": duration * 1000,
+                "timestamp": timestamp,
+                "source": source,
+                "span": span_to_dict(span),
+            } for duration, _, span, source, timestamp in entries]
+        return result
+
+    def handle(self, handler):
+        """
+        tracer.handle(handler)
+
+        Answer a request for the slowest traces.  "component" query
+        parameters (repeated or comma-separated) limit the components
+        reported.
+        """
+        self.refresh()
+        query = parse_qs(urlsplit(handler.path).query)
+        names = None
+        if "component" in query:
+            names = set()
+            for value in query["component"]:
+                names.update(name for name in value.split(",") if name)
+
+        return handler.respond(
+            OK, dumps({"components": self.report(names)}, sort_keys=True),
+            content_type="application/json")
+
+    def reset(self):
+        """
+        tracer.reset()
+
+        Discard all recorded traces.
+        """
+        with self.lock:
+            self.traces = {}
+        return
+
+    def close(self):
+        """
+        tracer.close()
+
+        Stop tracing: restore the instrumented classes and remove the trace
+        endpoint.
+        """
+        if self.server.endpoints.get(self.path) == self.handle:
+            del self.server.endpoints[self.path]
+
+        for cls, own in reversed(self.patched):
+            if own is None:
+                del cls.__call__
+            else:
+                cls.__call__ = own
+        self.patched = []
+        return
+
+def span_to_dict(span):
+    """
+    span_to_dict(span) -> dict
+
+    Convert a recorded span (and its children) into a JSON-serializable
+    mapping.
+    """
+    task, start, end, children, error = span
+    result = {
+        "task": repr(task),
+        "duration_ms": (end - start) * 1000,
+    }
+    if error is not None:
+        result["error"] = error
+    if children:
+        result["children"] = [span_to_dict(child) for child in children]
+    return result
@@ -1,18 +1,195 @@
 #!/usr/bin/env python
-from __future__ import absolute_import, print_function
-import units, units.predefined
+from __future__ import absolute_import, division, print_function
+import sys
 
 """
 Units used for time and counts.
+
+These are deliberately minimal: a quantity is a number tagged with a unit,
+and units are either times (convertible to seconds) or counts.  Quantities
+from the third-party units library are accepted wherever these are (see
+convert()), but that library is not needed at runtime.
 """
 
-# Make sure base SI units are defined.
-units.predefined.define_units()
-second = units.unit('s')
-minute = units.unit('min')
-hour = units.unit('hour')
-day = units.unit('day')
-count = units.unit('count')
+# Dimensions
+TIME = "time"
+COUNT = "count"
+
+class IncompatibleUnitsError(TypeError):
+    """
+    Raised when combining or comparing quantities of different dimensions,
+    e.g. a time and a count.
+    """
+
+class Unit(object):
+    """
+    Unit(name, dimension, scale)
+
+    A unit of time or count.  Calling a unit with a number creates a quantity
+    of that unit, e.g. second(10).  scale is the size of the unit in terms of
+    the base unit of its dimension (seconds or counts).
+    """
+    __slots__ = ("name", "dimension", "scale")
+
+    def __init__(self, name, dimension, scale):
+        super(Unit, self).__init__()
+        self.name = name
+        self.dimension = dimension
+        self.scale = scale
+        return
+
+    def __call__(self, num):
+        return Quantity(num, self)
+
+    def __repr__(self):
+        return self.name
+
+class Quantity(object):
+    """
+    Quantity(num, unit)
+
+    A number of the given unit.  Quantities of the same dimension can be
+    added, subtracted and compared regardless of their units; dividing one by
+    another yields a plain number.
+    """
+    __slots__ = ("num", "unit")
+
+    def __init__(self, num, unit):
+        super(Quantity, self).__init__()
+        if isinstance(num, bool) or not isinstance(num, NUMBER_TYPES):
+            raise TypeError("Quantity must be numeric: %r" % (num,))
+        self.num = num
+        self.unit = unit
+        return
+
+    @property
+    def base(self):
+        """
+        The value of this quantity in seconds (for times) or counts.
+        """
+        return self.num * self.unit.scale
+
+    def coerce(self, other):
+        """
+        quantity.coerce(other) -> Quantity
+
+        Return other as a quantity of the same dimension as this one, raising
+        IncompatibleUnitsError if this is not possible.
+        """
+        if not isinstance(other, Quantity):
+            other = convert(other)
+            if other is None:
+                raise IncompatibleUnitsError(
+                    "Cannot combine %r with a non-quantity" % (self,))
+
+        if other.unit.dimension != self.unit.dimension:
+            raise IncompatibleUnitsError(
+                "Cannot combine %r with %r" % (self, other))
+        return other
+
+    def __add__(self, other):
+        other = self.coerce(other)
+        return Quantity(self.num + other.base / self.unit.scale, self.unit)
+
+    def __sub__(self, other):
+        other = self.coerce(other)
+        return Quantity(self.num - other.base / self.unit.scale, self.unit)
+
+    def __mul__(self, other):
+        if not isinstance(other, NUMBER_TYPES):
+            return NotImplemented
+        return Quantity(self.num * other, self.unit)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, NUMBER_TYPES):
+            return Quantity(self.num / other, self.unit)
+        return self.base / self.coerce(other).base
+
+    __div__ = __truediv__
+
+    def __neg__(self):
+        return Quantity(-self.num, self.unit)
+
+    def __eq__(self, other):
+        try:
+            return self.base == self.coerce(other).base
+        except (IncompatibleUnitsError, ValueError):
+            # ValueError: a units library quantity that isn't a time or count.
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        return self.base < self.coerce(other).base
+
+    def __le__(self, other):
+        return self.base <= self.coerce(other).base
+
+    def __gt__(self, other):
+        return self.base > self.coerce(other).base
+
+    def __ge__(self, other):
+        return self.base >= self.coerce(other).base
+
+    def __hash__(self):
+        return hash((self.unit.dimension, self.base))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.unit.name, self.num)
+
+    __str__ = __repr__
+
+try:
+    NUMBER_TYPES = (int, long, float)
+except NameError:
+    NUMBER_TYPES = (int, float)
+
+second = Unit("second", TIME, 1)
+minute = Unit("minute", TIME, 60)
+hour = Unit("hour", TIME, 3600)
+day = Unit("day", TIME, 86400)
+count = Unit("count", COUNT, 1)
+
+# Units library names -> our units, for convert().
+FOREIGN_UNITS = {
+    "s": second,
+    "min": minute,
+    "h": hour,
+    "hour": hour,
+    "day": day,
+    "count": count,
+}
+
+def convert(value):
+    """
+    convert(value) -> Quantity or None
+
+    Convert a quantity from the third-party units library into the
+    equivalent Quantity.  None is returned if value is not such a quantity.
+    ValueError is raised if it is not a time or count.
+
+    The units library is never imported here; if it hasn't been imported by
+    the caller, value cannot be one of its quantities.
+    """
+    module = sys.modules.get("units.quantity")
+    if module is None or not isinstance(value, module.Quantity):
+        return None
+
+    unit = FOREIGN_UNITS.get(str(value.unit))
+    if unit is not None:
+        return unit(value.num)
+
+    # Other multiples of seconds (ms, etc.) reduce to the SI second.
+    canonical = value.unit.canonical()
+    if str(canonical) == "s":
+        seconds = value / canonical(1.0)
+        if isinstance(seconds, NUMBER_TYPES):
+            return second(seconds)
+
+    raise ValueError("%s is not a time or count unit" % (value.unit,))
 
 # Mapping boolean results to OK/Failure -- this can be a bit ambiguous since
 # we expect "health_check()" to be true if the service is healthy (the
@@ -2,8 +2,7 @@
 from __future__ import absolute_import, print_function
 import socket
 from types import NoneType
-from .units import count, second
-from units.quantity import Quantity
+from .units import convert, count, second, COUNT, Quantity, TIME
 
 def validate_hostname(hostname, parameter_name="host", optional=False):
     """
@@ -70,25 +69,30 @@ def validate_duration(duration, parameter_name="duration"):
     validate_duration(duration, parameter_name="duration") -> float
 
     Verify a given parameter is a valid duration; this must be a non-negative
-    number (int or float) or, preferably, a time quantity from the units
-    library (see failover.units).  If the parameter is not valid, an exception
-    is raised (naming the offending parameter via parameter_name).
+    number (int or float) or, preferably, a time quantity (see failover.units;
+    time quantities from the units library are also accepted).  If the
+    parameter is not valid, an exception is raised (naming the offending
+    parameter via parameter_name).
     
     The return value is a float indicating the duration in seconds.
     """
     errmsg = (parameter_name + " must be a non-negative time unit or numeric "
               "value in seconds: %r")
-    if isinstance(duration, Quantity):
-        duration = duration / second(1.0)
-        if not isinstance(duration, (int, long, float)) or duration < 0:
-            raise ValueError(errmsg % (duration,))
-    elif isinstance(duration, (int, long, float)):
+    if isinstance(duration, (int, long, float)):
         if duration < 0:
             raise ValueError(errmsg % (duration,))
-    else:
-        raise TypeError(errmsg % (duration,))
+        return float(duration)
+
+    if not isinstance(duration, Quantity):
+        converted = convert(duration)
+        if converted is None:
+            raise TypeError(errmsg % (duration,))
+        duration = converted
 
-    return float(duration)
+    if duration.unit.dimension is not TIME or duration.num < 0:
+        raise ValueError(errmsg % (duration,))
+
+    return float(duration.base)
 
 def validate_after(after, parameter_name="after"):
     """
@@ -96,33 +100,33 @@ def validate_after(after, parameter_name="after"):
 
     Verify a given parameter is a valid event; this must be a positive count
     (int or failover.units.count quantity) or a positive time unit (see
-    failover.units).  If the parameter is not valid, an exception is raised
-    (naming the offending parameter via parameter_name).
+    failover.units; quantities from the units library are also accepted).  If
+    the parameter is not valid, an exception is raised (naming the offending
+    parameter via parameter_name).
 
     The return value is a quantity with either second or count units.
     """
     errmsg = (parameter_name + " must be a positive time or count unit, "
               "or positive integer count")
-    if isinstance(after, Quantity):
-        after_unit = after.unit.canonical()
-
-        if after_unit is count:
-            # Don't do anything to the value
-            if after.num <= 0:
-                raise ValueError(errmsg)
-        elif after_unit is second:
-            # Convert the value to seconds
-            if after.num <= 0:
-                raise ValueError(errmsg)
-            after = second(0) + after
-        else:
-            raise ValueError(errmsg)
-    elif isinstance(after, (int, long)):
+    if isinstance(after, (int, long)):
         if after <= 0:
             raise ValueError(errmsg)
-        after = count(after)
+        return count(after)
+
+    if not isinstance(after, Quantity):
+        converted = convert(after)
+        if converted is None:
+            raise TypeError(errmsg)
+        after = converted
+
+    if after.num <= 0:
+        raise ValueError(errmsg)
+
+    if after.unit.dimension is COUNT:
+        # Don't do anything to the value
+        return after
+    elif after.unit.dimension is TIME:
+        # Convert the value to seconds
+        return second(after.base)
     else:
-        raise TypeError(errmsg)
-
-    return after
-
+        raise ValueError(errmsg)
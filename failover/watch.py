@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+from __future__ import absolute_import, print_function
+from collections import deque
+from functools import partial
+from json import dumps
+from logging import getLogger
+from six.moves.http_client import NOT_FOUND, NOT_MODIFIED, OK
+from six.moves.urllib.parse import parse_qs, urlsplit
+import socket
+from threading import Condition
+from time import time
+from .events import find_observable
+from .units import second
+from .validation import validate_duration
+
+log = getLogger("failover.watch")
+
+class WatchHub(object):
+    """
+    WatchHub(server, path="/_watch", timeout=second(30), history=1000)
+
+    Create a WatchHub object that serves the states of server's components on
+    path, holding each request open until a state changes rather than making
+    clients poll.  server must be a HealthCheckServer created with
+    threaded=True.
+
+    Changes are reported when the outermost Hysteresis, Toggle, Oneshot or
+    Background object of a component changes state (see
+    failover.events.Observable); wrap checks in a Background object so that
+    changes are detected without polling.  Components without any of these
+    have a null state.
+
+    Two protocols are supported:
+
+    * Long polling: a GET request returns a JSON document mapping component
+      names to "OK" or "FAIL", with an ETag header.  If the request carries
+      an If-None-Match header with the current ETag, the response is delayed
+      until some state changes (200) or timeout expires (304 Not Modified).
+      A "timeout" query parameter may request a shorter wait.
+
+    * Server-Sent Events: if the request accepts text/event-stream, the
+      connection is held open.  A "state" event carrying the full document is
+      sent first, followed by a "change" event for each state change.  A
+      client reconnecting with Last-Event-ID receives the changes it missed,
+      if they are among the last history changes.  A comment is sent every
+      timeout to detect disconnected clients.
+
+    Either protocol accepts "component" query parameters (repeated or
+    comma-separated) to watch only some components.
+    """
+    def __init__(self, server, path="/_watch", timeout=second(30),
+                 history=1000):
+        super(WatchHub, self).__init__()
+        if not getattr(server, "threaded", False):
+            raise ValueError("server must be created with threaded=True")
+
+        self.server = server
+        self.path = path
+        self.timeout = validate_duration(timeout, "timeout")
+        self.lock = Condition()
+        self.exit_requested = False
+
+        # The version is incremented on every change; each component
+        # remembers the version at which it last changed.
+        self.version = 0
+        self.versions = {}
+        self.states = {}
+        self.events = deque(maxlen=history)
+
+        # component name -> (observable, observer)
+        self.watched = {}
+
+        self.refresh()
+        server.endpoints[path] = self.handle
+        return
+
+    def refresh(self):
+        """
+        hub.refresh()
+
+        Start observing components added to the server since the last
+        refresh, and forget those that have been removed.
+        """
+        components = {}
+        for name, task in list(self.server.get_handlers.items()):
+            components[name] = find_observable(task)
+
+        with self.lock:
+            changed = False
+            for name in list(self.states):
+                if name not in components:
+                    self.unwatch(name)
+                    del self.states[name]
+                    del self.versions[name]
+                    changed = True
+
+            for name, observable in components.items():
+                if name in self.states and (
+                        self.watched.get(name, (None,))[0] is observable):
+                    continue
+
+                self.unwatch(name)
+                if observable is not None:
+                    observer = partial(self.changed, name)
+                    observable.add_observer(observer)
+                    self.watched[name] = (observable, observer)
+                    state = observable.observed_state()
+                else:
+                    state = None
+
+                self.version += 1
+                self.states[name] = state
+                self.versions[name] = self.version
+                changed = True
+
+            if changed:
+                # Clients streaming changes can't be told about added or
+                # removed components incrementally; make them resynchronize.
+                self.events.clear()
+                self.lock.notify_all()
+        return
+
+    def unwatch(self, name):
+        """
+        hub.unwatch(name)
+
+        Stop observing the component name.  The lock must be held.
+        """
+        observable, observer = self.watched.pop(name, (None, None))
+        if observable is not None:
+            observable.remove_observer(observer)
+        return
+
+    def changed(self, name, change):
+        """
+        hub.changed(name, change)
+
+        Record a state change (a failover.events.StateChange) of the
+        component name and wake any waiting requests.
+        """
+        with self.lock:
+            self.version += 1
+            self.states[name] = bool(change.new)
+            self.versions[name] = self.version
+            self.events.append((self.version, name, change))
+            self.lock.notify_all()
+        return
+
+    def document(self, names):
+        """
+        hub.document(names) -> (version, dict)
+
+        Return the version and states of the components in names (or all
+        components, if names is None).  The lock must be held.
+        """
+        if names is None:
+            names = self.states
+        else:
+            # Components may have been removed while we waited.
+            names = [name for name in names if name in self.states]
+
+        version = max([0] + [self.versions[name] for name in names])
+        states = dict((name, state_name(self.states[name])) for name in names)
+        return version, {"version": version, "components": states}
+
+    def handle(self, handler):
+        """
+        hub.handle(handler)
+
+        Answer a watch request made to the server.
+        """
+        query = parse_qs(urlsplit(handler.path).query)
+        names = None
+        if "component" in query:
+            names = set()
+            for value in query["component"]:
+                names.update(name for name in value.split(",") if name)
+
+        self.refresh()
+        with self.lock:
+            unknown = sorted((names or set()) - set(self.states))
+        if unknown:
+            return handler.respond(NOT_FOUND, u"Unknown component %s" %
+                                   (", ".join(unknown),))
+
+        if "text/event-stream" in handler.headers.get("Accept", ""):
+            return self.stream(handler, names)
+
+        timeout = self.timeout
+        try:
+            timeout = min(timeout, float(query["timeout"][0]))
+        except (KeyError, ValueError):
+            pass
+        return self.long_poll(handler, names, timeout)
+
+    def long_poll(self, handler, names, timeout):
+        """
+        hub.long_poll(handler, names, timeout)
+
+        Respond with the current states, waiting up to timeout seconds for a
+        change if the client already has them.
+        """
+        known = handler.headers.get("If-None-Match")
+        deadline = time() + timeout
+
+        with self.lock:
+            while True:
+                version, document = self.document(names)
+                etag = '"%d"' % version
+                if etag != known or self.exit_requested:
+                    break
+
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return handler.respond(NOT_MODIFIED, u"",
+                                           headers={"ETag": etag})
+                self.lock.wait(remaining)
+
+        return handler.respond(
+            OK, dumps(document, sort_keys=True), headers={"ETag": etag},
+            content_type="application/json")
+
+    def stream(self, handler, names):
+        """
+        hub.stream(handler, names)
+
+        Send Server-Sent Events to the client until it disconnects or the
+        hub is closed.
+        """
+        handler.send_response(OK)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+
+        try:
+            last_id = int(handler.headers.get("Last-Event-ID"))
+        except (TypeError, ValueError):
+            last_id = None
+
+        with self.lock:
+            sent = self.version
+            missed = None
+            if last_id is not None:
+                missed = self.events_since(last_id)
+            if missed is None:
+                messages = [("state", sent, self.document(names)[1])]
+            else:
+                messages = self.change_messages(missed, names)
+
+        try:
+            while True:
+                for event, event_id, data in messages:
+                    handler.wfile.write(
+                        ("event: %s\nid: %d\ndata: %s\n\n" %
+                         (event, event_id, dumps(data, sort_keys=True))
+                        ).encode("utf-8"))
+                if not messages:
+                    handler.wfile.write(b": keepalive\n\n")
+                handler.wfile.flush()
+
+                self.refresh()
+                with self.lock:
+                    if self.version == sent and not self.exit_requested:
+                        self.lock.wait(self.timeout)
+                    if self.exit_requested:
+                        break
+
+                    missed = self.events_since(sent)
+                    if missed is None:
+                        # We fell too far behind; resynchronize.
+                        messages = [("state", self.version,
+                                     self.document(names)[1])]
+                    else:
+                        messages = self.change_messages(missed, names)
+                    sent = self.version
+        except socket.error as e:
+            log.debug("Watch client disconnected: %s", e)
+        return
+
+    def events_since(self, version):
+        """
+        hub.events_since(version) -> list or None
+
+        Return the recorded (version, name, change) events after version, or
+        None if some of them have been discarded.  The lock must be held.
+        """
+        if version >= self.version:
+            return []
+
+        if not self.events or self.events[0][0] > version + 1:
+            return None
+
+        return [event for event in self.events if event[0] > version]
+
+    def change_messages(self, events, names):
+        """
+        hub.change_messages(events, names) -> list
+
+        Convert events into (event, id, data) Server-Sent Event messages,
+        dropping those for components not in names (unless names is None).
+        """
+        messages = []
+        for version, name, change in events:
+            if names is not None and name not in names:
+                continue
+            messages.append(("change", version, {
+                "component": name,
+                "old": state_name(change.old),
+                "new": state_name(change.new),
+                "timestamp": change.timestamp,
+                "reason": change.reason,
+            }))
+        return messages
+
+    def close(self):
+        """
+        hub.close()
+
+        Stop serving watch requests, ending any that are in progress.
+        """
+        if self.server.endpoints.get(self.path) == self.handle:
+            del self.server.endpoints[self.path]
+
+        with self.lock:
+            self.exit_requested = True
+            for name in list(self.watched):
+                self.unwatch(name)
+            self.lock.notify_all()
+        return
+
+def state_name(state):
+    """
+    state_name(state) -> str or None
+
+    Convert a state to "OK" or "FAIL"; None (unknown) is returned unchanged.
+    """
+    if state is None:
+        return None
+    return "OK" if state else "FAIL"
@@ -17,10 +17,11 @@ class run_coverage(Command):
 setup(name="FailoverSample",
       version="0.1.0",
       cmdclass={"coverage": run_coverage},
-      py_modules=["failover"],
+      packages=["failover"],
       entry_points={
           "console_scripts": [
               "failover-server=failover:start_failover_server",
+              "failover-probe=failover.probe:main",
           ]
       },
       test_suite="tests",
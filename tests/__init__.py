@@ -2,19 +2,67 @@ from __future__ import absolute_import, print_function
 from unittest import defaultTestLoader as loader, TestSuite
 
 def suite():
+    import tests.admission_test
     import tests.background_test
+    import tests.budget_test
+    import tests.compact_test
+    import tests.concurrency_test
+    import tests.config_test
+    import tests.errorlog_test
+    import tests.events_test
+    import tests.fastparse_test
+    import tests.graph_test
+    import tests.handler_test
+    import tests.http_test
     import tests.hysteresis_test
     import tests.oneshot_test
+    import tests.passive_test
+    import tests.pool_test
+    import tests.prefork_test
+    import tests.probe_test
+    import tests.remote_test
+    import tests.smtp_test
+    import tests.snapshot_test
+    import tests.statetable_test
     import tests.tcp_test
+    import tests.tls_test
     import tests.toggle_test
+    import tests.trace_test
+    import tests.units_test
+    import tests.unix_test
+    import tests.watch_test
 
     ts = TestSuite()
     for module in [
+            tests.admission_test,
             tests.background_test,
+            tests.budget_test,
+            tests.compact_test,
+            tests.concurrency_test,
+            tests.config_test,
+            tests.errorlog_test,
+            tests.events_test,
+            tests.fastparse_test,
+            tests.graph_test,
+            tests.handler_test,
+            tests.http_test,
             tests.hysteresis_test,
             tests.oneshot_test,
+            tests.passive_test,
+            tests.pool_test,
+            tests.prefork_test,
+            tests.probe_test,
+            tests.remote_test,
+            tests.smtp_test,
+            tests.snapshot_test,
+            tests.statetable_test,
             tests.tcp_test,
-            tests.toggle_test
+            tests.tls_test,
+            tests.toggle_test,
+            tests.trace_test,
+            tests.units_test,
+            tests.unix_test,
+            tests.watch_test
     ]:
         ts.addTest(loader.loadTestsFromModule(module))
 
@@ -0,0 +1,175 @@
+from __future__ import absolute_import, print_function
+from failover import ok
+from failover.admission import AdmissionControl, TokenBucket
+import logging
+from six.moves.http_client import HTTPConnection, OK, SERVICE_UNAVAILABLE
+from sys import stderr
+from threading import Event, Thread
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class BlockingTask(object):
+    def __init__(self):
+        super(BlockingTask, self).__init__()
+        self.started = Event()
+        self.proceed = Event()
+        self.calls = 0
+        return
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.proceed.wait(10)
+        return ok
+
+class AdmissionTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.calls = 0
+        self.server = create_server(threaded=True)
+        self.server.add_component("counted", self.counted)
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def counted(self):
+        self.calls += 1
+        return ok
+
+    def get(self, path):
+        con = HTTPConnection(LOOPBACK, self.server.port)
+        con.request("GET", path)
+        response = con.getresponse()
+        response.read()
+        con.close()
+        return response
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2.0, burst=3.0)
+        now = bucket.updated
+        for i in range(3):
+            self.assertEqual(bucket.take(now), 0.0)
+        self.assertAlmostEqual(bucket.take(now), 0.5)
+        self.assertAlmostEqual(bucket.take(now + 0.25), 0.25)
+        self.assertEqual(bucket.take(now + 0.5), 0.0)
+
+        # Tokens never accumulate beyond the burst size.
+        now += 100
+        for i in range(3):
+            self.assertEqual(bucket.take(now), 0.0)
+        self.assertGreater(bucket.take(now), 0.0)
+        return
+
+    def test_rate(self):
+        admission = AdmissionControl(self.server, rate=0.01, burst=2)
+        start_server(self.server)
+        try:
+            statuses = [self.get("/counted").status for i in range(2)]
+            response = self.get("/counted")
+        finally:
+            stop_server(self.server)
+
+        self.assertEqual(statuses, [OK, OK])
+        self.assertEqual(response.status, SERVICE_UNAVAILABLE)
+        self.assertEqual(response.getheader("Retry-After"), "100")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(admission.rejected, 1)
+        self.assertEqual(admission.in_flight, 0)
+        return
+
+    def test_client_rate(self):
+        admission = AdmissionControl(self.server, client_rate=0.01,
+                                     client_burst=1, max_clients=1)
+        self.assertEqual(admission.admit("10.0.0.1"), None)
+        self.assertGreater(admission.admit("10.0.0.1"), 0)
+        # Another client has its own allowance.
+        self.assertEqual(admission.admit("10.0.0.2"), None)
+        # ... and only max_clients buckets are kept, so the first client
+        # has been forgotten.
+        self.assertEqual(list(admission.client_buckets), ["10.0.0.2"])
+        self.assertEqual(admission.admit("10.0.0.1"), None)
+        self.assertEqual(admission.in_flight, 3)
+        return
+
+    def test_client_starvation(self):
+        # A client over its own limit doesn't use up the overall allowance.
+        admission = AdmissionControl(self.server, rate=10, burst=10,
+                                     client_rate=1, client_burst=1)
+        waits = [admission.admit("10.0.0.1") for i in range(10)]
+        self.assertEqual(waits[0], None)
+        self.assertTrue(all(wait > 0 for wait in waits[1:]))
+        self.assertEqual(admission.admit("10.0.0.2"), None)
+        self.assertGreaterEqual(admission.bucket.tokens, 8)
+        self.assertLess(admission.bucket.tokens, 9)
+
+        # A client rejected by the overall limit keeps its own token.
+        admission = AdmissionControl(self.server, rate=0.01, burst=1,
+                                     client_rate=0.01, client_burst=1)
+        self.assertEqual(admission.admit("10.0.0.1"), None)
+        self.assertGreater(admission.admit("10.0.0.2"), 0)
+        self.assertEqual(admission.client_buckets["10.0.0.2"].tokens, 1)
+        return
+
+    def test_max_in_flight(self):
+        admission = AdmissionControl(self.server, max_in_flight=1)
+        self.assertEqual(admission.admit("10.0.0.1"), None)
+        self.assertEqual(admission.admit("10.0.0.2"), 1.0)
+        admission.release()
+        self.assertEqual(admission.admit("10.0.0.2"), None)
+        return
+
+    def test_max_concurrent(self):
+        task = BlockingTask()
+        self.server.add_component("blocking", task)
+        admission = AdmissionControl(self.server, max_concurrent=1)
+        admission.set_limit("counted", 2)
+        start_server(self.server)
+        try:
+            first = Thread(target=self.get, args=("/blocking",))
+            first.start()
+            try:
+                self.assertTrue(task.started.wait(10))
+
+                # The second request is rejected without waiting for (or
+                # running) the task.
+                response = self.get("/blocking")
+                self.assertEqual(response.status, SERVICE_UNAVAILABLE)
+                self.assertEqual(response.getheader("Retry-After"), "1")
+                self.assertEqual(task.calls, 1)
+
+                # Other components are unaffected.
+                self.assertEqual(self.get("/counted").status, OK)
+            finally:
+                task.proceed.set()
+                first.join()
+
+            self.assertEqual(self.get("/blocking").status, OK)
+        finally:
+            stop_server(self.server)
+
+        self.assertEqual(task.calls, 2)
+        self.assertEqual(admission.running, {})
+        self.assertEqual(admission.in_flight, 0)
+        return
+
+    def test_validation(self):
+        for kw in [{"rate": 0}, {"rate": "1"}, {"client_rate": -1},
+                   {"rate": 1, "burst": 0.5}, {"max_concurrent": 0},
+                   {"max_in_flight": 1.5}, {"max_clients": True}]:
+            with self.assertRaises(ValueError):
+                AdmissionControl(self.server, **kw)
+        self.assertEqual(self.server.admission, None)
+
+        admission = AdmissionControl(self.server, rate=0.5)
+        self.assertEqual(admission.burst, 1.0)
+        with self.assertRaises(ValueError):
+            admission.set_limit("counted", 0)
+        return
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,30 @@ class BackgroundTask(object):
             raise self.exception
         return self.state
 
+class ScriptedCondition(object):
+    """
+    A stand-in for the lock of a Background that records the delays waited
+    for instead of waiting, and stops the Background after waits of them.
+    """
+    def __init__(self, checker, waits):
+        super(ScriptedCondition, self).__init__()
+        self.checker = checker
+        self.waits = waits
+        self.delays = []
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def wait(self, timeout=None):
+        self.delays.append(timeout)
+        if len(self.delays) >= self.waits:
+            self.checker.exit_requested = True
+        return
+
 class BackgroundTest(TestCase):
     def setUp(self):
         logging.basicConfig(
@@ -64,4 +88,50 @@ class BackgroundTest(TestCase):
         checker.stop()
         return
 
-        
+    def test_adaptive(self):
+        task = BackgroundTask()
+        checker = Background(task=task, delay=second(0.05),
+                             max_delay=second(0.2), backoff=2,
+                             start_thread=False)
+        lock = checker.lock = ScriptedCondition(checker, waits=4)
+
+        # Stable results back off up to max_delay.
+        checker.run()
+        self.assertEqual(task.n_calls, 3)
+        self.assertEqual(lock.delays, [0.05, 0.1, 0.2, 0.2])
+
+        # A change is seen on the next call, and the interval snaps back.
+        task.state = fail
+        lock.delays = []
+        checker.exit_requested = False
+        checker.run()
+        self.assertFalse(checker())
+        self.assertEqual(task.n_calls, 6)
+        self.assertEqual(lock.delays, [0.2, 0.05, 0.1, 0.2])
+        return
+
+    def test_adapt(self):
+        checker = Background(task=BackgroundTask(), delay=second(0.05),
+                             max_delay=second(0.2), backoff=2,
+                             start_thread=False)
+        delays = []
+        for changed in (False, False, False, True, False):
+            checker.adapt(changed)
+            delays.append(checker.current_delay)
+        self.assertEqual(delays, [0.1, 0.2, 0.2, 0.05, 0.1])
+
+        # Without max_delay, the interval is fixed.
+        checker = Background(task=BackgroundTask(), delay=second(0.05),
+                             start_thread=False)
+        checker.adapt(False)
+        self.assertEqual(checker.current_delay, 0.05)
+        return
+
+    def test_adaptive_validation(self):
+        with self.assertRaises(ValueError):
+            Background(task=BackgroundTask(), delay=second(1),
+                       max_delay=second(0.5), start_thread=False)
+        with self.assertRaises(ValueError):
+            Background(task=BackgroundTask(), delay=second(1),
+                       max_delay=second(2), backoff=0.5, start_thread=False)
+        return
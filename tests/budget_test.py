@@ -0,0 +1,151 @@
+from __future__ import absolute_import, print_function
+from failover import Budget, fail, ok, second
+from failover.budget import STALE_HEADER
+import logging
+from six.moves.http_client import HTTPConnection, OK, SERVICE_UNAVAILABLE
+from sys import stderr
+from threading import Event
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class GatedTask(object):
+    """
+    A task returning state, which waits for the gate to open first.
+    """
+    def __init__(self, state):
+        super(GatedTask, self).__init__()
+        self.state = state
+        self.gate = Event()
+        self.gate.set()
+        self.calls = 0
+        self.exception = None
+        return
+
+    def __call__(self):
+        self.calls += 1
+        self.gate.wait(10)
+        if self.exception is not None:
+            raise self.exception
+        return self.state
+
+class BudgetTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+
+    def wait_idle(self, checker):
+        with checker.lock:
+            while checker.running:
+                checker.lock.wait(1)
+        return
+
+    def get(self, server, path):
+        con = HTTPConnection(LOOPBACK, server.port)
+        con.request("GET", path)
+        response = con.getresponse()
+        response.read()
+        con.close()
+        return response
+
+    def test_fast(self):
+        task = GatedTask(fail)
+        checker = Budget(task, second(5))
+        self.assertEqual(checker(), fail)
+        task.state = ok
+        self.assertEqual(checker(), ok)
+        self.assertEqual(task.calls, 2)
+        return
+
+    def test_slow(self):
+        task = GatedTask(fail)
+        task.gate.clear()
+        checker = Budget(task, second(0.05), initial_state=ok)
+
+        # Nothing known yet: the initial state is returned.
+        self.assertEqual(checker(), ok)
+        self.assertTrue(checker.running)
+
+        # Calls during the run join it rather than starting another.
+        self.assertEqual(checker(), ok)
+        self.assertEqual(task.calls, 1)
+
+        task.gate.set()
+        self.wait_idle(checker)
+        self.assertEqual(checker.state, fail)
+
+        # The next run is slow too; the last known result is returned.
+        task.gate.clear()
+        task.state = ok
+        self.assertEqual(checker(), fail)
+        task.gate.set()
+        self.wait_idle(checker)
+        self.assertEqual(checker(), ok)
+        self.assertEqual(task.calls, 3)
+        return
+
+    def test_exception(self):
+        task = GatedTask(ok)
+        checker = Budget(task, second(5), initial_state=fail)
+        self.assertEqual(checker(), ok)
+        task.exception = ValueError()
+        self.assertEqual(checker(), ok)
+        self.assertFalse(checker.running)
+        self.assertEqual(checker.completed, 2)
+        return
+
+    def test_server(self):
+        task = GatedTask(ok)
+        server = create_server()
+        server.add_component("budget", Budget(task, second(0.05)))
+        start_server(server)
+        try:
+            response = self.get(server, "/budget")
+            self.assertEqual(response.status, OK)
+            self.assertEqual(response.getheader(STALE_HEADER), None)
+
+            task.gate.clear()
+            task.state = fail
+            response = self.get(server, "/budget")
+            self.assertEqual(response.status, OK)
+            age = float(response.getheader(STALE_HEADER))
+            self.assertGreaterEqual(age, 0.05)
+            self.assertLess(age, 5)
+
+            task.gate.set()
+            self.wait_idle(server.get_handlers["budget"])
+            response = self.get(server, "/budget")
+            self.assertEqual(response.status, SERVICE_UNAVAILABLE)
+            self.assertEqual(response.getheader(STALE_HEADER), None)
+        finally:
+            task.gate.set()
+            stop_server(server)
+            server.server_close()
+        return
+
+    def test_initial_header(self):
+        task = GatedTask(ok)
+        task.gate.clear()
+        server = create_server()
+        server.add_component("budget", Budget(task, 0.01))
+        start_server(server)
+        try:
+            response = self.get(server, "/budget")
+            self.assertEqual(response.status, OK)
+            self.assertEqual(response.getheader(STALE_HEADER), "initial")
+        finally:
+            task.gate.set()
+            stop_server(server)
+            server.server_close()
+        return
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            Budget(lambda: ok, -1)
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+from __future__ import absolute_import, print_function
+from failover import Hysteresis, count, fail, ok, second
+from failover.compact import (
+    CompactHysteresis, CompactOneshot, CompactTCPCheck, CompactToggle,
+    TCPCheckTable, shared)
+from failover.errorlog import ErrorLog
+import failover.compact
+import logging
+from socket import AF_INET, SOCK_STREAM, socket
+from sys import stderr
+from unittest import TestCase, main
+from .server import create_server
+
+LOOPBACK = "127.0.0.1"
+
+class ResultSequence(object):
+    def __init__(self, results):
+        super(ResultSequence, self).__init__()
+        self.results = list(results)
+        return
+
+    def __call__(self):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def closed_port():
+    """
+    Return a loopback port with nothing listening on it.
+    """
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.bind((LOOPBACK, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+class CompactTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.listener = socket(AF_INET, SOCK_STREAM)
+        self.listener.bind((LOOPBACK, 0))
+        self.listener.listen(50)
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_no_dict(self):
+        for task in (CompactTCPCheck(LOOPBACK, self.port, second(1)),
+                     CompactHysteresis(lambda: ok),
+                     CompactToggle(to_fail=lambda: ok, to_ok=lambda: ok),
+                     CompactOneshot(),
+                     TCPCheckTable(second(1)).add("c", LOOPBACK, self.port)):
+            self.assertFalse(hasattr(task, "__dict__"), task)
+        self.assertRaises(AttributeError, setattr, CompactOneshot(), "x", 1)
+        return
+
+    def test_tcp(self):
+        check = CompactTCPCheck(LOOPBACK, self.port, second(1), name="tcp")
+        self.assertEqual(check(), ok)
+        self.assertEqual(repr(check), "tcp")
+        self.assertEqual(CompactTCPCheck(LOOPBACK, closed_port(),
+                                         second(1))(), fail)
+
+        # Equal values are shared between checks.
+        other = CompactTCPCheck("127.0.0." + "1", self.port, second(1))
+        self.assertIs(other.host, check.host)
+        self.assertIs(other.timeout, check.timeout)
+        self.assertIs(shared(count(3)), shared(count(3)))
+        return
+
+    def test_hysteresis(self):
+        results = [fail, fail, ok, fail, ValueError(), fail, ok, ok, ok]
+        compact = CompactHysteresis(ResultSequence(results),
+                                    fail_after=count(2), ok_after=count(3))
+        original = Hysteresis(ResultSequence(results), fail_after=count(2),
+                              ok_after=count(3))
+        changes = []
+        compact.add_observer(changes.append)
+        for i in range(len(results)):
+            self.assertEqual(compact(), original())
+        self.assertEqual(compact.errors, 1)
+        self.assertEqual([(change.old, change.new) for change in changes],
+                         [(ok, fail), (fail, ok)])
+        self.assertEqual(compact.save_state(), original.save_state())
+        return
+
+    def test_toggle(self):
+        oneshot = CompactOneshot()
+        toggle = CompactToggle(to_fail=ResultSequence([ok, fail]),
+                               to_ok=oneshot, name="manual")
+        self.assertEqual(toggle(), ok)
+        self.assertEqual(toggle(), fail)
+        self.assertEqual(toggle(), fail)
+        self.assertTrue(oneshot.fire())
+        self.assertEqual(toggle(), ok)
+        self.assertEqual(toggle.save_state(), {"state": ok})
+        self.assertEqual(repr(toggle), "manual")
+        return
+
+    def test_table(self):
+        server = create_server()
+        try:
+            table = TCPCheckTable(second(1), fail_after=count(2))
+            up = table.add("up", LOOPBACK, self.port)
+            down = table.add("down", LOOPBACK, closed_port())
+            for row in (up, down):
+                server.add_component(row.name, row)
+            self.assertIs(server.get_handlers["down"], down)
+            self.assertEqual(len(table), 2)
+        finally:
+            server.server_close()
+
+        self.assertEqual(up(), ok)
+        self.assertEqual(down(), ok)
+        self.assertEqual(down.save_state(), {
+            "current_state": ok, "disagree_count": 1,
+            "disagree_start": table.disagree_starts[1]})
+        self.assertEqual(down(), fail)
+        self.assertEqual(down.current_state, fail)
+        self.assertEqual(up.current_state, ok)
+
+        down.restore_state({"current_state": ok, "disagree_count": 0,
+                            "disagree_start": None})
+        self.assertEqual(down.current_state, ok)
+        self.assertEqual(down.save_state()["disagree_start"], None)
+        self.assertEqual(repr(down), "down")
+        return
+
+    def test_table_errors(self):
+        table = TCPCheckTable(second(1))
+        row = table.add("broken", LOOPBACK, self.port)
+        table.hosts[0] = object()
+        logger = logging.getLogger("failover.test.compact")
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        old_log = failover.compact.error_log
+        failover.compact.error_log = ErrorLog(logger)
+        try:
+            for i in range(100):
+                self.assertEqual(row(), ok)
+        finally:
+            failover.compact.error_log = old_log
+            logger.removeHandler(handler)
+
+        # Identical failures are logged once.
+        self.assertEqual(table.errors, 100)
+        self.assertEqual(len(records), 1)
+        return
+
+if __name__ == "__main__":
+    main()
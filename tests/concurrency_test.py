@@ -0,0 +1,133 @@
+from __future__ import absolute_import, print_function
+from failover import count, fail, Hysteresis, ok, Oneshot, Toggle
+import logging
+import sys
+from threading import Event, Thread
+from unittest import TestCase, main
+
+N_THREADS = 8
+N_CALLS = 250
+
+class NamedTask(object):
+    def __init__(self, name, state):
+        super(NamedTask, self).__init__()
+        self.name = name
+        self.state = state
+        return
+
+    def __call__(self):
+        return self.state
+
+    def __repr__(self):
+        return self.name
+
+class ConcurrencyTest(TestCase):
+    def setUp(self):
+        # Thousands of log lines from many threads would dominate the run
+        # time (and hide the races we're looking for).
+        logging.disable(logging.INFO)
+
+        # Switch threads as often as possible to provoke races.
+        if hasattr(sys, "setcheckinterval"):
+            self.old_interval = sys.getcheckinterval()
+            sys.setcheckinterval(1)
+        else:
+            self.old_interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        if hasattr(sys, "setcheckinterval"):
+            sys.setcheckinterval(self.old_interval)
+        else:
+            sys.setswitchinterval(self.old_interval)
+        logging.disable(logging.NOTSET)
+
+    def hammer(self, function, n_threads=N_THREADS):
+        """
+        Call function() N_CALLS times from each of n_threads threads, all
+        starting together.  Returns the results from every call.
+        """
+        start = Event()
+        results = [[] for i in range(n_threads)]
+
+        def run(result):
+            start.wait()
+            for i in range(N_CALLS):
+                result.append(function())
+
+        threads = [Thread(target=run, args=(result,)) for result in results]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        return sum(results, [])
+
+    def test_hysteresis(self):
+        # Every call disagrees; the state must change after exactly
+        # fail_after of them, however they interleave.
+        total = N_THREADS * N_CALLS
+        checker = Hysteresis(task=lambda: fail,
+                             fail_after=count(total - 1))
+        changes = []
+        checker.add_observer(changes.append)
+
+        results = self.hammer(checker)
+        self.assertEqual(results.count(fail), 2)
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(checker.disagree_count, 0)
+        return
+
+    def test_oneshot(self):
+        checker = Oneshot()
+        for i in range(10):
+            checker.fire()
+            results = self.hammer(checker)
+            # Exactly one caller sees the armed state.
+            self.assertEqual(results.count(ok), 1)
+        return
+
+    def test_oneshot_fire(self):
+        # Concurrent firing arms the object once; concurrent calls consume
+        # each arming exactly once.
+        checker = Oneshot()
+        changes = []
+        checker.add_observer(changes.append)
+
+        def fire_and_call():
+            checker.fire()
+            return checker()
+
+        results = self.hammer(fire_and_call)
+        armed = [change for change in changes if change.new == ok]
+        self.assertEqual(results.count(ok), len(armed))
+        self.assertEqual(len(changes), 2 * len(armed))
+        return
+
+    def test_toggle(self):
+        # Each call flips the state, but a flip must only be made by the task
+        # for the state being left.
+        checker = Toggle(to_fail=NamedTask("to_fail", fail),
+                         to_ok=NamedTask("to_ok", ok))
+        changes = []
+        checker.add_observer(changes.append)
+
+        self.hammer(checker)
+        self.assertGreater(len(changes), 0)
+
+        previous = ok
+        for change in changes:
+            self.assertEqual(change.old, previous)
+            self.assertNotEqual(change.new, previous)
+            if change.new:
+                self.assertIn("to_ok", change.reason)
+            else:
+                self.assertIn("to_fail", change.reason)
+            previous = change.new
+
+        self.assertEqual(checker.state, previous)
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+from __future__ import absolute_import, print_function
+from failover import (
+    Background, Hysteresis, Oneshot, PassiveCheck, TCPCheck, Toggle)
+from failover.config import Config
+from json import dump
+import logging
+import os
+from shutil import rmtree
+from sys import stderr
+from tempfile import mkdtemp
+from time import sleep
+from unittest import TestCase, main
+from .server import create_server
+
+def tcp(host="192.0.2.1", timeout="10s"):
+    return {"type": "TCPCheck", "host": host, "port": "smtp",
+            "timeout": timeout}
+
+class ConfigTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.tempdir = mkdtemp()
+        self.filename = self.tempdir + "/failover.json"
+        self.server = create_server()
+        self.config = None
+
+    def tearDown(self):
+        if self.config is not None:
+            self.config.stop()
+            for task, on_post in self.config.components.values():
+                if isinstance(task, Background):
+                    task.stop()
+        self.server.server_close()
+        rmtree(self.tempdir)
+
+    def write(self, components):
+        with open(self.filename, "w") as fd:
+            dump({"components": components}, fd)
+
+        # Make sure the watcher sees a new modification time.
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+
+    def test_build(self):
+        self.write({
+            "mail-u1": {"task": tcp()},
+            "mail-u3": {"task": {
+                "type": "Hysteresis", "task": tcp(), "initial_state": "fail",
+                "ok_after": "1min", "fail_after": 20}},
+            "mail-u5": {
+                "task": {
+                    "type": "Toggle", "initial_state": "ok", "to_fail": tcp(),
+                    "to_ok": {"type": "Oneshot", "id": "reset"}},
+                "on_post": "reset"},
+        })
+        self.config = Config(self.filename, self.server)
+
+        handlers = self.server.get_handlers
+        self.assertEqual(sorted(handlers), ["mail-u1", "mail-u3", "mail-u5"])
+        self.assertIsInstance(handlers["mail-u1"], TCPCheck)
+        self.assertEqual(handlers["mail-u1"].port, 25)
+        self.assertEqual(handlers["mail-u1"].timeout, 10.0)
+
+        hysteresis = handlers["mail-u3"]
+        self.assertIsInstance(hysteresis, Hysteresis)
+        self.assertFalse(hysteresis.current_state)
+        self.assertIsInstance(hysteresis.task, TCPCheck)
+
+        toggle = handlers["mail-u5"]
+        self.assertIsInstance(toggle, Toggle)
+        self.assertIsInstance(toggle.to_ok, Oneshot)
+        self.assertEqual(self.server.post_handlers["mail-u5"],
+                         toggle.to_ok.fire)
+        return
+
+    def test_passive(self):
+        self.write({
+            "app": {
+                "task": {
+                    "type": "Hysteresis", "fail_after": 2,
+                    "task": {"type": "PassiveCheck", "id": "outcomes",
+                             "window": "5min", "max_latency": "2s",
+                             "max_error_rate": 0.1}},
+                "on_post": "outcomes"},
+        })
+        self.config = Config(self.filename, self.server)
+
+        passive = self.server.get_handlers["app"].task
+        self.assertIsInstance(passive, PassiveCheck)
+        self.assertEqual(passive.window, 300.0)
+        self.assertEqual(passive.max_latency, 2.0)
+        self.assertEqual(self.server.post_handlers["app"],
+                         passive.ingest_post)
+        return
+
+    def test_reload_keeps_state(self):
+        components = {
+            "a": {"task": {"type": "Hysteresis", "task": tcp()}},
+            "b": {"task": {"type": "Hysteresis", "task": tcp()}},
+            "c": {"task": {"type": "Toggle", "to_fail": tcp(),
+                           "to_ok": {"type": "Oneshot"}}},
+            "d": {"task": {"type": "Background", "task": tcp(),
+                           "delay": "1min"}},
+        }
+        self.write(components)
+        self.config = Config(self.filename, self.server)
+        old = dict(self.server.get_handlers)
+        old["a"].current_state = False
+        background = old["d"]
+
+        # Change b's leaf, c's to_ok and d; add e; leave a alone.
+        components["b"]["task"]["task"] = tcp(timeout="5s")
+        components["c"]["task"]["to_ok"]["default_state"] = "ok"
+        components["d"]["task"]["delay"] = "2min"
+        components["e"] = {"task": tcp()}
+        self.write(components)
+        self.config.load()
+
+        new = self.server.get_handlers
+        self.assertIs(new["a"], old["a"])
+        self.assertFalse(new["a"].current_state)
+        self.assertIsNot(new["b"], old["b"])
+        self.assertEqual(new["b"].task.timeout, 5.0)
+        self.assertIsNot(new["c"], old["c"])
+        self.assertIs(new["c"].to_fail, old["c"].to_fail)
+        self.assertIsNot(new["d"], old["d"])
+        self.assertFalse(background.is_alive())
+        self.assertIn("e", new)
+
+        # Remove a component.
+        del components["e"]
+        self.write(components)
+        self.config.load()
+        self.assertNotIn("e", self.server.get_handlers)
+        return
+
+    def test_invalid_reload(self):
+        self.write({"a": {"task": tcp()}})
+        self.config = Config(self.filename, self.server)
+        a = self.server.get_handlers["a"]
+
+        for bad in ({"a": {"task": {"type": "NoSuchCheck"}}},
+                    {"a": {"task": tcp(timeout="soon")}},
+                    {"a": {"task": tcp(host=3)}},
+                    {"a": {"task": tcp()}, "b": {"task": tcp(),
+                                                 "on_post": "missing"}},
+                    {"a": {}}):
+            self.write(bad)
+            try:
+                self.config.load()
+                self.fail("Expected ValueError or TypeError for %r" % (bad,))
+            except (ValueError, TypeError):
+                pass
+
+            self.assertEqual(list(self.server.get_handlers), ["a"])
+            self.assertIs(self.server.get_handlers["a"], a)
+        return
+
+    def test_watch(self):
+        self.write({"a": {"task": tcp()}})
+        self.config = Config(self.filename, self.server, delay=0.05)
+        self.write({"a": {"task": tcp()}, "b": {"task": tcp()}})
+        sleep(0.3)
+        self.assertEqual(sorted(self.server.get_handlers), ["a", "b"])
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from __future__ import absolute_import, print_function
+from failover import Background, Budget, Hysteresis, Toggle, ok, second
+from failover.errorlog import ErrorLog
+import failover.background
+import failover.budget
+import failover.hysteresis
+import failover.toggle
+import logging
+from time import sleep
+from unittest import TestCase, main
+
+class RecordingHandler(logging.Handler):
+    """
+    A logging handler keeping the records it is given.
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def failing_task():
+    raise ValueError("dependency down")
+
+class ErrorLogTest(TestCase):
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger("failover.test.errorlog")
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def raise_and_log(self, error_log, text="dependency down"):
+        try:
+            raise ValueError(text)
+        except ValueError:
+            error_log.error("Check %s failed", "db", exc_info=True)
+        return
+
+    def test_suppression(self):
+        error_log = ErrorLog(self.logger, interval=second(0.2))
+        for i in range(1000):
+            self.raise_and_log(error_log)
+
+        self.assertEqual(len(self.handler.records), 1)
+        self.assertIsNotNone(self.handler.records[0].exc_info)
+        self.assertEqual(error_log.total, 1000)
+        self.assertEqual(error_log.counts(), {"Check db failed": 1000})
+
+        # A different exception is a different error.
+        self.raise_and_log(error_log, "disk full")
+        self.assertEqual(len(self.handler.records), 2)
+
+        # The count is reported when the error recurs after the interval.
+        sleep(0.25)
+        self.raise_and_log(error_log)
+        self.assertEqual(len(self.handler.records), 3)
+        self.assertEqual(
+            self.handler.records[2].getMessage(),
+            "Check db failed [suppressed 999 identical errors in 0s]")
+        return
+
+    def test_sweep(self):
+        error_log = ErrorLog(self.logger, interval=second(0.2))
+        self.raise_and_log(error_log)
+        self.raise_and_log(error_log)
+        self.raise_and_log(error_log, "disk full")
+        self.assertEqual(len(self.handler.records), 2)
+
+        # An error that stops recurring is summarized when another is logged
+        # after the interval.
+        sleep(0.25)
+        error_log.error("Something else")
+        messages = [record.getMessage() for record in self.handler.records]
+        self.assertEqual(messages[2:], [
+            "Check db failed [suppressed 1 identical errors in 0s]",
+            "Something else"])
+        return
+
+    def test_max_keys(self):
+        error_log = ErrorLog(self.logger, max_keys=2)
+        for i in range(3):
+            error_log.error("Error %d", i)
+            error_log.error("Error %d", i)
+        self.assertEqual(len(error_log.entries), 2)
+        messages = [record.getMessage() for record in self.handler.records]
+        self.assertEqual(messages, [
+            "Error 0", "Error 1",
+            "Error 0 [suppressed 1 identical errors in 0s]", "Error 2"])
+        self.assertRaises(ValueError, ErrorLog, self.logger, max_keys=0)
+        return
+
+    def test_wrappers(self):
+        for module in (failover.hysteresis, failover.toggle):
+            old_log = module.error_log
+            module.error_log = ErrorLog(self.logger)
+            try:
+                if module is failover.hysteresis:
+                    task = Hysteresis(failing_task)
+                else:
+                    task = Toggle(to_fail=failing_task, to_ok=failing_task)
+                for i in range(100):
+                    self.assertEqual(task(), ok)
+                self.assertEqual(task.errors, 100)
+            finally:
+                module.error_log = old_log
+
+        self.assertEqual(len(self.handler.records), 2)
+
+        old_log = failover.background.error_log
+        failover.background.error_log = ErrorLog(self.logger)
+        try:
+            background = Background(failing_task, second(0.01))
+            for i in range(100):
+                if background.errors >= 5:
+                    break
+                sleep(0.05)
+            background.stop()
+        finally:
+            failover.background.error_log = old_log
+
+        self.assertGreaterEqual(background.errors, 5)
+        self.assertEqual(len(self.handler.records), 3)
+
+        old_log = failover.budget.error_log
+        failover.budget.error_log = ErrorLog(self.logger)
+        try:
+            budget = Budget(failing_task, second(5))
+            for i in range(100):
+                self.assertEqual(budget(), ok)
+        finally:
+            failover.budget.error_log = old_log
+
+        self.assertEqual(budget.errors, 100)
+        self.assertEqual(len(self.handler.records), 4)
+        return
+
+if __name__ == "__main__":
+    main()
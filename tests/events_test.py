@@ -0,0 +1,199 @@
+from __future__ import absolute_import, print_function
+from failover import (
+    Background, count, fail, Hysteresis, ok, Oneshot, second, Toggle)
+from failover.events import Dispatcher, find_observable, StateChange
+import logging
+from six.moves.queue import Queue
+from sys import stderr
+from threading import Event
+from time import sleep, time
+from unittest import TestCase, main
+
+class EventsTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.changes = []
+
+    def test_hysteresis(self):
+        self.result = ok
+        checker = Hysteresis(task=lambda: self.result, fail_after=count(2),
+                             name="hyst")
+        checker.add_observer(self.changes.append)
+
+        checker()
+        self.result = fail
+        checker()
+        self.assertEqual(self.changes, [])
+
+        checker()
+        self.assertEqual(len(self.changes), 1)
+        change = self.changes[0]
+        self.assertIsInstance(change, StateChange)
+        self.assertEqual(change.component, "hyst")
+        self.assertEqual((change.old, change.new), (ok, fail))
+        self.assertIn("threshold", change.reason)
+        self.assertFalse(checker.observed_state())
+
+        # Restoring a snapshot is also a change.
+        checker.restore_state({"current_state": True})
+        self.assertEqual(len(self.changes), 2)
+        self.assertEqual(self.changes[1].reason, "Restored from snapshot")
+
+        # Removed observers are no longer called.
+        checker.remove_observer(self.changes.append)
+        checker()
+        checker()
+        self.assertEqual(len(self.changes), 2)
+        return
+
+    def test_toggle_oneshot(self):
+        self.result = ok
+        reset = Oneshot()
+        checker = Toggle(to_fail=lambda: self.result, to_ok=reset)
+        checker.add_observer(self.changes.append)
+        reset.add_observer(self.changes.append)
+
+        checker()
+        self.assertEqual(self.changes, [])
+
+        self.result = fail
+        checker()
+        self.assertEqual([(c.old, c.new) for c in self.changes],
+                         [(ok, fail)])
+
+        reset.fire()
+        reset.fire()
+        checker()
+        self.assertEqual([(c.old, c.new, c.reason) for c in self.changes[1:]],
+                         [(fail, ok, "Armed"), (ok, fail, "Fired"),
+                          (fail, ok, self.changes[3].reason)])
+        self.assertTrue(checker.observed_state())
+        return
+
+    def test_background(self):
+        self.result = ok
+        checker = Background(task=lambda: self.result, delay=second(0.05))
+        checker.add_observer(self.changes.append)
+        try:
+            sleep(0.12)
+            self.assertEqual(self.changes, [])
+            self.result = fail
+            sleep(0.12)
+            self.assertEqual([(c.old, c.new) for c in self.changes],
+                             [(ok, fail)])
+        finally:
+            checker.stop()
+        return
+
+    def test_observer_failure(self):
+        def broken(change):
+            raise ValueError()
+
+        checker = Oneshot()
+        checker.add_observer(broken)
+        checker.add_observer(self.changes.append)
+        self.assertTrue(checker.fire())
+        self.assertEqual(len(self.changes), 1)
+        return
+
+    def test_find_observable(self):
+        inner = Hysteresis(task=lambda: ok)
+        outer = Toggle(to_fail=inner, to_ok=Oneshot())
+        self.assertIs(find_observable(outer), outer)
+        self.assertIs(find_observable(Wrapper(Wrapper(inner))), inner)
+        self.assertIsNone(find_observable(lambda: ok))
+        return
+
+class SubscribeTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.dispatcher = Dispatcher(workers=2)
+
+    def tearDown(self):
+        self.dispatcher.stop()
+
+    def test_slow_subscriber(self):
+        started = Event()
+        release = Event()
+        received = []
+        def slow(change):
+            started.set()
+            release.wait()
+            received.append(change.new)
+
+        checker = Oneshot(name="reset")
+        subscription = checker.subscribe(slow, max_pending=3,
+                                         dispatcher=self.dispatcher)
+
+        # The subscriber blocks, but firing (and consuming) doesn't wait for
+        # it.  One change is being delivered, three are pending and the rest
+        # are dropped.
+        start = time()
+        checker.fire()
+        started.wait(1)
+        checker()
+        for i in range(2):
+            checker.fire()
+            checker()
+        self.assertLess(time() - start, 0.5)
+        self.assertEqual(subscription.dropped, 2)
+
+        release.set()
+        for i in range(50):
+            if len(received) == 4:
+                break
+            sleep(0.02)
+        self.assertEqual(received, [ok, fail, ok, fail])
+
+        # No more changes after unsubscribing.
+        checker.unsubscribe(subscription)
+        checker.fire()
+        sleep(0.1)
+        self.assertEqual(len(received), 4)
+        return
+
+    def test_queue_subscriber(self):
+        queue = Queue(maxsize=1)
+        checker = Oneshot(name="reset")
+        subscription = checker.subscribe(queue)
+        checker.fire()
+        checker()
+
+        change = queue.get_nowait()
+        self.assertEqual((change.component, change.old, change.new),
+                         ("reset", fail, ok))
+        self.assertTrue(queue.empty())
+        self.assertEqual(subscription.dropped, 1)
+        return
+
+    def test_failing_subscriber(self):
+        received = []
+        def broken(change):
+            received.append(change)
+            raise ValueError()
+
+        checker = Oneshot()
+        checker.subscribe(broken, dispatcher=self.dispatcher)
+        checker.fire()
+        checker()
+        sleep(0.1)
+        self.assertEqual(len(received), 2)
+        return
+
+class Wrapper(object):
+    def __init__(self, task):
+        super(Wrapper, self).__init__()
+        self.task = task
+        return
+
+    def __call__(self):
+        return self.task()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+from __future__ import absolute_import, print_function
+from failover.fastparse import MAX_HEADER_SIZE, ProbeHeaders, ReplayReader
+from failover.handler import current_handler, FailoverRequestHandler
+from io import BytesIO
+import logging
+from six.moves.http_client import HTTPConnection, OK, SERVICE_UNAVAILABLE
+from sys import stderr
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class FakeServer(object):
+    def __init__(self, fast_parser):
+        super(FakeServer, self).__init__()
+        self.fast_parser = fast_parser
+        return
+
+class UnattachedHandler(FailoverRequestHandler):
+    """
+    A request handler reading a request from a buffer rather than a socket.
+    """
+    def __init__(self, data, fast_parser):
+        # BaseHTTPRequestHandler.__init__ would handle a request on a socket.
+        self.server = FakeServer(fast_parser)
+        self.client_address = (LOOPBACK, 0)
+        self.rfile = BytesIO(data)
+        self.wfile = BytesIO()
+        self.raw_requestline = self.rfile.readline(65537)
+        self.request_version = self.default_request_version
+        self.command = None
+        return
+
+def parse(data, fast_parser=True):
+    """
+    Parse the request in data, returning the handler and parse_request()'s
+    result.
+    """
+    handler = UnattachedHandler(data, fast_parser)
+    return handler, handler.parse_request()
+
+class FastParseTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+
+    def assertSameParse(self, data, header_names):
+        fast, fast_result = parse(data)
+        full, full_result = parse(data, fast_parser=False)
+        self.assertEqual(fast_result, full_result)
+        for attr in ("command", "path", "request_version", "requestline"):
+            self.assertEqual(getattr(fast, attr, None),
+                             getattr(full, attr, None))
+        self.assertEqual(bool(fast.close_connection),
+                         bool(full.close_connection))
+        if full_result:
+            for name in header_names:
+                self.assertEqual(fast.headers.get(name),
+                                 full.headers.get(name))
+        return fast
+
+    def test_probe(self):
+        handler = self.assertSameParse(
+            b"GET /mail HTTP/1.1\r\nHost: lb\r\n"
+            b"Authorization: Basic dXNlcjpwYXNz\r\n"
+            b"Connection: keep-alive\r\n\r\n",
+            ["Host", "authorization", "CONNECTION", "Accept"])
+        self.assertIsInstance(handler.headers, ProbeHeaders)
+        self.assertEqual(handler.headers["authorization"],
+                         "Basic dXNlcjpwYXNz")
+        self.assertIn("HOST", handler.headers)
+        self.assertEqual(len(handler.headers), 3)
+
+        handler = self.assertSameParse(b"HEAD /db HTTP/1.0\n\n", ["Host"])
+        self.assertIsInstance(handler.headers, ProbeHeaders)
+        self.assertEqual(len(handler.headers), 0)
+
+        handler = self.assertSameParse(
+            b"GET /x?y=1 HTTP/1.1\r\nConnection: close\r\n\r\n",
+            ["Connection"])
+        self.assertIsInstance(handler.headers, ProbeHeaders)
+        return
+
+    def test_fallback(self):
+        for data in [
+                b"POST /x HTTP/1.1\r\nContent-Length: 2\r\n\r\nhi",
+                b"GET /x HTTP/1.1\r\nX-A: 1\r\n  continued\r\n\r\n",
+                b"GET /x HTTP/1.1\r\nX-A: 1\r\nX-A: 2\r\n\r\n",
+                b"GET /x HTTP/1.1\r\nNo colon\r\n\r\n",
+                b"GET //x HTTP/1.1\r\n\r\n",
+                b"GET /x HTTP/2.0\r\n\r\n",
+                b"GET  /x HTTP/1.1\r\n\r\n",
+        ]:
+            handler = self.assertSameParse(data, ["X-A", "Content-Length"])
+            self.assertNotIsInstance(getattr(handler, "headers", None),
+                                     ProbeHeaders)
+
+        # The full parser rereads the header block; the body is untouched.
+        handler, result = parse(
+            b"GET /x HTTP/1.1\r\nX-A: 1\r\n\tb\r\n\r\nbody")
+        self.assertTrue(result)
+        self.assertEqual(handler.rfile.read(), b"body")
+
+        # Unusual requests on a kept-alive connection share one reader.
+        request = b"GET /x HTTP/1.1\r\nX-A: 1\r\nX-A: 2\r\n\r\n"
+        handler, result = parse(request * 3 + b"GET /y HTTP/1.1\r\n\r\n")
+        for path in ("/x", "/x", "/y"):
+            self.assertTrue(result)
+            handler.raw_requestline = handler.rfile.readline(65537)
+            result = handler.parse_request()
+            self.assertEqual(handler.path, path)
+        self.assertIsInstance(handler.rfile, ReplayReader)
+        self.assertIsInstance(handler.rfile.fp, BytesIO)
+        return
+
+    def test_too_large(self):
+        data = (b"GET /x HTTP/1.1\r\nX-Big: " + b"a" * MAX_HEADER_SIZE +
+                b"\r\n\r\n")
+        handler, result = parse(data)
+        self.assertFalse(result)
+        self.assertTrue(handler.wfile.getvalue().startswith(
+            b"HTTP/1.0 400 "))
+        return
+
+    def test_server(self):
+        def authorized():
+            handler = current_handler()
+            return handler.headers.get("authorization") == "Basic eDp5"
+
+        server = create_server(fast_parser=True)
+        server.add_component("auth", authorized)
+        start_server(server)
+        try:
+            for headers, status in [
+                    ({"Authorization": "Basic eDp5"}, OK),
+                    ({"Authorization": "Basic eDp6"}, SERVICE_UNAVAILABLE),
+                    ({"X-A": "1\r\n continued",
+                      "Authorization": "Basic eDp5"}, OK)]:
+                con = HTTPConnection(LOOPBACK, server.port)
+                con.request("GET", "/auth", headers=headers)
+                response = con.getresponse()
+                response.read()
+                con.close()
+                self.assertEqual(response.status, status)
+        finally:
+            stop_server(server)
+            server.server_close()
+        return
+
+if __name__ == "__main__":
+    main()
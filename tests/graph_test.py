@@ -0,0 +1,212 @@
+from __future__ import absolute_import, print_function
+from failover import Hysteresis, TCPCheck, Toggle, fail, ok, second
+from failover.graph import CheckGraph, SharedTask, share_key
+from json import loads
+import logging
+from six.moves.http_client import HTTPConnection, OK
+from sys import stderr
+from threading import Thread
+from time import sleep
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class CountingCheck(object):
+    shareable = True
+
+    def __init__(self, target, delay=0.0, name=None):
+        super(CountingCheck, self).__init__()
+        self.target = target
+        self.delay = delay
+        self.name = name
+        self.calls = 0
+        self.exception = None
+        return
+
+    def __call__(self):
+        self.calls += 1
+        sleep(self.delay)
+        if self.exception is not None:
+            raise self.exception
+        return ok
+
+class InterruptedCheck(CountingCheck):
+    """
+    A check whose first call is interrupted.
+    """
+    def __call__(self):
+        result = super(InterruptedCheck, self).__call__()
+        if self.calls == 1:
+            raise KeyboardInterrupt()
+        return result
+
+class GraphTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.server = create_server()
+        self.graph = None
+
+    def tearDown(self):
+        if self.graph is not None:
+            self.graph.close()
+        self.server.server_close()
+
+    def test_merge(self):
+        checks = [TCPCheck(LOOPBACK, 5432, second(1), name="db%d" % (i,))
+                  for i in range(5)]
+        other = TCPCheck(LOOPBACK, 5433, second(1))
+        for i, check in enumerate(checks[:3]):
+            self.server.add_component("h%d" % (i,), Hysteresis(task=check))
+        self.server.add_component("toggle", Toggle(to_fail=checks[3],
+                                                   to_ok=checks[4]))
+        self.server.add_component("other", other)
+        self.server.add_component("plain", lambda: ok)
+        self.graph = CheckGraph(self.server)
+
+        handlers = self.server.get_handlers
+        shared = handlers["h0"].task
+        self.assertIsInstance(shared, SharedTask)
+        self.assertIn(shared.task, checks)
+        for name in ("h1", "h2"):
+            self.assertIs(handlers[name].task, shared)
+        self.assertIs(handlers["toggle"].to_fail, shared)
+        self.assertIs(handlers["toggle"].to_ok, shared)
+        self.assertIsNot(handlers["other"], shared)
+        self.assertIsInstance(handlers["other"], SharedTask)
+        self.assertNotIsInstance(handlers["plain"], SharedTask)
+        self.assertEqual(len(self.graph.shared), 2)
+
+        # Components added later are merged too.
+        self.graph.add_component(
+            "late", Hysteresis(task=TCPCheck(LOOPBACK, 5432, second(1))))
+        self.assertIs(handlers["late"].task, shared)
+
+        graph = self.graph.describe()
+        nodes = graph["nodes"]
+        node = nodes[graph["components"]["h0"]]
+        self.assertEqual(node["type"], "Hysteresis")
+        self.assertFalse(node["shared"])
+        shared_node = nodes[node["children"][0]]
+        self.assertEqual(shared_node["type"], "TCPCheck")
+        self.assertTrue(shared_node["shared"])
+        self.assertEqual(len(shared_node["consumers"]), 5)
+        self.assertEqual(sorted(shared_node["components"]),
+                         ["h0", "h1", "h2", "late", "toggle"])
+        self.assertFalse(nodes[graph["components"]["other"]]["shared"])
+        return
+
+    def test_share_key(self):
+        self.assertEqual(
+            share_key(TCPCheck(LOOPBACK, 80, second(1), name="a")),
+            share_key(TCPCheck(LOOPBACK, 80, second(1), name="b")))
+        self.assertNotEqual(
+            share_key(TCPCheck(LOOPBACK, 80, second(1))),
+            share_key(TCPCheck(LOOPBACK, 80, second(2))))
+        self.assertIsNone(share_key(lambda: ok))
+        self.assertIsNone(share_key(Hysteresis(task=lambda: ok)))
+
+        # Unhashable or missing parameters make a check unshareable.
+        self.assertIsNotNone(share_key(CountingCheck([1, {"a": 2}])))
+        self.assertIsNone(share_key(CountingCheck([1, {"a": bytearray()}])))
+        check = CountingCheck(1)
+        del check.delay
+        self.assertIsNone(share_key(check))
+        return
+
+    def test_tick(self):
+        shared = SharedTask(CountingCheck(LOOPBACK), tick=second(0.2))
+        for i in range(10):
+            self.assertEqual(shared(), ok)
+        self.assertEqual(shared.task.calls, 1)
+        self.assertEqual((shared.calls, shared.runs), (10, 1))
+
+        # Exceptions are cached as results are.
+        sleep(0.25)
+        shared.task.exception = ValueError("down")
+        self.assertRaises(ValueError, shared)
+        self.assertRaises(ValueError, shared)
+        self.assertEqual(shared.task.calls, 2)
+        return
+
+    def test_concurrent(self):
+        check = CountingCheck(LOOPBACK, delay=0.1)
+        shared = SharedTask(check, tick=second(0))
+        results = []
+
+        def call():
+            results.append(shared())
+
+        threads = [Thread(target=call) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Calls made while a run is in progress wait for its result.
+        self.assertEqual(results, [ok] * 5)
+        self.assertLess(check.calls, 5)
+        return
+
+    def test_interrupted(self):
+        check = InterruptedCheck(LOOPBACK, delay=0.1)
+        shared = SharedTask(check, tick=second(60))
+        results = []
+
+        def interrupted():
+            try:
+                shared()
+            except KeyboardInterrupt:
+                results.append("interrupted")
+
+        def waiter():
+            results.append(shared())
+
+        first = Thread(target=interrupted)
+        first.start()
+        sleep(0.02)
+        second_thread = Thread(target=waiter)
+        second_thread.start()
+        first.join(2)
+        second_thread.join(2)
+
+        # The waiter isn't left waiting forever; it runs the task itself.
+        self.assertFalse(second_thread.is_alive())
+        self.assertEqual(sorted(results, key=str), [ok, "interrupted"])
+        self.assertFalse(shared.running)
+        self.assertEqual((check.calls, shared.runs), (2, 1))
+        return
+
+    def test_endpoint(self):
+        for i in range(3):
+            self.server.add_component(
+                "c%d" % (i,), Hysteresis(task=CountingCheck(LOOPBACK),
+                                         initial_state=fail))
+        self.graph = CheckGraph(self.server, tick=second(60))
+        start_server(self.server)
+        try:
+            for path in ("/c0", "/c1", "/c2", "/_graph"):
+                con = HTTPConnection(LOOPBACK, self.server.port)
+                con.request("GET", path)
+                response = con.getresponse()
+                body = response.read()
+                con.close()
+        finally:
+            stop_server(self.server)
+
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.getheader("Content-Type"),
+                         "application/json")
+        graph = loads(body.decode("utf-8"))
+        self.assertEqual(sorted(graph["components"]), ["c0", "c1", "c2"])
+        shared = [node for node in graph["nodes"] if node["shared"]]
+        self.assertEqual(len(shared), 1)
+        self.assertEqual(shared[0]["type"], "CountingCheck")
+        self.assertEqual((shared[0]["calls"], shared[0]["runs"]), (3, 1))
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, print_function
+from failover import Oneshot, fail, ok
+from failover.handler import FailoverRequestHandler
+import logging
+from socket import create_connection
+from sys import stderr
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class CountingWriter(object):
+    """
+    Wraps a handler's (unbuffered) wfile, recording each write: each one is
+    a separate send on the socket.
+    """
+    def __init__(self, wfile, writes):
+        super(CountingWriter, self).__init__()
+        self.wfile = wfile
+        self.writes = writes
+        return
+
+    def write(self, data):
+        self.writes.append(data)
+        return self.wfile.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.wfile, name)
+
+class HandlerTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.writes = []
+        writes = self.writes
+        original_setup = FailoverRequestHandler.setup
+        self.own_setup = FailoverRequestHandler.__dict__.get("setup")
+
+        def setup(handler):
+            original_setup(handler)
+            handler.wfile = CountingWriter(handler.wfile, writes)
+
+        FailoverRequestHandler.setup = setup
+        self.server = create_server()
+        self.server.add_component("ok", lambda: ok)
+        self.server.add_component("fail", lambda: fail)
+        self.oneshot = Oneshot()
+        self.server.add_component("reset", self.oneshot,
+                                  on_post=self.oneshot.fire)
+        start_server(self.server)
+
+    def tearDown(self):
+        if self.own_setup is None:
+            del FailoverRequestHandler.setup
+        else:
+            FailoverRequestHandler.setup = self.own_setup
+        stop_server(self.server)
+        self.server.server_close()
+
+    def request(self, request):
+        sock = create_connection((LOOPBACK, self.server.port))
+        try:
+            sock.sendall(request)
+            chunks = []
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+        return b"".join(chunks)
+
+    def test_single_write(self):
+        response = self.request(b"GET /ok HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.assertEqual(len(self.writes), 1)
+        self.assertEqual(self.writes[0], response)
+
+        head, body = response.split(b"\r\n\r\n", 1)
+        lines = head.split(b"\r\n")
+        self.assertEqual(lines[0], b"HTTP/1.0 200 OK")
+        self.assertIn(b"Content-Type: text/plain; charset=utf-8", lines)
+        self.assertIn(b"Content-Length: 2", lines)
+        self.assertIn(b"Connection: close", lines)
+        self.assertTrue(any(line.startswith(b"Date: ") for line in lines))
+        self.assertTrue(any(line.startswith(b"Server: ") for line in lines))
+        self.assertEqual(body, b"OK")
+        return
+
+    def test_head(self):
+        response = self.request(b"HEAD /fail HTTP/1.0\r\n\r\n")
+        self.assertEqual(len(self.writes), 1)
+        self.assertTrue(response.startswith(b"HTTP/1.0 503 "))
+        self.assertIn(b"\r\nContent-Length: 4\r\n", response)
+        self.assertTrue(response.endswith(b"\r\n\r\n"))
+        return
+
+    def test_post_responds_once(self):
+        # Oneshot.fire() sends its own response; no second one follows.
+        response = self.request(b"POST /reset HTTP/1.0\r\n"
+                                b"Content-Length: 0\r\n\r\n")
+        self.assertEqual(len(self.writes), 1)
+        self.assertTrue(response.startswith(b"HTTP/1.0 200 "))
+        self.assertTrue(response.endswith(b"\r\n\r\nArmed"))
+        return
+
+    def test_http_09(self):
+        response = self.request(b"GET /ok\r\n\r\n")
+        self.assertEqual(len(self.writes), 1)
+        self.assertEqual(response, b"OK")
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+from __future__ import absolute_import, print_function
+import failover
+from failover.pool import default_pool
+import logging
+from os.path import dirname
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import ssl
+from sys import stderr
+from threading import Thread
+from unittest import TestCase, main
+
+LOOPBACK = "127.0.0.1"
+UNROUTABLE = "192.0.2.1" # RFC 5737 -- TEST-NET-1 space, unroutable globally
+
+log = logging.getLogger("test.http")
+
+class HTTPServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.server.body
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+class HTTPService(HTTPServer):
+    """
+    A stand-in HTTP server which counts the connections made to it.
+    """
+    def __init__(self, tls_context=None):
+        HTTPServer.__init__(self, (LOOPBACK, 0), HTTPServiceHandler)
+        self.port = self.server_address[1]
+        self.status = 200
+        self.body = b"OK"
+        self.n_connections = 0
+        self.tls_context = tls_context
+        self.thread = Thread(target=self.serve_forever)
+        self.thread.start()
+        return
+
+    def get_request(self):
+        connection, client = HTTPServer.get_request(self)
+        self.n_connections += 1
+        if self.tls_context is not None:
+            connection = self.tls_context.wrap_socket(
+                connection, server_side=True)
+        return connection, client
+
+    def stop(self):
+        self.shutdown()
+        self.thread.join()
+        self.server_close()
+        return
+
+class HTTPCheckTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.service = HTTPService()
+
+    def tearDown(self):
+        # Idle connections in the shared pool would keep the (single-threaded)
+        # service busy.
+        default_pool().clear()
+        self.service.stop()
+
+    def test_status(self):
+        checker = failover.HTTPCheck(
+            LOOPBACK, self.service.port, path="/health", name="http1")
+        self.assertTrue(checker())
+
+        self.service.status = 503
+        self.assertFalse(checker())
+
+        checker = failover.HTTPCheck(
+            LOOPBACK, self.service.port, expected_status=(200, 503))
+        self.assertTrue(checker())
+
+        self.assertTrue(repr(checker).startswith(
+            "HTTPCheck(host='127.0.0.1', port=%d" % self.service.port))
+        return
+
+    def test_keep_alive(self):
+        checker = failover.HTTPCheck(LOOPBACK, self.service.port)
+        for i in range(5):
+            self.assertTrue(checker())
+        self.assertEqual(self.service.n_connections, 1)
+        checker.close()
+
+        checker = failover.HTTPCheck(
+            LOOPBACK, self.service.port, keep_alive=False)
+        for i in range(5):
+            self.assertTrue(checker())
+        self.assertEqual(self.service.n_connections, 6)
+        return
+
+    def test_reconnect_after_close(self):
+        checker = failover.HTTPCheck(LOOPBACK, self.service.port)
+        self.assertTrue(checker())
+
+        # Kill the idle connection from the client side; the next check
+        # should transparently open a new one.
+        checker.idle[0].sock.close()
+        self.assertTrue(checker())
+        self.assertEqual(self.service.n_connections, 2)
+        checker.close()
+        return
+
+    def test_max_body_size(self):
+        self.service.body = b"x" * 100
+        checker = failover.HTTPCheck(
+            LOOPBACK, self.service.port, max_body_size=10)
+        self.assertTrue(checker())
+        self.assertTrue(checker())
+
+        # Oversized responses must not be reused.
+        self.assertEqual(self.service.n_connections, 2)
+        self.assertEqual(checker.idle, [])
+        return
+
+    def test_tls(self):
+        pem = dirname(__file__) + "/tls_test.pem"
+        server_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        server_context.load_cert_chain(pem)
+        service = HTTPService(tls_context=server_context)
+
+        try:
+            client_context = ssl.create_default_context(cafile=pem)
+            checker = failover.HTTPCheck(
+                "localhost", service.port, tls=True,
+                tls_context=client_context)
+            self.assertTrue(checker())
+            self.assertTrue(checker())
+            self.assertEqual(service.n_connections, 1)
+            checker.close()
+
+            # Without trusting the test certificate, verification fails.
+            checker = failover.HTTPCheck(
+                "localhost", service.port, tls=True, timeout=1)
+            self.assertFalse(checker())
+        finally:
+            service.stop()
+        return
+
+    def test_unroutable(self):
+        checker = failover.HTTPCheck(UNROUTABLE, 80, timeout=0.1)
+        self.assertFalse(checker())
+        return
+
+    def test_reject_invalid(self):
+        try:
+            failover.HTTPCheck(LOOPBACK, 80, read_timeout=-1)
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+
+        try:
+            failover.HTTPCheck(LOOPBACK, 80, max_body_size=-1)
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from __future__ import absolute_import, print_function
+from failover import Hysteresis, PassiveCheck, count, fail, ok, second
+from failover.passive import PassiveListener, parse_outcomes
+import logging
+import os
+from six.moves.http_client import HTTPConnection, OK, SERVICE_UNAVAILABLE
+import socket
+from sys import stderr
+from tempfile import mkdtemp
+from threading import Thread
+from time import sleep
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class PassiveCheckTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+
+    def wait_for(self, condition):
+        for i in range(100):
+            if condition():
+                return
+            sleep(0.05)
+        self.fail("condition not met")
+
+    def test_error_rate(self):
+        checker = PassiveCheck(max_error_rate=0.25, min_events=4)
+        self.assertEqual(checker(), ok)
+
+        # Too few outcomes to judge; keep the initial state.
+        checker.record(False)
+        checker.record(False)
+        self.assertEqual(checker(), ok)
+
+        checker.record(True)
+        checker.record(True)
+        self.assertEqual(checker(), fail)
+
+        for i in range(4):
+            checker.record(True)
+        self.assertEqual(checker(), ok)
+        return
+
+    def test_latency(self):
+        checker = PassiveCheck(min_events=2, max_latency=second(1))
+        checker.record(True, 0.5)
+        checker.record(True)
+        self.assertEqual(checker(), ok)
+        checker.record(True, 3.0)
+        self.assertEqual(checker(), fail)
+        return
+
+    def test_window(self):
+        checker = PassiveCheck(window=second(0.4), buckets=4, min_events=1,
+                               initial_state=ok)
+        checker.record(False)
+        self.assertEqual(checker(), fail)
+
+        # The failure leaves the window; with nothing new, keep the state.
+        sleep(0.5)
+        self.assertEqual(checker(), fail)
+        checker.record(True)
+        self.assertEqual(checker(), ok)
+        return
+
+    def test_hysteresis(self):
+        checker = PassiveCheck(min_events=1)
+        hysteresis = Hysteresis(checker, initial_state=ok,
+                                fail_after=count(2), ok_after=count(2))
+        checker.record(False)
+        self.assertEqual(hysteresis(), ok)
+        self.assertEqual(hysteresis(), fail)
+        return
+
+    def test_concurrent_record(self):
+        checker = PassiveCheck(min_events=1, max_pending=1000000)
+
+        def report():
+            for i in range(5000):
+                checker.record(i % 10 != 0, 0.01)
+            return
+
+        threads = [Thread(target=report) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(checker(), ok)
+        self.assertEqual(sum(bucket[1] for bucket in checker.counts), 18000)
+        self.assertEqual(sum(bucket[2] for bucket in checker.counts), 2000)
+        self.assertEqual(len(checker.pending), 0)
+        return
+
+    def test_max_pending(self):
+        checker = PassiveCheck(min_events=1, max_pending=2)
+        checker.drain_threshold = 10
+        checker.record(False)
+        checker.record(True)
+        checker.record(True)
+        self.assertEqual(checker(), ok)
+        self.assertEqual(sum(bucket[2] for bucket in checker.counts), 0)
+        return
+
+    def test_parse(self):
+        self.assertEqual(
+            list(parse_outcomes(b"ok\nFAIL 1.5\n\nok 0.25\nmaybe\nok x\n"
+                                b"ok -1\nok 1 2\n")),
+            [(True, None), (False, 1.5), (True, 0.25), None, None, None,
+             None])
+
+        checker = PassiveCheck(min_events=1)
+        self.assertEqual(checker.ingest(u"ok\nbad\nfail 0.1"), 2)
+        self.assertEqual(checker.malformed, 1)
+        return
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, PassiveCheck, window=0)
+        self.assertRaises(ValueError, PassiveCheck, buckets=0)
+        self.assertRaises(ValueError, PassiveCheck, max_error_rate=1.5)
+        self.assertRaises(ValueError, PassiveCheck, min_events=-1)
+        self.assertRaises(ValueError, PassiveCheck, max_pending=0)
+        return
+
+    def test_post(self):
+        checker = PassiveCheck(min_events=2)
+        server = create_server()
+        server.add_component("app", checker, on_post=checker.ingest_post)
+        start_server(server)
+        try:
+            con = HTTPConnection(LOOPBACK, server.port)
+            con.request("POST", "/app", body=b"fail 0.1\nfail\nok\n")
+            response = con.getresponse()
+            self.assertEqual(response.status, OK)
+            response.read()
+
+            # The connection remains usable after the body is consumed.
+            con.request("GET", "/app")
+            response = con.getresponse()
+            self.assertEqual(response.status, SERVICE_UNAVAILABLE)
+            response.read()
+            con.close()
+
+            con = HTTPConnection(LOOPBACK, server.port)
+            con.request("POST", "/app", body=b"ok\n" * 40000)
+            response = con.getresponse()
+            self.assertEqual(response.status, SERVICE_UNAVAILABLE)
+            response.read()
+            con.close()
+        finally:
+            stop_server(server)
+        return
+
+    def test_udp_listener(self):
+        checker = PassiveCheck(min_events=1)
+        listener = PassiveListener((LOOPBACK, 0), {"app": checker})
+        try:
+            sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sender.sendto(b"app fail 0.2\napp fail\nother ok\n",
+                          listener.address)
+            sender.close()
+            self.wait_for(lambda: listener.discarded == 1)
+            self.assertEqual(checker(), fail)
+        finally:
+            listener.stop()
+        return
+
+    def test_unix_listener(self):
+        checker = PassiveCheck(min_events=1, initial_state=fail)
+        path = os.path.join(mkdtemp(), "outcomes")
+        listener = PassiveListener(path, {"app": checker})
+        try:
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.sendto(b"app ok\n", path)
+            sender.close()
+            self.wait_for(lambda: checker() == ok)
+        finally:
+            listener.stop()
+        self.assertFalse(os.path.exists(path))
+        os.rmdir(os.path.dirname(path))
+        return
+
+if __name__ == "__main__":
+    main()
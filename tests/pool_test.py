@@ -0,0 +1,130 @@
+from __future__ import absolute_import, print_function
+from failover.pool import ConnectionPool
+import logging
+import socket
+from sys import stderr
+from time import sleep
+from unittest import TestCase, main
+
+class FakeConnection(object):
+    """
+    A connection over one end of a socket pair.
+    """
+    def __init__(self):
+        super(FakeConnection, self).__init__()
+        self.sock, self.peer = socket.socketpair()
+        self.closed = False
+        return
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self.peer.close()
+        return
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+
+    def test_reuse(self):
+        pool = ConnectionPool()
+        self.assertIsNone(pool.checkout("a"))
+
+        first, second = FakeConnection(), FakeConnection()
+        pool.checkin("a", first)
+        pool.checkin("a", second)
+        self.assertEqual(pool.connections("a"), [first, second])
+        self.assertIsNone(pool.checkout("b"))
+
+        # The most recently used connection is reused first.
+        self.assertIs(pool.checkout("a"), second)
+        self.assertIs(pool.checkout("a"), first)
+        self.assertIsNone(pool.checkout("a"))
+        self.assertEqual(pool.n_idle, 0)
+        self.assertFalse(first.closed or second.closed)
+        return
+
+    def test_limits(self):
+        pool = ConnectionPool(max_idle=3, max_idle_per_key=2)
+        a = [FakeConnection() for i in range(3)]
+        for connection in a:
+            pool.checkin("a", connection)
+
+        # Only two are kept for the key; the least recently used is closed.
+        self.assertTrue(a[0].closed)
+        self.assertEqual(pool.connections("a"), a[1:])
+
+        # Overriding the per-key limit.
+        b = [FakeConnection() for i in range(2)]
+        for connection in b:
+            pool.checkin("b", connection, max_idle=1)
+        self.assertTrue(b[0].closed)
+        self.assertEqual(pool.connections("b"), b[1:])
+
+        # The total limit closes the least recently used across keys.
+        c = FakeConnection()
+        pool.checkin("c", c)
+        self.assertTrue(a[1].closed)
+        self.assertEqual(pool.connections("a"), [a[2]])
+        self.assertEqual(pool.n_idle, 3)
+
+        pool.clear("a")
+        self.assertTrue(a[2].closed)
+        self.assertEqual(pool.n_idle, 2)
+        pool.clear()
+        self.assertTrue(b[1].closed and c.closed)
+        self.assertEqual(pool.n_idle, 0)
+        return
+
+    def test_expiry(self):
+        pool = ConnectionPool(max_age=0.2, idle_timeout=0.05)
+        connection = FakeConnection()
+        pool.checkin("a", connection)
+        sleep(0.1)
+        self.assertIsNone(pool.checkout("a"))
+        self.assertTrue(connection.closed)
+
+        # The age counts from the first time the connection was pooled.
+        pool = ConnectionPool(max_age=0.2)
+        connection = FakeConnection()
+        pool.checkin("a", connection)
+        sleep(0.15)
+        self.assertIs(pool.checkout("a"), connection)
+        sleep(0.1)
+        pool.checkin("a", connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.n_idle, 0)
+        return
+
+    def test_validation(self):
+        pool = ConnectionPool()
+        closed_by_peer = FakeConnection()
+        unsolicited = FakeConnection()
+        closed_locally = FakeConnection()
+        healthy = FakeConnection()
+        for connection in (healthy, closed_by_peer, unsolicited,
+                           closed_locally):
+            pool.checkin("a", connection)
+
+        closed_by_peer.peer.close()
+        unsolicited.peer.sendall(b"HTTP/1.1 408 Request Timeout\r\n")
+        closed_locally.sock.close()
+
+        self.assertIs(pool.checkout("a"), healthy)
+        self.assertTrue(closed_by_peer.closed and unsolicited.closed and
+                        closed_locally.closed)
+        self.assertFalse(healthy.closed)
+        return
+
+    def test_reject_invalid(self):
+        for kw in [{"max_idle": -1}, {"max_idle_per_key": 1.5},
+                   {"max_age": -1}, {"idle_timeout": "x"}]:
+            with self.assertRaises((TypeError, ValueError)):
+                ConnectionPool(**kw)
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+from __future__ import absolute_import, print_function
+from failover import (
+    Background, Budget, fail, HealthCheckServer, Hysteresis, ok, Oneshot,
+    second, Toggle)
+from failover.budget import STALE_HEADER
+from failover.compact import CompactOneshot
+from failover.prefork import (
+    PreforkServer, shared_components, unstarted_threads, worker_auth)
+import logging
+import os
+import signal
+from shutil import rmtree
+from six.moves.http_client import (
+    HTTPConnection, OK, SERVICE_UNAVAILABLE, UNAUTHORIZED)
+from sys import stderr
+from tempfile import mkdtemp
+from threading import Thread
+from time import sleep
+from unittest import TestCase, main
+
+LOOPBACK = "127.0.0.1"
+
+class Resetter(object):
+    """
+    An object with an auth attribute whose POST handler knows nothing of
+    worker authentication.
+    """
+    def __init__(self):
+        super(Resetter, self).__init__()
+        self.auth = lambda: False
+        return
+
+    def reset(self):
+        return True
+
+class PreforkTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+
+    def get(self, port, path, method="GET", headers={}):
+        con = HTTPConnection(LOOPBACK, port)
+        con.request(method, path, "", headers)
+        response = con.getresponse()
+        body = response.read()
+        con.close()
+        return response.status, body
+
+    def test_shared_components(self):
+        server = HealthCheckServer(0, LOOPBACK, reuse_port=True)
+        try:
+            reset = Oneshot()
+            server.add_component("plain", lambda: ok)
+            server.add_component("hysteresis", Hysteresis(lambda: ok))
+            server.add_component(
+                "toggle", Toggle(to_fail=lambda: ok, to_ok=lambda: ok))
+            server.add_component("oneshot", lambda: ok, on_post=reset.fire)
+            self.assertEqual(shared_components(server),
+                             frozenset(["hysteresis", "toggle", "oneshot"]))
+        finally:
+            server.server_close()
+
+        # Only handlers that opt in are authenticated by workers.
+        auth = lambda: True
+        self.assertIs(worker_auth(Oneshot(auth=auth).fire), auth)
+        self.assertIs(worker_auth(CompactOneshot(auth=auth).fire), auth)
+        self.assertIsNone(worker_auth(Oneshot().fire))
+        self.assertIsNone(worker_auth(Resetter().reset))
+        self.assertIsNone(worker_auth(None))
+
+        try:
+            PreforkServer(HealthCheckServer(0, LOOPBACK))
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+        return
+
+    def test_prefork(self):
+        # Authentication runs in the workers, so it can't depend on anything
+        # in this process's memory.
+        tempdir = mkdtemp()
+        deny = tempdir + "/deny"
+        server = HealthCheckServer(0, LOOPBACK, reuse_port=True)
+        port = server.server_address[1]
+        reset = Oneshot(default_state=ok, auth=lambda: not os.path.exists(deny))
+        server.add_component("oneshot", reset, on_post=reset.fire)
+        server.add_component("plain", lambda: ok)
+        resetter = Resetter()
+        server.add_component("custom", lambda: ok, on_post=resetter.reset)
+
+        prefork = PreforkServer(server, workers=3)
+        thread = Thread(target=prefork.serve_forever)
+        thread.start()
+
+        try:
+            # Wait for the workers to come up.
+            for i in range(50):
+                try:
+                    self.get(port, "/plain")
+                    break
+                except Exception:
+                    sleep(0.1)
+            self.assertEqual(len(prefork.pids), 3)
+            self.assertEqual(prefork.owner.server, server)
+
+            self.assertEqual(self.get(port, "/oneshot"), (OK, b"OK"))
+
+            # Arm through one worker; whichever worker answers next must see
+            # exactly one failure.
+            status, body = self.get(port, "/oneshot", "POST")
+            self.assertEqual((status, body), (OK, b"Armed"))
+
+            statuses = [self.get(port, "/oneshot")[0] for i in range(6)]
+            self.assertEqual(statuses.count(SERVICE_UNAVAILABLE), 1)
+            self.assertEqual(statuses[0], SERVICE_UNAVAILABLE)
+
+            # Authentication failures are answered by the worker.
+            open(deny, "w").close()
+            status, body = self.get(port, "/oneshot", "POST")
+            self.assertEqual(status, UNAUTHORIZED)
+            self.assertEqual(self.get(port, "/oneshot")[0], OK)
+
+            # Other POST handlers authenticate (or not) for themselves.
+            self.assertEqual(self.get(port, "/custom", "POST"), (OK, b"OK"))
+        finally:
+            prefork.shutdown()
+            thread.join()
+            rmtree(tempdir)
+
+        self.assertEqual(prefork.pids, {})
+        self.assertFalse(os.path.exists(prefork.socket_path))
+        return
+
+    def test_forwarded_headers(self):
+        server = HealthCheckServer(0, LOOPBACK, reuse_port=True)
+        port = server.server_address[1]
+        server.add_component("plain", lambda: ok)
+
+        # The Hysteresis makes this component stateful, so it is run by the
+        # state owner.
+        def slow():
+            sleep(0.5)
+            return ok
+        server.add_component("budget", Budget(Hysteresis(slow), second(0.05)))
+
+        prefork = PreforkServer(server, workers=2)
+        self.assertIn("budget", shared_components(server))
+        thread = Thread(target=prefork.serve_forever)
+        thread.start()
+
+        try:
+            self.wait_for_workers(prefork, port)
+            con = HTTPConnection(LOOPBACK, port)
+            con.request("GET", "/budget")
+            response = con.getresponse()
+            body = response.read()
+            con.close()
+        finally:
+            prefork.shutdown()
+            thread.join()
+
+        self.assertEqual((response.status, body), (OK, b"OK"))
+        self.assertEqual(response.getheader(STALE_HEADER), "initial")
+        self.assertTrue(response.getheader("Content-Type").startswith(
+            "text/plain"))
+        return
+
+    def wait_for_workers(self, prefork, port, old_pids=()):
+        """
+        Wait until prefork has a full set of workers, none of them in
+        old_pids, and one of them answers requests.
+        """
+        for i in range(50):
+            pids = set(prefork.pids)
+            if len(pids) == prefork.workers and not pids & set(old_pids):
+                try:
+                    self.get(port, "/plain")
+                    return pids
+                except Exception:
+                    pass
+            sleep(0.1)
+        self.fail("Workers did not start")
+
+    def test_restart(self):
+        server = HealthCheckServer(0, LOOPBACK, reuse_port=True)
+        port = server.server_address[1]
+        server.add_component("plain", lambda: ok)
+
+        # With a single worker, nothing answers unless the restarted worker
+        # 0 binds a socket of its own.
+        prefork = PreforkServer(server, workers=1)
+        prefork.poll_interval = 0.02
+        thread = Thread(target=prefork.serve_forever)
+        thread.start()
+
+        try:
+            pids = self.wait_for_workers(prefork, port)
+            os.kill(pids.pop(), signal.SIGKILL)
+            pids = self.wait_for_workers(prefork, port, pids)
+
+            # The new worker keeps running.
+            sleep(0.3)
+            self.assertEqual(set(prefork.pids), pids)
+            self.assertEqual(self.get(port, "/plain"), (OK, b"OK"))
+        finally:
+            prefork.shutdown()
+            thread.join()
+
+        self.assertEqual(prefork.pids, {})
+        return
+
+    def test_background(self):
+        server = HealthCheckServer(0, LOOPBACK, reuse_port=True)
+        port = server.server_address[1]
+        server.add_component("plain", lambda: ok)
+        checker = Background(lambda: fail, delay=second(0.05),
+                             start_thread=False)
+        server.add_component("background", Hysteresis(checker))
+        self.assertEqual(unstarted_threads(server), [checker])
+
+        # The thread is started by the state owner's process only once the
+        # spawner has been forked, and stopped on shutdown.
+        prefork = PreforkServer(server, workers=1)
+        thread = Thread(target=prefork.serve_forever)
+        thread.start()
+        try:
+            self.wait_for_workers(prefork, port)
+            self.assertTrue(checker.is_alive())
+            for i in range(50):
+                if self.get(port, "/background")[0] == SERVICE_UNAVAILABLE:
+                    break
+                sleep(0.1)
+            else:
+                self.fail("Background check did not run")
+        finally:
+            prefork.shutdown()
+            thread.join()
+
+        self.assertFalse(checker.is_alive())
+        self.assertEqual(unstarted_threads(server), [])
+        return
+
+if __name__ == "__main__":
+    main()
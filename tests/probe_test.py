@@ -0,0 +1,191 @@
+from __future__ import absolute_import, print_function
+from failover import fail, ok
+from failover.probe import (
+    EXIT_FAIL, EXIT_OK, EXIT_UNKNOWN, connection_factory, main, probe_server)
+from json import dump, loads
+import logging
+import os
+from shutil import rmtree
+from six import StringIO
+import socket
+import sys
+from sys import stderr
+from tempfile import mkdtemp
+from unittest import TestCase, main as unittest_main
+from .server import create_server, get_test_port, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class ProbeTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.tempdir = mkdtemp()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            stop_server(self.server)
+            self.server.server_close()
+        rmtree(self.tempdir)
+
+    def start(self, **kw):
+        self.server = create_server(**kw)
+        self.server.add_component("up", lambda: ok)
+        self.server.add_component("down", lambda: fail)
+        start_server(self.server)
+        return "http://%s:%d/" % (LOOPBACK, self.server.port)
+
+    def run_probe(self, args):
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            status = main(args)
+        finally:
+            sys.stdout = stdout
+        return status, output.getvalue()
+
+    def test_url(self):
+        url = self.start()
+        status, output = self.run_probe(["--url", url, "up"])
+        self.assertEqual(status, EXIT_OK)
+        self.assertTrue(output.startswith("up"))
+
+        status, output = self.run_probe(
+            ["--url", url, "--format", "json", "up", "down", "missing"])
+        self.assertEqual(status, EXIT_FAIL)
+        result = loads(output)
+        self.assertEqual(result["status"], "FAIL")
+        self.assertEqual(result["components"]["up"]["state"], "OK")
+        self.assertEqual(result["components"]["down"]["state"], "FAIL")
+        self.assertEqual(result["components"]["missing"]["state"], "ERROR")
+        self.assertIn("404", result["components"]["missing"]["detail"])
+
+        status, output = self.run_probe(
+            ["--url", url, "--format", "nagios", "up", "missing"])
+        self.assertEqual(status, EXIT_UNKNOWN)
+        self.assertTrue(output.startswith(
+            "FAILOVER UNKNOWN - ERROR: missing | 'up'="))
+
+        status, output = self.run_probe(
+            ["--url", url, "--format", "quiet", "up"])
+        self.assertEqual((status, output), (EXIT_OK, ""))
+        return
+
+    def test_keep_alive(self):
+        url = self.start(threaded=True, keep_alive=True)
+        factory, base_path = connection_factory(url)
+        connections = []
+
+        def counting_factory():
+            connections.append(factory())
+            return connections[-1]
+
+        results = probe_server(counting_factory, base_path,
+                               ["up", "down"] * 10)
+        self.assertEqual([result.state for result in results],
+                         ["OK", "FAIL"] * 10)
+        self.assertEqual(len(connections), 1)
+        return
+
+    def test_unreachable(self):
+        status, output = self.run_probe(
+            ["--url", "http://%s:%d/" % (LOOPBACK, get_test_port()),
+             "--format", "json", "up"])
+        self.assertEqual(status, EXIT_UNKNOWN)
+        self.assertIn("request failed",
+                      loads(output)["components"]["up"]["detail"])
+        return
+
+    def test_unix(self):
+        path = os.path.join(self.tempdir, "failover.sock")
+        self.start(unix_socket=path)
+        status, output = self.run_probe(["--unix", path, "up"])
+        self.assertEqual(status, EXIT_OK)
+        return
+
+    def test_config(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((LOOPBACK, 0))
+        listener.listen(5)
+        port = listener.getsockname()[1]
+        closed_port = get_test_port()
+
+        filename = os.path.join(self.tempdir, "failover.json")
+        with open(filename, "w") as fd:
+            dump({"components": {
+                "up": {"task": {"type": "TCPCheck", "host": LOOPBACK,
+                                "port": port, "timeout": "5s"}},
+                "down": {"task": {"type": "TCPCheck", "host": LOOPBACK,
+                                  "port": closed_port, "timeout": "5s"}},
+            }}, fd)
+
+        try:
+            status, output = self.run_probe(
+                ["--config", filename, "--format", "json"])
+            self.assertEqual(status, EXIT_FAIL)
+            self.assertEqual(
+                dict((name, result["state"]) for name, result in
+                     loads(output)["components"].items()),
+                {"up": "OK", "down": "FAIL"})
+
+            status, output = self.run_probe(["--config", filename, "up"])
+            self.assertEqual(status, EXIT_OK)
+        finally:
+            listener.close()
+        return
+
+    def test_config_wrapped(self):
+        closed_port = get_test_port()
+        check = {"type": "TCPCheck", "host": LOOPBACK, "port": closed_port,
+                 "timeout": "5s"}
+
+        filename = os.path.join(self.tempdir, "failover.json")
+        with open(filename, "w") as fd:
+            dump({"components": {
+                "background": {"task": {"type": "Background", "task": check,
+                                        "delay": "60s"}},
+                "hysteresis": {"task": {"type": "Hysteresis", "task": check,
+                                        "fail_after": 3}},
+                "toggle": {"task": {
+                    "type": "Toggle",
+                    "to_fail": {"type": "Hysteresis", "task": check,
+                                "fail_after": "5min"},
+                    "to_ok": {"type": "Oneshot"}}},
+                "passive": {"task": {"type": "PassiveCheck"}},
+            }}, fd)
+
+        # Each wrapper would answer OK (its initial state) if only called
+        # once; the failing check must be seen through it.
+        status, output = self.run_probe(
+            ["--config", filename, "--format", "json"])
+        self.assertEqual(status, EXIT_FAIL)
+        self.assertEqual(
+            dict((name, result["state"]) for name, result in
+                 loads(output)["components"].items()),
+            {"background": "FAIL", "hysteresis": "FAIL", "toggle": "FAIL",
+             "passive": "ERROR"})
+        return
+
+    def test_usage(self):
+        stderr_ = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            for args in ([], ["--url", "http://localhost/"],
+                         ["--url", "http://localhost/", "--unix", "x", "a"]):
+                try:
+                    main(args)
+                    self.fail("Expected SystemExit for %r" % (args,))
+                except SystemExit as e:
+                    self.assertEqual(e.code, EXIT_UNKNOWN)
+
+            self.assertEqual(main(["--config", os.path.join(
+                self.tempdir, "missing.json")]), EXIT_UNKNOWN)
+        finally:
+            sys.stderr = stderr_
+        return
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,221 @@
+from __future__ import absolute_import, print_function
+from failover import fail, Hysteresis, ok, RemoteHealthCheck
+from failover.pool import ConnectionPool
+from failover.remote import RemoteError
+from failover.watch import WatchHub
+import logging
+from socket import create_connection
+from sys import stderr
+from threading import Event, Thread
+from time import sleep, time
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+UNROUTABLE = "192.0.2.1" # RFC 5737 -- TEST-NET-1 space, unroutable globally
+
+def broken():
+    raise ValueError("broken")
+
+class CountingTask(object):
+    """
+    A task returning state, which waits for the gate to open first.
+    """
+    def __init__(self, state=ok):
+        super(CountingTask, self).__init__()
+        self.state = state
+        self.calls = 0
+        self.started = Event()
+        self.gate = Event()
+        self.gate.set()
+        return
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.gate.wait(10)
+        return self.state
+
+def wait_for(condition, timeout=5):
+    deadline = time() + timeout
+    while not condition():
+        if time() > deadline:
+            raise AssertionError("timed out")
+        sleep(0.01)
+    return
+
+class RemoteHealthCheckTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.pool = ConnectionPool()
+        self.servers = []
+        self.checks = []
+
+    def tearDown(self):
+        for check in self.checks:
+            check.close()
+        self.pool.clear()
+        for server in self.servers:
+            stop_server(server)
+            server.server_close()
+
+    def start(self, **kw):
+        server = create_server(threaded=True, **kw)
+        server.add_component("up", lambda: ok)
+        server.add_component("down", lambda: fail)
+        server.add_component("broken", broken)
+        start_server(server)
+        self.servers.append(server)
+        return "http://%s:%d/" % (LOOPBACK, server.port)
+
+    def check(self, url, component):
+        return RemoteHealthCheck(url, component, pool=self.pool)
+
+    def test_states(self):
+        url = self.start()
+        self.assertEqual(self.check(url, "up")(), ok)
+        self.assertEqual(self.check(url, "down")(), fail)
+        for component in ("broken", "missing"):
+            with self.assertRaises(RemoteError):
+                self.check(url, component)()
+
+        # Wrapped in a Hysteresis, errors keep the current state.
+        self.assertEqual(Hysteresis(self.check(url, "broken"),
+                                    initial_state=ok)(), ok)
+
+        # An unreachable server fails the check.
+        checker = RemoteHealthCheck("http://%s/" % (UNROUTABLE,), "up",
+                                    timeout=0.1, pool=self.pool)
+        self.assertEqual(checker(), fail)
+        self.assertEqual(repr(checker), "RemoteHealthCheck(url=%r, "
+                         "component='up')" % ("http://%s/" % (UNROUTABLE,)))
+        return
+
+    def test_keep_alive(self):
+        url = self.start(keep_alive=True)
+        checker = self.check(url, "up")
+        other = self.check(url, "down")
+        self.assertEqual(checker(), ok)
+        connection = checker.idle[0]
+
+        # Checks of the same server share the connection.
+        for i in range(3):
+            self.assertEqual(other(), fail)
+            self.assertEqual(checker(), ok)
+        self.assertEqual(checker.idle, [connection])
+
+        # Without keep-alive, the server closes each connection.
+        url = self.start()
+        checker = self.check(url, "up")
+        self.assertEqual(checker(), ok)
+        self.assertEqual(checker.idle, [])
+        return
+
+    def test_keep_alive_http_10(self):
+        url = self.start(keep_alive=True)
+        port = self.servers[0].port
+        for request, persistent in [
+                (b"GET /up HTTP/1.0\r\n\r\n", False),
+                (b"GET /up HTTP/1.0\r\nConnection: keep-alive\r\n\r\n", True),
+                (b"GET /up HTTP/1.1\r\nConnection: close\r\n\r\n", False),
+                (b"POST /up HTTP/1.1\r\nContent-Length: 0\r\n\r\n", False)]:
+            sock = create_connection((LOOPBACK, port))
+            try:
+                sock.settimeout(5)
+                sock.sendall(request)
+                response = sock.recv(4096)
+            finally:
+                sock.close()
+            self.assertEqual(b"Connection: close" in response,
+                             not persistent, response)
+        return
+
+    def test_coalescing(self):
+        task = CountingTask()
+        task.gate.clear()
+        url = self.start()
+        self.servers[0].add_component("slow", task)
+
+        # Separate checks of the same component share one request.
+        results = []
+        def call():
+            results.append(self.check(url, "slow")())
+        threads = [Thread(target=call) for i in range(4)]
+        threads[0].start()
+        self.assertTrue(task.started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        sleep(0.1)
+        task.gate.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [ok] * 4)
+        self.assertEqual(task.calls, 1)
+
+        # Later calls make a new request.
+        self.assertEqual(self.check(url, "slow")(), ok)
+        self.assertEqual(task.calls, 2)
+        return
+
+    def test_watch(self):
+        task = CountingTask()
+        remote = Hysteresis(task)
+        url = self.start()
+        self.servers[0].add_component("watched", remote)
+        hub = WatchHub(self.servers[0], timeout=5)
+        try:
+            checker = RemoteHealthCheck(url, "watched", pool=self.pool,
+                                        watch=True, watch_timeout=5)
+            self.checks.append(checker)
+            wait_for(lambda: checker.watcher.state is not None)
+
+            # The watched state is returned without requesting the component.
+            for i in range(5):
+                self.assertEqual(checker(), ok)
+            self.assertEqual(task.calls, 0)
+
+            # Changes arrive without polling.
+            task.state = fail
+            remote()
+            wait_for(lambda: checker() == fail)
+            self.assertEqual(task.calls, 1)
+
+            # Stopping is prompt even while a poll is in progress.
+            start = time()
+            checker.close()
+            self.assertLess(time() - start, 2)
+            self.assertFalse(checker.watcher.is_alive())
+        finally:
+            hub.close()
+        return
+
+    def test_watch_fallback(self):
+        # Without a WatchHub on the remote server, calls make requests.
+        task = CountingTask()
+        url = self.start()
+        self.servers[0].add_component("plain", task)
+        checker = RemoteHealthCheck(url, "plain", pool=self.pool, watch=True)
+        self.checks.append(checker)
+        for i in range(3):
+            self.assertEqual(checker(), ok)
+        self.assertEqual(task.calls, 3)
+        self.assertIsNone(checker.watcher.state)
+        return
+
+    def test_reject_invalid(self):
+        for url, component in [("ftp://x/", "a"), ("http:///", "a"),
+                               ("http://x/?a=b", "a"), ("http://x/", ""),
+                               ("http://x/", "/a")]:
+            with self.assertRaises(ValueError):
+                RemoteHealthCheck(url, component)
+
+        with self.assertRaises(ValueError):
+            create_server(keep_alive=True)
+        return
+
+if __name__ == "__main__":
+    main()
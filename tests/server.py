@@ -17,11 +17,11 @@ def get_test_port():
             break
     return port
 
-def create_server(port=None):
+def create_server(port=None, **kw):
     if port is None:
         port = get_test_port()
     
-    server = HealthCheckServer(port)
+    server = HealthCheckServer(port, **kw)
     server.port = port
     return server
 
@@ -0,0 +1,142 @@
+from __future__ import absolute_import, print_function
+import failover
+import logging
+from socket import AF_INET, SOCK_STREAM, socket, SOL_SOCKET, SO_REUSEADDR
+from sys import stderr
+from threading import Thread
+from unittest import TestCase, main
+
+LOOPBACK = "127.0.0.1"
+
+log = logging.getLogger("test.smtp")
+
+class SMTPService(Thread):
+    """
+    A stand-in SMTP server which sends a configurable greeting and answers
+    NOOP and QUIT commands.
+    """
+    def __init__(self, *args, **kw):
+        super(SMTPService, self).__init__(*args, **kw)
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.socket.bind((LOOPBACK, 0))
+        self.socket.listen(5)
+        self.port = self.socket.getsockname()[1]
+        self.greeting = b"220 mail.example.com ESMTP ready\r\n"
+        self.n_connections = 0
+        self.n_noops = 0
+        self.daemon = True
+        self.start()
+        return
+
+    def run(self):
+        while True:
+            try:
+                conn, client = self.socket.accept()
+            except Exception:
+                break
+            self.n_connections += 1
+            thread = Thread(target=self.converse, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def converse(self, conn):
+        try:
+            if self.greeting:
+                conn.sendall(self.greeting)
+            fd = conn.makefile("rb")
+            for line in fd:
+                command = line.strip().upper()
+                if command == b"NOOP":
+                    self.n_noops += 1
+                    conn.sendall(b"250 OK\r\n")
+                elif command == b"QUIT":
+                    conn.sendall(b"221 Bye\r\n")
+                    break
+        except Exception:
+            log.debug("Connection error", exc_info=True)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.socket.close()
+        return
+
+class SMTPCheckTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.service = SMTPService()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_greeting(self):
+        checker = failover.SMTPCheck(
+            LOOPBACK, self.service.port, read_timeout=1, name="smtp1")
+        self.assertTrue(checker())
+        self.assertEqual(repr(checker), "smtp1")
+
+        # Multi-line greetings are accepted.
+        self.service.greeting = (b"220-mail.example.com ESMTP\r\n"
+                                 b"220-Unsolicited email prohibited\r\n"
+                                 b"220 Ready\r\n")
+        self.assertTrue(checker())
+
+        # Temporary failures are not.
+        self.service.greeting = b"421 Service not available\r\n"
+        self.assertFalse(checker())
+
+        # Nor is garbage.
+        self.service.greeting = b"SSH-2.0-OpenSSH_7.4\r\n"
+        self.assertFalse(checker())
+        return
+
+    def test_bounded_greeting(self):
+        self.service.greeting = b"220-" + b"x" * 8192 + b"\r\n220 Ready\r\n"
+        checker = failover.SMTPCheck(
+            LOOPBACK, self.service.port, read_timeout=1,
+            max_reply_size=1024)
+        self.assertFalse(checker())
+        return
+
+    def test_greeting_timeout(self):
+        self.service.greeting = None
+        checker = failover.SMTPCheck(
+            LOOPBACK, self.service.port, read_timeout=0.1)
+        self.assertFalse(checker())
+        return
+
+    def test_keep_alive(self):
+        checker = failover.SMTPCheck(
+            LOOPBACK, self.service.port, read_timeout=1, keep_alive=True)
+        for i in range(4):
+            self.assertTrue(checker())
+        self.assertEqual(self.service.n_connections, 1)
+        self.assertEqual(self.service.n_noops, 3)
+
+        # If the held connection dies, we should reconnect.
+        checker.connection.close()
+        self.assertTrue(checker())
+        self.assertEqual(self.service.n_connections, 2)
+        checker.close()
+        return
+
+    def test_reject_invalid(self):
+        try:
+            failover.SMTPCheck(LOOPBACK, read_timeout=-1)
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+
+        try:
+            failover.SMTPCheck(LOOPBACK, max_reply_size=0)
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+        return
+
+if __name__ == "__main__":
+    main()
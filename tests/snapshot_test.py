@@ -0,0 +1,119 @@
+from __future__ import absolute_import, print_function
+from failover import (
+    count, fail, Hysteresis, ok, Oneshot, second, StateSnapshot, Toggle)
+from json import load
+import logging
+from os.path import exists
+from shutil import rmtree
+from sys import stderr
+from tempfile import mkdtemp
+from time import sleep
+from unittest import TestCase, main
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.tempdir = mkdtemp()
+        self.filename = self.tempdir + "/state.json"
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def create_tree(self):
+        self.result = ok
+        reset = Oneshot()
+        return Toggle(
+            to_fail=Hysteresis(task=lambda: self.result,
+                               fail_after=count(2), ok_after=count(2)),
+            to_ok=reset)
+
+    def test_restore(self):
+        snapshot = StateSnapshot(self.filename, delay=second(0.05))
+        toggle = self.create_tree()
+        snapshot.add("mail", toggle)
+
+        # Fail over, then start a disagreement on the way back.
+        self.result = fail
+        self.assertTrue(toggle())
+        self.assertFalse(toggle())
+        self.result = ok
+        self.assertFalse(toggle.to_fail())
+        toggle.to_ok.fire()
+
+        sleep(0.2)
+        self.assertTrue(exists(self.filename))
+        snapshot.stop()
+
+        # A "restarted" process should pick up where we left off.
+        snapshot = StateSnapshot(self.filename, start_thread=False)
+        toggle = self.create_tree()
+        snapshot.add("mail", toggle)
+        self.assertFalse(toggle.state)
+        self.assertFalse(toggle.to_fail.current_state)
+        self.assertEqual(toggle.to_fail.disagree_count, 1)
+        self.assertTrue(toggle.to_ok.next_state)
+
+        # The armed oneshot fires back exactly once.
+        self.assertTrue(toggle())
+        self.assertFalse(toggle.to_ok())
+        return
+
+    def test_write_only_on_change(self):
+        snapshot = StateSnapshot(self.filename, start_thread=False)
+        toggle = Toggle(to_fail=lambda: fail, to_ok=lambda: fail)
+        snapshot.add("toggle", toggle)
+        snapshot.flush()
+
+        with open(self.filename) as fd:
+            self.assertEqual(load(fd)["components"],
+                             {"toggle": {"state": True}})
+
+        calls = []
+        write = snapshot.write
+        snapshot.write = lambda components: (calls.append(components),
+                                             write(components))
+        snapshot.flush()
+        self.assertEqual(calls, [])
+
+        toggle()
+        snapshot.flush()
+        self.assertEqual(calls, [{"toggle": {"state": False}}])
+        return
+
+    def test_unknown_components_retained(self):
+        snapshot = StateSnapshot(self.filename, start_thread=False)
+        snapshot.add("a", Toggle(to_fail=None, to_ok=None, initial_state=fail))
+        snapshot.add("b", Oneshot())
+        snapshot.flush()
+
+        # Only re-register one of them; the other's state must survive.
+        snapshot = StateSnapshot(self.filename, start_thread=False)
+        snapshot.add("b", Oneshot())
+        snapshot.flush()
+
+        snapshot = StateSnapshot(self.filename, start_thread=False)
+        toggle = Toggle(to_fail=None, to_ok=None)
+        snapshot.add("a", toggle)
+        self.assertFalse(toggle.state)
+        return
+
+    def test_corrupt_file(self):
+        with open(self.filename, "w") as fd:
+            fd.write("{not json")
+
+        snapshot = StateSnapshot(self.filename, start_thread=False)
+        toggle = Toggle(to_fail=None, to_ok=None)
+        snapshot.add("toggle", toggle)
+        self.assertTrue(toggle.state)
+        snapshot.flush()
+
+        with open(self.filename) as fd:
+            self.assertEqual(load(fd)["components"],
+                             {"toggle": {"state": True}})
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+from __future__ import absolute_import, print_function
+from failover import Background, fail, ok, second
+from failover.statetable import (
+    Published, SEQUENCE, StateTable, TableReader)
+import logging
+import os
+from shutil import rmtree
+from sys import stderr
+from tempfile import mkdtemp
+from time import sleep, time
+from unittest import TestCase, main
+
+class StateTableTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.tempdir = mkdtemp()
+        self.filename = self.tempdir + "/state.table"
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def test_read_write(self):
+        writer = StateTable(self.filename, writable=True, capacity=2)
+        reader = StateTable(self.filename)
+        try:
+            self.assertIsNone(reader.read("mail"))
+            writer.write("mail", ok, 0.25, 1000.0)
+            self.assertEqual(reader.read("mail"), (ok, 1000.0, 0.25))
+            writer.write("mail", fail, 0.5, 1001.0)
+            writer.write("web", ok, 0.125, 1002.0)
+            self.assertEqual(reader.snapshot(), {
+                "mail": (fail, 1001.0, 0.5),
+                "web": (ok, 1002.0, 0.125),
+            })
+
+            # Full table and overlong names are rejected.
+            with self.assertRaises(ValueError):
+                writer.write("db", ok, 0.0)
+            with self.assertRaises(ValueError):
+                writer.write("x" * 65, ok, 0.0)
+
+            # Readers can't write.
+            with self.assertRaises(ValueError):
+                reader.write("mail", ok, 0.0)
+        finally:
+            reader.close()
+            writer.close()
+
+        # Only one writer at a time; the records survive reopening.
+        writer = StateTable(self.filename, writable=True, capacity=2)
+        try:
+            with self.assertRaises((IOError, OSError)):
+                StateTable(self.filename, writable=True, capacity=2)
+            self.assertEqual(writer.read("web"), (ok, 1002.0, 0.125))
+        finally:
+            writer.close()
+        return
+
+    def test_writer_crash(self):
+        writer = StateTable(self.filename, writable=True, capacity=2)
+        writer.write("mail", ok, 0.25, 1000.0)
+        writer.write("web", ok, 0.125, 1002.0)
+
+        # A writer dying between marking "mail" odd and making it even again.
+        offset = writer.offset(writer.slot("mail"))
+        sequence = SEQUENCE.unpack_from(writer.map, offset)[0]
+        SEQUENCE.pack_into(writer.map, offset, sequence + 1)
+        writer.close()
+
+        writer = StateTable(self.filename, writable=True, capacity=2)
+        reader = StateTable(self.filename)
+        try:
+            # The interrupted record is cleared; the others are intact.
+            self.assertIsNone(reader.read("mail"))
+            self.assertEqual(reader.read("web"), (ok, 1002.0, 0.125))
+            for i in range(3):
+                writer.write("mail", fail, 0.5, 1003.0 + i)
+                self.assertEqual(reader.read("mail"), (fail, 1003.0 + i, 0.5))
+
+            # Writes restore the parity of a record left odd even without
+            # reopening.
+            offset = writer.offset(writer.slot("web"))
+            sequence = SEQUENCE.unpack_from(writer.map, offset)[0]
+            SEQUENCE.pack_into(writer.map, offset, sequence + 1)
+            writer.write("web", fail, 0.5, 1010.0)
+            self.assertEqual(reader.read("web"), (fail, 1010.0, 0.5))
+        finally:
+            reader.close()
+            writer.close()
+        return
+
+    def test_replaced(self):
+        writer = StateTable(self.filename, writable=True, capacity=4)
+        writer.write("a", ok, 0.25, 1000.0)
+        writer.write("b", fail, 0.5, 1001.0)
+        reader = StateTable(self.filename)
+        try:
+            self.assertEqual(reader.read("a"), (ok, 1000.0, 0.25))
+            writer.close()
+
+            # A new writer with another capacity replaces the file rather
+            # than truncating it under the reader, which maps the new one.
+            writer = StateTable(self.filename, writable=True, capacity=8)
+            writer.write("b", fail, 0.5, 1002.0)
+            writer.write("a", ok, 0.25, 1003.0)
+            self.assertEqual(reader.read("a"), (ok, 1003.0, 0.25))
+            self.assertEqual(reader.read("b"), (fail, 1002.0, 0.5))
+            self.assertEqual(reader.capacity, 8)
+            self.assertEqual(os.listdir(self.tempdir), ["state.table"])
+
+            # A record reused for another name isn't mistaken for the one
+            # cached.
+            reader.slots["a"] = reader.slots["b"]
+            self.assertEqual(reader.read("a"), (ok, 1003.0, 0.25))
+
+            # The new file is locked by its writer.
+            with self.assertRaises((IOError, OSError)):
+                StateTable(self.filename, writable=True, capacity=8)
+        finally:
+            reader.close()
+            writer.close()
+        return
+
+    def test_not_a_table(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(b"\0" * 1024)
+
+        with self.assertRaises(ValueError):
+            StateTable(self.filename)
+        return
+
+    def test_cross_process(self):
+        writer = StateTable(self.filename, writable=True)
+        checker = Background(Published(lambda: ok, writer, "mail"),
+                             delay=second(0.05))
+        try:
+            sleep(0.2)
+            pid = os.fork()
+            if pid == 0:
+                # The child sees the parent's results without running the
+                # check itself.
+                status = 1
+                try:
+                    reader = StateTable(self.filename)
+                    if TableReader(reader, "mail", max_age=second(1))() is ok:
+                        status = 0
+                finally:
+                    os._exit(status)
+
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(status, 0)
+        finally:
+            checker.stop()
+            writer.close()
+        return
+
+    def test_table_reader(self):
+        writer = StateTable(self.filename, writable=True)
+        reader = StateTable(self.filename)
+        try:
+            task = TableReader(reader, "mail", max_age=second(10),
+                               default_state=fail)
+            self.assertFalse(task())
+
+            writer.write("mail", ok, 0.1)
+            self.assertTrue(task())
+
+            # Stale results fall back to the default state.
+            writer.write("mail", ok, 0.1, time() - 20)
+            self.assertFalse(task())
+
+            # So does a record the writer left partway through an update.
+            writer.write("mail", ok, 0.1)
+            offset = writer.offset(writer.slot("mail"))
+            sequence = SEQUENCE.unpack_from(writer.map, offset)[0]
+            SEQUENCE.pack_into(writer.map, offset, sequence + 1)
+            self.assertFalse(task())
+        finally:
+            reader.close()
+            writer.close()
+        return
+
+if __name__ == "__main__":
+    main()
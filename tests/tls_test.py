@@ -0,0 +1,116 @@
+from __future__ import absolute_import, print_function
+import failover
+import logging
+from os.path import dirname
+from socket import AF_INET, SOCK_STREAM, socket, SOL_SOCKET, SO_REUSEADDR
+import ssl
+from sys import stderr
+from threading import Thread
+from unittest import TestCase, main
+
+LOOPBACK = "127.0.0.1"
+PEM = dirname(__file__) + "/tls_test.pem"
+
+log = logging.getLogger("test.tls")
+
+class TLSService(Thread):
+    """
+    A stand-in TLS server using the self-signed certificate in tls_test.pem.
+    If handshake is False, connections are accepted but never answered.
+    """
+    def __init__(self, *args, **kw):
+        super(TLSService, self).__init__(*args, **kw)
+        self.context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        self.context.load_cert_chain(PEM)
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.socket.bind((LOOPBACK, 0))
+        self.socket.listen(5)
+        self.port = self.socket.getsockname()[1]
+        self.handshake = True
+        self.held = []
+        self.daemon = True
+        self.start()
+        return
+
+    def run(self):
+        while True:
+            try:
+                conn, client = self.socket.accept()
+            except Exception:
+                break
+
+            if not self.handshake:
+                self.held.append(conn)
+                continue
+
+            try:
+                conn.settimeout(1)
+                self.context.wrap_socket(conn, server_side=True).close()
+            except Exception:
+                log.debug("Handshake failed", exc_info=True)
+                conn.close()
+
+    def stop(self):
+        self.socket.close()
+        for conn in self.held:
+            conn.close()
+        return
+
+class TLSCheckTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.service = TLSService()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_handshake(self):
+        context = ssl.create_default_context(cafile=PEM)
+        checker = failover.TLSCheck(
+            LOOPBACK, self.service.port, server_hostname="localhost",
+            tls_context=context)
+        self.assertTrue(checker())
+        self.assertTrue(repr(checker).startswith(
+            "TLSCheck(host='127.0.0.1', port=%d" % self.service.port))
+
+        # The certificate does not cover this name.
+        checker = failover.TLSCheck(
+            LOOPBACK, self.service.port, server_hostname="mail.example.com",
+            tls_context=context)
+        self.assertFalse(checker())
+
+        # The default context does not trust the self-signed certificate.
+        checker = failover.TLSCheck(
+            "localhost", self.service.port, handshake_timeout=1)
+        self.assertFalse(checker())
+        return
+
+    def test_handshake_timeout(self):
+        self.service.handshake = False
+        context = ssl.create_default_context(cafile=PEM)
+        checker = failover.TLSCheck(
+            "localhost", self.service.port, handshake_timeout=0.1,
+            tls_context=context)
+        self.assertFalse(checker())
+        return
+
+    def test_reject_invalid(self):
+        try:
+            failover.TLSCheck(LOOPBACK, handshake_timeout=-1)
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+
+        try:
+            failover.TLSCheck(LOOPBACK, server_hostname=42)
+            self.fail("Expected TypeError")
+        except TypeError:
+            pass
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+from __future__ import absolute_import, print_function
+from failover import Background, Hysteresis, ok, second, Toggle, Oneshot
+from failover.trace import Tracer
+from json import loads
+import logging
+from six.moves.http_client import HTTPConnection, OK
+from sys import stderr
+from time import sleep
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class SlowTask(object):
+    def __init__(self, delay):
+        super(SlowTask, self).__init__()
+        self.delay = delay
+        self.exception = None
+        return
+
+    def __call__(self):
+        sleep(self.delay)
+        if self.exception is not None:
+            raise self.exception
+        return ok
+
+    def __repr__(self):
+        return "slow"
+
+class TraceTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.server = create_server()
+        self.tracer = None
+
+    def tearDown(self):
+        if self.tracer is not None:
+            self.tracer.close()
+        self.server.server_close()
+
+    def test_nested(self):
+        slow = SlowTask(0.02)
+        checker = Toggle(to_fail=Hysteresis(task=slow, name="hyst"),
+                         to_ok=Oneshot(), name="toggle")
+        self.server.add_component("mail", checker)
+        self.tracer = Tracer(self.server, slowest=2)
+
+        for delay in (0.02, 0.05, 0.01):
+            slow.delay = delay
+            checker()
+
+        traces = self.tracer.report()["mail"]
+        # Only the two slowest are kept, slowest first.
+        self.assertEqual(len(traces), 2)
+        self.assertGreaterEqual(traces[0]["duration_ms"], 50)
+        self.assertGreaterEqual(traces[1]["duration_ms"], 20)
+        self.assertLess(traces[1]["duration_ms"], 50)
+        self.assertEqual(traces[0]["source"], "background")
+
+        span = traces[0]["span"]
+        self.assertEqual(span["task"], "toggle")
+        hyst = span["children"][0]
+        self.assertEqual(hyst["task"], "hyst")
+        self.assertEqual(hyst["children"][0]["task"], "slow")
+        self.assertGreaterEqual(hyst["children"][0]["duration_ms"], 50)
+        self.assertLessEqual(hyst["children"][0]["duration_ms"],
+                             span["duration_ms"])
+
+        # Exceptions are recorded against the span that raised them.
+        slow.exception = ValueError()
+        slow.delay = 0.1
+        checker()
+        span = self.tracer.report()["mail"][0]["span"]
+        self.assertEqual(span["children"][0]["children"][0]["error"],
+                         "ValueError")
+        self.assertNotIn("error", span)
+
+        # Closing restores the original classes.
+        self.tracer.close()
+        self.tracer = None
+        self.assertNotIn("original", dir(Hysteresis.__call__))
+        self.assertNotIn("original", dir(SlowTask.__call__))
+        return
+
+    def test_background(self):
+        slow = SlowTask(0.01)
+        checker = Background(task=slow, delay=second(0.05),
+                             start_thread=False)
+        self.server.add_component("bg", checker)
+        self.tracer = Tracer(self.server)
+        checker.start()
+        try:
+            sleep(0.2)
+        finally:
+            checker.stop()
+
+        traces = self.tracer.report(["bg"])["bg"]
+        self.assertGreater(len(traces), 1)
+        self.assertEqual(traces[0]["span"]["task"], "slow")
+        self.assertEqual(traces[0]["source"], "background")
+
+        self.tracer.reset()
+        self.assertEqual(self.tracer.report(), {})
+        return
+
+    def test_endpoint(self):
+        self.server.add_component("slow", Hysteresis(task=SlowTask(0.01)))
+        self.tracer = Tracer(self.server)
+        start_server(self.server)
+        try:
+            for path in ("/slow", "/_trace?component=slow"):
+                con = HTTPConnection(LOOPBACK, self.server.port)
+                con.request("GET", path)
+                response = con.getresponse()
+                body = response.read()
+                con.close()
+                self.assertEqual(response.status, OK)
+        finally:
+            stop_server(self.server)
+
+        traces = loads(body.decode("utf-8"))["components"]["slow"]
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]["source"], "request")
+        self.assertEqual(traces[0]["span"]["task"], "slow")
+        self.assertEqual(traces[0]["span"]["children"][0]["task"], "slow")
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from __future__ import absolute_import, print_function
+from failover import count, day, hour, minute, second
+from failover.units import convert, IncompatibleUnitsError
+from failover.validation import validate_after, validate_duration
+from unittest import TestCase, main
+
+try:
+    import units
+    import units.predefined
+except ImportError:
+    units = None
+
+class UnitsTest(TestCase):
+    def test_arithmetic(self):
+        self.assertEqual(minute(2), second(120))
+        self.assertEqual(day(1), hour(24))
+        self.assertEqual(second(30) + minute(1), second(90))
+        self.assertEqual(minute(1) - second(30), minute(0.5))
+        self.assertEqual(minute(3) / second(1), 180)
+        self.assertEqual(second(5) * 2, second(10))
+        self.assertTrue(second(59) < minute(1) <= second(60))
+        self.assertTrue(count(5) >= count(5))
+        self.assertNotEqual(count(1), second(1))
+        self.assertEqual(repr(minute(2)), "minute(2)")
+        self.assertEqual(hash(minute(1)), hash(second(60)))
+
+        try:
+            count(1) < second(1)
+            self.fail("Expected IncompatibleUnitsError")
+        except IncompatibleUnitsError:
+            pass
+
+        try:
+            second("ten")
+            self.fail("Expected TypeError")
+        except TypeError:
+            pass
+        return
+
+    def test_validation(self):
+        self.assertEqual(validate_duration(hour(1)), 3600.0)
+        self.assertEqual(validate_duration(2), 2.0)
+        self.assertEqual(validate_after(minute(2)), second(120))
+        self.assertIs(validate_after(minute(2)).unit, second)
+        self.assertIs(validate_after(5).unit, count)
+        return
+
+    def test_units_library(self):
+        if units is None:
+            self.skipTest("the units library is not installed")
+
+        units.predefined.define_units()
+        self.assertEqual(convert(units.unit("s")(10)), second(10))
+        self.assertEqual(convert(units.unit("min")(2)), minute(2))
+        self.assertEqual(convert(units.unit("ms")(500)), second(0.5))
+        self.assertEqual(convert(units.unit("count")(3)), count(3))
+        self.assertIsNone(convert(10))
+
+        self.assertEqual(validate_duration(units.unit("min")(1)), 60.0)
+        self.assertEqual(validate_after(units.unit("count")(3)), count(3))
+        self.assertEqual(second(1) + units.unit("s")(1), second(2))
+
+        try:
+            convert(units.unit("m")(1))
+            self.fail("Expected ValueError")
+        except ValueError:
+            pass
+
+        # ... but such quantities merely compare unequal.
+        self.assertFalse(second(1) == units.unit("m")(1))
+        self.assertTrue(second(1) != units.unit("m")(1))
+        return
+
+if __name__ == "__main__":
+    main()
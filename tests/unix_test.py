@@ -0,0 +1,148 @@
+from __future__ import absolute_import, print_function
+from failover import HealthCheckServer, Oneshot, fail, ok
+from failover.admission import AdmissionControl
+from failover.handler import current_handler
+import logging
+import os
+from shutil import rmtree
+from six.moves.http_client import (
+    FORBIDDEN, HTTPConnection, OK, SERVICE_UNAVAILABLE)
+import socket
+import stat
+from sys import stderr
+from tempfile import mkdtemp
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    An HTTPConnection to a server listening on a Unix domain socket.
+    """
+    def __init__(self, unix_path):
+        HTTPConnection.__init__(self, "localhost")
+        self.unix_path = unix_path
+        return
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+        return
+
+class ClientAddressTask(object):
+    """
+    A task recording the client address of the request invoking it.
+    """
+    def __init__(self):
+        super(ClientAddressTask, self).__init__()
+        self.client_address = None
+        return
+
+    def __call__(self):
+        self.client_address = current_handler().client_address
+        return ok
+
+class UnixSocketTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.tempdir = mkdtemp()
+        self.path = os.path.join(self.tempdir, "failover.sock")
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def request(self, con, method, path):
+        con.request(method, path)
+        response = con.getresponse()
+        body = response.read()
+        con.close()
+        return response.status, body
+
+    def test_unix_only(self):
+        server = HealthCheckServer(None, unix_socket=self.path)
+        task = ClientAddressTask()
+        server.add_component("address", task)
+        server.add_component("down", lambda: fail)
+        AdmissionControl(server, client_rate=100)
+        start_server(server)
+        try:
+            self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+            self.assertEqual(
+                self.request(UnixHTTPConnection(self.path), "GET",
+                             "/address"), (OK, b"OK"))
+            self.assertEqual(task.client_address, ("unix", 0))
+            self.assertEqual(
+                self.request(UnixHTTPConnection(self.path), "GET", "/down"),
+                (SERVICE_UNAVAILABLE, b"FAIL"))
+        finally:
+            stop_server(server)
+            server.server_close()
+        self.assertFalse(os.path.exists(self.path))
+        return
+
+    def test_tcp_and_unix(self):
+        server = create_server(unix_socket=self.path, unix_socket_mode=0o660,
+                               unix_post_only=True)
+        oneshot = Oneshot()
+        server.add_component("reset", oneshot, on_post=oneshot.fire)
+        start_server(server)
+        try:
+            self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o660)
+
+            # Both listeners serve the same components.
+            for con in (HTTPConnection(LOOPBACK, server.port),
+                        UnixHTTPConnection(self.path)):
+                self.assertEqual(self.request(con, "GET", "/reset")[0],
+                                 SERVICE_UNAVAILABLE)
+
+            # POST is only accepted over the Unix socket.
+            self.assertEqual(
+                self.request(HTTPConnection(LOOPBACK, server.port), "POST",
+                             "/reset"), (FORBIDDEN, b"FORBIDDEN"))
+            self.assertEqual(oneshot.next_state, oneshot.default_state)
+            self.assertEqual(
+                self.request(UnixHTTPConnection(self.path), "POST",
+                             "/reset")[0], OK)
+            self.assertEqual(
+                self.request(HTTPConnection(LOOPBACK, server.port), "GET",
+                             "/reset"), (OK, b"OK"))
+        finally:
+            stop_server(server)
+            server.server_close()
+        self.assertFalse(os.path.exists(self.path))
+        return
+
+    def test_stale_socket(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+
+        server = HealthCheckServer(None, unix_socket=self.path)
+        try:
+            # The live socket is not replaced.
+            self.assertRaises(socket.error, HealthCheckServer, None,
+                              unix_socket=self.path)
+        finally:
+            server.server_close()
+
+        # Nor is a file that isn't a socket.
+        open(self.path, "w").close()
+        self.assertRaises(socket.error, HealthCheckServer, None,
+                          unix_socket=self.path)
+        self.assertTrue(os.path.isfile(self.path))
+        return
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, HealthCheckServer, None)
+        self.assertRaises(ValueError, HealthCheckServer, None,
+                          unix_socket=self.path, reuse_port=True)
+        self.assertRaises(ValueError, HealthCheckServer, 8080,
+                          unix_post_only=True)
+        return
+
+if __name__ == "__main__":
+    main()
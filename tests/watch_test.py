@@ -0,0 +1,159 @@
+from __future__ import absolute_import, print_function
+from failover import ok, Oneshot
+from failover.watch import WatchHub
+from json import loads
+import logging
+from six.moves.http_client import (
+    HTTPConnection, NOT_FOUND, NOT_MODIFIED, OK)
+from sys import stderr
+from threading import Thread
+from time import sleep, time
+from unittest import TestCase, main
+from .server import create_server, start_server, stop_server
+
+LOOPBACK = "127.0.0.1"
+
+class WatchTest(TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            stream=stderr, level=logging.DEBUG,
+            format=("%(asctime)s %(module)s [%(levelname)s] "
+                    "%(filename)s:%(lineno)d: %(message)s"))
+        self.reset = Oneshot()
+        self.server = create_server(threaded=True)
+        self.server.add_component("reset", self.reset)
+        self.server.add_component("plain", lambda: ok)
+        self.hub = WatchHub(self.server, timeout=5)
+        start_server(self.server)
+
+    def tearDown(self):
+        self.hub.close()
+        stop_server(self.server)
+
+    def get(self, path, headers={}):
+        con = HTTPConnection(LOOPBACK, self.server.port)
+        con.request("GET", path, headers=headers)
+        response = con.getresponse()
+        body = response.read()
+        con.close()
+        return response, body
+
+    def test_requires_threaded(self):
+        server = create_server()
+        try:
+            with self.assertRaises(ValueError):
+                WatchHub(server)
+        finally:
+            server.server_close()
+        return
+
+    def test_long_poll(self):
+        response, body = self.get("/_watch")
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.getheader("Content-Type"),
+                         "application/json")
+        etag = response.getheader("ETag")
+        document = loads(body.decode("utf-8"))
+        self.assertEqual(document["components"],
+                         {"reset": "FAIL", "plain": None})
+
+        # Nothing changes: 304 after the requested timeout.
+        start = time()
+        response, body = self.get("/_watch?timeout=0.2",
+                                  headers={"If-None-Match": etag})
+        self.assertEqual(response.status, NOT_MODIFIED)
+        self.assertEqual(response.getheader("ETag"), etag)
+        self.assertGreaterEqual(time() - start, 0.2)
+
+        # A change releases a waiting request immediately.
+        results = []
+        def wait():
+            results.append(self.get("/_watch",
+                                    headers={"If-None-Match": etag}))
+        thread = Thread(target=wait)
+        thread.start()
+        sleep(0.2)
+        self.assertEqual(results, [])
+        start = time()
+        self.reset.fire()
+        thread.join()
+        self.assertLess(time() - start, 1)
+
+        response, body = results[0]
+        self.assertEqual(response.status, OK)
+        self.assertNotEqual(response.getheader("ETag"), etag)
+        self.assertEqual(loads(body.decode("utf-8"))["components"]["reset"],
+                         "OK")
+
+        # Filtering by component.
+        response, body = self.get("/_watch?component=plain")
+        self.assertEqual(loads(body.decode("utf-8"))["components"],
+                         {"plain": None})
+        response, body = self.get("/_watch?component=plain,missing")
+        self.assertEqual(response.status, NOT_FOUND)
+        return
+
+    def test_stream(self):
+        con = HTTPConnection(LOOPBACK, self.server.port)
+        con.request("GET", "/_watch?component=reset",
+                    headers={"Accept": "text/event-stream"})
+        response = con.getresponse()
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.getheader("Content-Type"),
+                         "text/event-stream")
+
+        event, event_id, data = read_event(response)
+        self.assertEqual(event, "state")
+        self.assertEqual(data["components"], {"reset": "FAIL"})
+
+        self.reset.fire()
+        event, event_id, data = read_event(response)
+        self.assertEqual(event, "change")
+        self.assertEqual((data["component"], data["old"], data["new"]),
+                         ("reset", "FAIL", "OK"))
+        self.assertEqual(data["reason"], "Armed")
+        armed_id = event_id
+
+        self.reset()
+        event, event_id, data = read_event(response)
+        self.assertEqual((data["old"], data["new"]), ("OK", "FAIL"))
+
+        # Closing the hub ends the stream.
+        self.hub.close()
+        self.assertEqual(response.read(), b"")
+        con.close()
+
+        # A reconnecting client gets the events it missed.
+        self.hub = WatchHub(self.server, timeout=5)
+        self.reset.fire()
+        self.reset()
+        con = HTTPConnection(LOOPBACK, self.server.port)
+        con.request("GET", "/_watch", headers={
+            "Accept": "text/event-stream",
+            "Last-Event-ID": str(self.hub.version - 2)})
+        response = con.getresponse()
+        self.assertEqual([read_event(response)[2]["new"] for i in range(2)],
+                         ["OK", "FAIL"])
+        self.hub.close()
+        con.close()
+        return
+
+def read_event(response):
+    """
+    Read a Server-Sent Event, returning (event, id, data).
+    """
+    fields = {}
+    while True:
+        line = response.fp.readline().decode("utf-8").rstrip("\n")
+        if not line:
+            if fields:
+                return (fields["event"], int(fields["id"]),
+                        loads(fields["data"]))
+            continue
+        if line.startswith(":"):
+            continue
+        key, value = line.split(": ", 1)
+        fields[key] = value
+
+if __name__ == "__main__":
+    main()